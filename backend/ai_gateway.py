@@ -0,0 +1,395 @@
+"""
+Pooled gateway to the Gemini and ElevenLabs REST APIs
+
+The AI endpoints used to call the vendor SDKs inside the request thread, with
+no timeout, a new connection per call and the whole audio clip buffered before
+the first byte went out. The gateway talks to the REST APIs directly:
+
+- keep-alive connections are pooled per upstream host and reused
+- at most `concurrency` calls per upstream run at once; a request that cannot
+  get a slot within `queue_timeout` seconds fails fast as busy
+- every socket operation has a timeout
+- speech is streamed to the client chunk by chunk as it arrives, and finished
+  clips are kept in a SpeechCache (memory LRU plus an optional directory), so
+  the fixed phrases the voice assistant repeats are served without a call
+
+Base URLs are configurable, so the gateway can be pointed at a local stub
+server (plain http:// works) instead of the real services.
+"""
+import hashlib
+import http.client
+import json
+import os
+import queue
+import threading
+from collections import OrderedDict
+from urllib.parse import quote, urlsplit
+
+GEMINI_BASE_URL = 'https://generativelanguage.googleapis.com'
+ELEVENLABS_BASE_URL = 'https://api.elevenlabs.io'
+DEFAULT_TIMEOUT = 30.0       # seconds per connect / read
+DEFAULT_QUEUE_TIMEOUT = 5.0  # seconds a call waits for a free upstream slot
+DEFAULT_CONCURRENCY = 4      # calls in flight per upstream
+CHUNK_SIZE = 16384
+ERROR_BODY_LIMIT = 500       # bytes of an upstream error body quoted in the message
+
+SPEECH_CACHE_BYTES = 16 * 2**20
+SPEECH_CACHE_DISK_BYTES = 256 * 2**20
+
+
+class GatewayError(Exception):
+    """An upstream call failed; status is the HTTP status to answer the client with"""
+
+    def __init__(self, message, status=502):
+        super().__init__(message)
+        self.status = status
+
+
+class GatewayBusy(GatewayError):
+    """No upstream slot became free within the queue timeout"""
+
+    def __init__(self, message):
+        super().__init__(message, status=503)
+
+
+class ConnectionPool:
+    def __init__(self, base_url, concurrency=DEFAULT_CONCURRENCY, timeout=DEFAULT_TIMEOUT,
+                 queue_timeout=DEFAULT_QUEUE_TIMEOUT):
+        """
+        Keep-alive HTTP(S) connections to one upstream
+
+        Args:
+            base_url: scheme, host, optional port and path prefix of the upstream
+            concurrency: requests allowed in flight at once
+            timeout: socket timeout for connecting and each read, seconds
+            queue_timeout: seconds to wait for a free slot before GatewayBusy
+        """
+        parts = urlsplit(base_url)
+        self.name = parts.hostname
+        self.secure = parts.scheme == 'https'
+        self.host = parts.hostname
+        self.port = parts.port
+        self.prefix = parts.path.rstrip('/')
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._idle = queue.LifoQueue()
+        self.opened = 0
+
+    def _connect(self):
+        self.opened += 1
+        if self.secure:
+            return http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout)
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def _send(self, connection, method, path, body, headers):
+        connection.request(method, self.prefix + path, body=body, headers=headers)
+        return connection.getresponse()
+
+    def request(self, method, path, body=None, headers=None):
+        """
+        Send a request on a pooled connection
+
+        Returns:
+            (connection, response); pass both to release() once the response is
+            read (or abandoned)
+
+        Raises:
+            GatewayBusy when no slot frees up in time, GatewayError (504) on a
+            timeout and GatewayError (502) when the upstream cannot be reached
+        """
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            raise GatewayBusy(f'Too many requests in flight to {self.name}')
+        connection = None
+        try:
+            try:
+                connection, reused = self._idle.get_nowait(), True
+            except queue.Empty:
+                connection, reused = self._connect(), False
+            try:
+                return connection, self._send(connection, method, path, body, headers)
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                connection.close()
+                if not reused:
+                    raise
+                # The upstream closed an idle keep-alive connection; retry once on a fresh one
+                connection = None
+                connection = self._connect()
+                return connection, self._send(connection, method, path, body, headers)
+        except BaseException as e:
+            # Whatever went wrong (including bad headers or URLs), the slot is handed back
+            if connection is not None:
+                connection.close()
+            self._slots.release()
+            if isinstance(e, TimeoutError):
+                raise GatewayError(f'{self.name} timed out', status=504)
+            if isinstance(e, (OSError, http.client.HTTPException)):
+                raise GatewayError(f'{self.name} unreachable: {e}')
+            raise
+
+    def release(self, connection, response):
+        """Return the connection for reuse if its response was read to the end"""
+        if response.isclosed() and not response.will_close:
+            self._idle.put(connection)
+        else:
+            connection.close()
+        self._slots.release()
+
+    def read(self, method, path, body=None, headers=None):
+        """(status, body bytes) of a request whose response is read in full"""
+        connection, response = self.request(method, path, body, headers)
+        try:
+            data = response.read()
+        except TimeoutError:
+            raise GatewayError(f'{self.name} timed out', status=504)
+        except (OSError, http.client.HTTPException) as e:
+            raise GatewayError(f'{self.name} connection failed: {e}')
+        finally:
+            self.release(connection, response)
+        return response.status, data
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+def _upstream_error(name, status, body):
+    text = body[:ERROR_BODY_LIMIT].decode('utf-8', errors='replace')
+    return GatewayError(f'{name} returned HTTP {status}: {text}')
+
+
+class GeminiClient:
+    def __init__(self, api_key, model='gemini-pro', base_url=GEMINI_BASE_URL, **pool_options):
+        """
+        Args:
+            api_key: Gemini API key
+            model: model name used in the generateContent path
+            base_url: API root (override to point at a stub server)
+            **pool_options: ConnectionPool settings (concurrency, timeout, queue_timeout)
+        """
+        self.api_key = api_key
+        self.model = model
+        self.pool = ConnectionPool(base_url, **pool_options)
+
+    def generate(self, prompt):
+        """
+        Text of the model's reply to prompt
+
+        Raises:
+            GatewayError when the call fails or returns no text
+        """
+        body = json.dumps({'contents': [{'role': 'user', 'parts': [{'text': prompt}]}]}).encode('utf-8')
+        status, data = self.pool.read(
+            'POST', f'/v1beta/models/{quote(self.model)}:generateContent?key={quote(self.api_key)}',
+            body=body, headers={'Content-Type': 'application/json'}
+        )
+        if status != 200:
+            raise _upstream_error('Gemini', status, data)
+        try:
+            candidate = json.loads(data)['candidates'][0]
+            return ''.join(part.get('text', '') for part in candidate['content']['parts'])
+        except (ValueError, KeyError, IndexError, TypeError):
+            raise GatewayError('Gemini returned no text')
+
+
+class SpeechCache:
+    def __init__(self, max_bytes=SPEECH_CACHE_BYTES, directory=None, max_disk_bytes=SPEECH_CACHE_DISK_BYTES):
+        """
+        Synthesized clips keyed on voice, model and text
+
+        Args:
+            max_bytes: memory budget; least recently used clips are dropped past it (0 disables)
+            directory: optional directory that keeps clips across restarts
+            max_disk_bytes: disk budget; oldest files are removed past it
+        """
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self._clips = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(*parts):
+        return hashlib.sha256('\0'.join(parts).encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f'{key}.mp3')
+
+    def get(self, key):
+        with self._lock:
+            clip = self._clips.get(key)
+            if clip is not None:
+                self._clips.move_to_end(key)
+                self.hits += 1
+                return clip
+        clip = None
+        if self.directory:
+            try:
+                with open(self._path(key), 'rb') as f:
+                    clip = f.read()
+                os.utime(self._path(key))
+            except OSError:
+                clip = None
+        with self._lock:
+            if clip is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        self._remember(key, clip)
+        return clip
+
+    def _remember(self, key, clip):
+        if len(clip) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._clips.pop(key, None)
+            self._bytes -= len(old) if old is not None else 0
+            self._clips[key] = clip
+            self._bytes += len(clip)
+            while self._bytes > self.max_bytes:
+                _, dropped = self._clips.popitem(last=False)
+                self._bytes -= len(dropped)
+
+    def put(self, key, clip):
+        self._remember(key, clip)
+        if not self.directory:
+            return
+        path = self._path(key)
+        temporary = f'{path}.{threading.get_ident()}.tmp'
+        try:
+            with open(temporary, 'wb') as f:
+                f.write(clip)
+            os.replace(temporary, path)
+            self._trim_disk()
+        except OSError as e:
+            print(f"Warning: speech cache write failed: {e}")
+
+    def _trim_disk(self):
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.mp3'):
+                stat = os.stat(os.path.join(self.directory, name))
+                files.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in files)
+        for _, size, name in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+            os.remove(os.path.join(self.directory, name))
+            total -= size
+
+    def stats(self):
+        with self._lock:
+            return {'clips': len(self._clips), 'bytes': self._bytes, 'hits': self.hits, 'misses': self.misses}
+
+
+class SpeechStream:
+    """
+    Iterator over the MP3 chunks of one synthesis
+
+    It holds an upstream slot and connection until the audio has been read
+    to the end or close() is called. Closing is idempotent. Hand close() to
+    whatever always runs when the client goes away (Response.call_on_close):
+    a client that disconnects before the first chunk never starts the
+    iteration, so cleanup inside it would never run.
+    """
+
+    def __init__(self, pool, connection, response, on_complete=None):
+        """
+        Args:
+            pool: ConnectionPool the connection belongs to
+            connection, response: as returned by pool.request()
+            on_complete: optional fn(clip bytes) called once the whole clip was read
+        """
+        self.pool = pool
+        self.connection = connection
+        self.response = response
+        self.on_complete = on_complete
+        self._parts = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._closed:
+            raise StopIteration
+        try:
+            chunk = self.response.read1(CHUNK_SIZE)
+        except (OSError, http.client.HTTPException) as e:
+            # Headers are already sent; end the stream early
+            print(f"ElevenLabs stream error: {e}")
+            self.close()
+            raise StopIteration
+        if not chunk:
+            self.close()
+            if self.on_complete:
+                self.on_complete(b''.join(self._parts))
+            raise StopIteration
+        self._parts.append(chunk)
+        return chunk
+
+    def close(self):
+        """Give the slot and connection back to the pool (once)"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self.pool.release(self.connection, self.response)
+
+
+class ElevenLabsClient:
+    def __init__(self, api_key, voice_id, model_id='eleven_monolingual_v1', base_url=ELEVENLABS_BASE_URL,
+                 cache=None, **pool_options):
+        """
+        Args:
+            api_key: ElevenLabs API key
+            voice_id: voice to synthesize with
+            model_id: speech model
+            base_url: API root (override to point at a stub server)
+            cache: optional SpeechCache for finished clips
+            **pool_options: ConnectionPool settings (concurrency, timeout, queue_timeout)
+        """
+        self.api_key = api_key
+        self.voice_id = voice_id
+        self.model_id = model_id
+        self.cache = cache
+        self.pool = ConnectionPool(base_url, **pool_options)
+
+    def speech(self, text):
+        """
+        Start synthesizing text
+
+        Returns:
+            (iterator of MP3 chunks, True when served from the cache). Upstream
+            errors are raised here, before any audio has been sent. A
+            synthesized stream is a SpeechStream: close it when the response
+            ends, whether or not it was read.
+        """
+        key = SpeechCache.key(self.voice_id, self.model_id, text)
+        clip = self.cache.get(key) if self.cache else None
+        if clip is not None:
+            return iter([clip]), True
+
+        body = json.dumps({'text': text, 'model_id': self.model_id}).encode('utf-8')
+        connection, response = self.pool.request(
+            'POST', f'/v1/text-to-speech/{quote(self.voice_id)}/stream', body=body,
+            headers={'Content-Type': 'application/json', 'Accept': 'audio/mpeg', 'xi-api-key': self.api_key}
+        )
+        if response.status != 200:
+            try:
+                data = response.read()
+            except (OSError, http.client.HTTPException):
+                data = b''
+            self.pool.release(connection, response)
+            raise _upstream_error('ElevenLabs', response.status, data)
+        on_complete = (lambda clip: self.cache.put(key, clip)) if self.cache else None
+        return SpeechStream(self.pool, connection, response, on_complete), False
@@ -1,61 +1,100 @@
-from flask import Flask, jsonify, request, send_file
+from flask import Blueprint, Flask, g, jsonify, request, Response, stream_with_context
 from flask_cors import CORS
-import random
+import atexit
 import time
 import traceback
-import csv
-import io
-from datetime import datetime, timedelta
-from quantum_optimizer import QuantumOptimizer
-
-try:
-    import google.generativeai as genai
-    GEMINI_IMPORT_SUCCESS = True
-except ImportError:
-    GEMINI_IMPORT_SUCCESS = False
-    print("Warning: google-generativeai not installed")
-
-try:
-    from elevenlabs.client import ElevenLabs
-    ELEVENLABS_IMPORT_SUCCESS = True
-except ImportError:
-    ELEVENLABS_IMPORT_SUCCESS = False
-    print("Warning: elevenlabs not installed")
+import json
+import os
+import threading
+import uuid
+from datetime import datetime
+from quantum_optimizer import engine_status, run_optimization, run_optimization_batch, warm_worker
+from job_queue import OptimizationJobQueue, PoolUnavailableError, QueueFullError
+from dataset_store import DatasetFormatError, read_csv_dataset
+from facility_layout import layout_for
+from state_backend import LocalStateBackend, SQLiteStateBackend, create_state_backend
+import ai_gateway
+from engines import READY, EngineUnavailable, LazyEngine
+from scenarios import structure_key, validate_scenario
+from twin_simulator import DEFAULT_SAMPLE_SECONDS, MAX_FAST_FORWARD, TwinSimulator
+from twin_journal import TwinJournal
+from facility_registry import (
+    DEFAULT_FACILITY, DEFAULT_MAX_ACTIVE, DEFAULT_MAX_FACILITIES, Facility, FacilityLimitError, FacilityNotFound,
+    FacilityRegistry, valid_facility_id
+)
+from timeseries import COUNTER, GAUGE, MetricsHistory
+from instrumentation import PROMETHEUS_CONTENT_TYPE, MetricsRegistry, instrument_app
 
 
 app = Flask(__name__)
 # Configure CORS to allow all origins for development
 CORS(app, resources={r"/api/*": {"origins": "*"}}, supports_credentials=True)
 
-optimizer = QuantumOptimizer()
+# Optimizations run on a bounded process pool so they never block request threads
+OPTIMIZER_WORKERS = int(os.environ.get('OPTIMIZER_WORKERS', 2))
+OPTIMIZER_MAX_PENDING = int(os.environ.get('OPTIMIZER_MAX_PENDING', 8))
+OPTIMIZE_SYNC_TIMEOUT = 60  # seconds /api/optimize waits before handing back the job id
+LONG_POLL_MAX_WAIT = 30
+BATCH_MAX_SCENARIOS = 200
+BATCH_CHUNKS_PER_WORKER = 4  # smaller chunks stream results back sooner
+BATCH_RETRY_SECONDS = 0.2    # wait for a free queue slot when other jobs fill it
+NEAREST_MAX_COUNT = 50  # beds listed by /api/hospital/next-available?count=
+
+# Live updates are pushed over /api/stream instead of being polled
+RANDOM_TICK_SECONDS = 2  # how often random mode changes while someone is watching
+
+# Every twin route is served for one facility (see facility_registry.py): the
+# blueprint is registered at /api for the default facility and at
+# /api/facilities/<facility_id> for any other
+twin = Blueprint('twin', __name__)
 
 # Configure APIs (User should set these env vars or replace values for demo)
 # For demo purposes, we will use mock responses if keys are missing
-GEMINI_API_KEY = "YOUR_GEMINI_KEY"
-ELEVENLABS_API_KEY = "YOUR_ELEVENLABS_KEY"
-
-try:
-    if GEMINI_IMPORT_SUCCESS and GEMINI_API_KEY and GEMINI_API_KEY != "YOUR_GEMINI_KEY":
-        genai.configure(api_key=GEMINI_API_KEY)
-        gemini_model = genai.GenerativeModel('gemini-pro')
-        GEMINI_AVAILABLE = True
-    else:
-        GEMINI_AVAILABLE = False
-except Exception as e:
-    GEMINI_AVAILABLE = False
-    print(f"Warning: Gemini API not available: {e}")
-
-try:
-    if ELEVENLABS_IMPORT_SUCCESS and ELEVENLABS_API_KEY and ELEVENLABS_API_KEY != "YOUR_ELEVENLABS_KEY":
-        eleven = ElevenLabs(api_key=ELEVENLABS_API_KEY)
-        ELEVENLABS_AVAILABLE = True
-    else:
-        ELEVENLABS_AVAILABLE = False
-except Exception as e:
-    ELEVENLABS_AVAILABLE = False
-    print(f"Warning: ElevenLabs API not configured: {e}")
+GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY', "YOUR_GEMINI_KEY")
+ELEVENLABS_API_KEY = os.environ.get('ELEVENLABS_API_KEY', "YOUR_ELEVENLABS_KEY")
+# Point these at a local stub server to exercise the AI endpoints offline
+GEMINI_BASE_URL = os.environ.get('GEMINI_BASE_URL', ai_gateway.GEMINI_BASE_URL)
+ELEVENLABS_BASE_URL = os.environ.get('ELEVENLABS_BASE_URL', ai_gateway.ELEVENLABS_BASE_URL)
+ELEVENLABS_VOICE_ID = os.environ.get('ELEVENLABS_VOICE_ID', '21m00Tcm4TlvDq8ikWAM')  # "Rachel"
+AI_POOL_OPTIONS = {
+    'concurrency': int(os.environ.get('AI_CONCURRENCY', ai_gateway.DEFAULT_CONCURRENCY)),
+    'timeout': float(os.environ.get('AI_TIMEOUT', ai_gateway.DEFAULT_TIMEOUT)),
+    'queue_timeout': float(os.environ.get('AI_QUEUE_TIMEOUT', ai_gateway.DEFAULT_QUEUE_TIMEOUT))
+}
+# Synthesized clips for repeated phrases; SPEECH_CACHE_DIR keeps them across restarts
+speech_cache = ai_gateway.SpeechCache(
+    max_bytes=int(os.environ.get('SPEECH_CACHE_MB', 16)) * 2**20,
+    directory=os.environ.get('SPEECH_CACHE_DIR') or None
+)
+
+AI_ENGINE_WAIT = 10  # seconds an AI request waits for its client to finish loading
+
+def _load_gemini():
+    if not GEMINI_API_KEY or GEMINI_API_KEY == "YOUR_GEMINI_KEY":
+        raise EngineUnavailable('GEMINI_API_KEY not set')
+    return ai_gateway.GeminiClient(GEMINI_API_KEY, model='gemini-pro', base_url=GEMINI_BASE_URL, **AI_POOL_OPTIONS)
+
+def _load_elevenlabs():
+    if not ELEVENLABS_API_KEY or ELEVENLABS_API_KEY == "YOUR_ELEVENLABS_KEY":
+        raise EngineUnavailable('ELEVENLABS_API_KEY not set')
+    return ai_gateway.ElevenLabsClient(
+        ELEVENLABS_API_KEY, ELEVENLABS_VOICE_ID, model_id='eleven_monolingual_v1',
+        base_url=ELEVENLABS_BASE_URL, cache=speech_cache, **AI_POOL_OPTIONS
+    )
+
+# AI calls go through the pooled REST gateway (see ai_gateway.py); the clients
+# are set up in the background after startup and mock responses are used
+# while they are unavailable
+gemini = LazyEngine('gemini', _load_gemini)
+elevenlabs = LazyEngine('elevenlabs', _load_elevenlabs)
 
-@app.route('/api/ai/chat', methods=['POST'])
+def _gateway_error(e):
+    response = jsonify({'status': 'error', 'message': str(e)})
+    if isinstance(e, ai_gateway.GatewayBusy):
+        response.headers['Retry-After'] = '1'
+    return response, e.status
+
+@twin.route('/ai/chat', methods=['POST'])
 def chat_with_gemini():
     """Chat using Google Gemini"""
     data = request.get_json()
@@ -65,14 +104,14 @@ def chat_with_gemini():
     if not prompt:
         return jsonify({'status': 'error', 'message': 'No prompt provided'}), 400
 
-    if GEMINI_AVAILABLE:
+    client = gemini.get(timeout=AI_ENGINE_WAIT)
+    if client is not None:
         try:
             # Add context to prompt
             system_instruction = f"You are an AI assistant for a Quantum Digital Twin platform managing {context}. Keep responses concise and professional."
-            response = gemini_model.generate_content(f"{system_instruction}\nUser: {prompt}")
-            return jsonify({'status': 'success', 'response': response.text})
-        except Exception as e:
-            return jsonify({'status': 'error', 'message': str(e)}), 500
+            return jsonify({'status': 'success', 'response': client.generate(f"{system_instruction}\nUser: {prompt}")})
+        except ai_gateway.GatewayError as e:
+            return _gateway_error(e)
     else:
         # Mock response for demo
         responses = [
@@ -80,209 +119,636 @@ def chat_with_gemini():
             f"I've analyzed the {context} metrics. Operations are optimal.",
             f"Quantum optimization suggests reallocating resources in the {context}."
         ]
-        return jsonify({'status': 'success', 'response': random.choice(responses)})
+        return jsonify({'status': 'success', 'response': _facility().simulation.choice(responses)})
 
-@app.route('/api/ai/speak', methods=['POST'])
+@twin.route('/ai/speak', methods=['POST'])
 def text_to_speech():
-    """Generate speech using ElevenLabs"""
+    """Generate speech using ElevenLabs, streamed to the client as it is synthesized"""
     data = request.get_json()
     text = data.get('text', '')
     
     if not text:
         return jsonify({'status': 'error', 'message': 'No text provided'}), 400
 
-    if ELEVENLABS_AVAILABLE:
+    client = elevenlabs.get(timeout=AI_ENGINE_WAIT)
+    if client is not None:
         try:
-            audio = eleven.generate(
-                text=text,
-                voice="Rachel",
-                model="eleven_monolingual_v1"
-            )
-            # Send audio bytes
-            return send_file(
-                io.BytesIO(b"".join(audio)),
-                mimetype="audio/mpeg"
-            )
-        except Exception as e:
+            chunks, cached = client.speech(text)
+        except ai_gateway.GatewayError as e:
             print(f"ElevenLabs error: {e}")
-            return jsonify({'status': 'error', 'message': str(e)}), 500
+            return _gateway_error(e)
+        response = Response(stream_with_context(chunks), mimetype="audio/mpeg")
+        if not cached:
+            # Runs even if the client leaves before the first chunk was pulled
+            response.call_on_close(chunks.close)
+        response.headers['X-Speech-Cache'] = 'hit' if cached else 'miss'
+        return response
     else:
         return jsonify({'status': 'mock', 'message': 'ElevenLabs not configured'}), 200
 
-# Mock data storage
-metrics_data = {
-    'activeOptimizations': 0,
-    'responseTime': 0,
-    'accuracy': 0,
-    'errors': 0,
-    'costSaved': 0,
-    'energySaved': 0
+# Twin state lives in a pluggable backend (see state_backend.py) so request
+# threads, the random-mode ticker and job callbacks - and, with the SQLite
+# backend, several worker processes - all see the same twin. Each new facility
+# gets its own backend initialized with these values.
+TWIN_DEFAULTS = {
+    'metrics': {
+        'activeOptimizations': 0,
+        'responseTime': 0,
+        'accuracy': 0,
+        'errors': 0,
+        'costSaved': 0,
+        'energySaved': 0
+    },
+    'hospital': {
+        'totalBeds': 100,
+        'occupied': 65,
+        'available': 35,
+        'occupiedColor': '#ef4444',
+        'labelPrefix': 'Room'
+    },
+    'warehouse': {
+        'totalShelves': 50,
+        'occupied': 30,
+        'available': 20,
+        'occupiedColor': '#f59e0b',
+        'labelPrefix': 'S'
+    },
+    # demo: manual data instead of random; custom: uploaded datasets drive the twin
+    'mode': {'demo': False, 'custom': False},
+    'dataset': {
+        'type': None,
+        'count': 0,
+        'filename': None,
+        'timestamp': None
+    },
+    # Bumped whenever the twin's data is replaced or edited; part of every result cache key
+    'resultsGeneration': 0
 }
 
-hospital_stats = {
-    'totalBeds': 100,
-    'occupied': 65,
-    'available': 35,
-    'occupiedColor': '#ef4444',
-    'labelPrefix': 'Room'
-}
+# Uploaded datasets are journaled to TWIN_DATA_DIR as memory-mappable snapshots
+# plus a delta log (see twin_journal.py) and restored from it on startup. The
+# SQLite backend keeps them in its database already, so the journal is only
+# used with the in-memory backend. Set TWIN_DATA_DIR to an empty string to
+# turn it off.
+DEFAULT_TWIN_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'twin_data')
+TWIN_DATA_DIR = os.environ.get('TWIN_DATA_DIR', DEFAULT_TWIN_DATA_DIR)
+# The default facility keeps its data where a single-site install always has
+# (TWIN_DATA_DIR, STATE_DB); every other facility gets FACILITY_DIR/<id>
+FACILITY_DIR = os.environ.get('FACILITY_DIR', os.path.join(TWIN_DATA_DIR or DEFAULT_TWIN_DATA_DIR, 'facilities'))
+MAX_ACTIVE_FACILITIES = int(os.environ.get('MAX_ACTIVE_FACILITIES', DEFAULT_MAX_ACTIVE))
+MAX_FACILITIES = int(os.environ.get('MAX_FACILITIES', DEFAULT_MAX_FACILITIES))
 
-warehouse_stats = {
-    'totalShelves': 50,
-    'occupied': 30,
-    'available': 20,
-    'occupiedColor': '#f59e0b',
-    'labelPrefix': 'S'
-}
+def _create_facility(facility_id):
+    """Facility twin for facility_id, restored from its data directory or database"""
+    if facility_id == DEFAULT_FACILITY:
+        directory = TWIN_DATA_DIR
+        state = create_state_backend()
+    else:
+        directory = os.path.join(FACILITY_DIR, facility_id) if TWIN_DATA_DIR else None
+        kind = os.environ.get('STATE_BACKEND', LocalStateBackend.name)
+        path = None
+        if kind == SQLiteStateBackend.name:
+            os.makedirs(os.path.join(FACILITY_DIR, facility_id), exist_ok=True)
+            path = os.path.join(FACILITY_DIR, facility_id, 'twin_state.db')
+        state = create_state_backend(kind, path)
+    journal = TwinJournal(directory) if directory and state.name == LocalStateBackend.name else None
+    return Facility(facility_id, state, TWIN_DEFAULTS, journal)
 
-# Demo mode flag - when True, uses manual data instead of random
-demo_mode = False
-custom_mode = False
-uploaded_data = {
-    'hospital': [],
-    'warehouse': []
-}
-current_dataset_info = {
-    'type': None,
-    'count': 0,
-    'filename': None,
-    'timestamp': None
-}
+facilities = FacilityRegistry(_create_facility, max_active=MAX_ACTIVE_FACILITIES, directory=FACILITY_DIR,
+                              max_facilities=MAX_FACILITIES)
+# Restore the default facility's datasets at startup, as a single-site install did
+facilities.release(facilities.acquire(DEFAULT_FACILITY))
+# Journaled facilities save their counters and mode on the way out
+atexit.register(facilities.close)
 
-chart_data = {
-    'responseTimes': [],
-    'accuracy': [],
-    'errors': [],
-    'costSaved': [],
-    'energySaved': []
-}
+@twin.url_value_preprocessor
+def _pop_facility_id(endpoint, values):
+    g.facility_id = values.pop('facility_id', DEFAULT_FACILITY) if values else DEFAULT_FACILITY
 
-def generate_chart_data():
-    """Generate mock time series data"""
-    now = datetime.now()
-    data_points = []
-    
-    for i in range(10):
-        timestamp = now - timedelta(seconds=(9-i) * 2)
-        data_points.append({
-            'time': f'{(9-i) * 2}s',
-            'value': random.randint(50, 150)
-        })
-    
-    return data_points
+@twin.before_request
+def _check_facility_id():
+    if not valid_facility_id(g.facility_id):
+        return jsonify({'status': 'error', 'message': f'Invalid facility id: {g.facility_id}'}), 400
+
+def _facility(create=False):
+    """
+    The facility the current request addresses, held in memory until the request ends
+
+    Only requests that write data pass create=True; reading an unknown
+    facility raises FacilityNotFound (404) rather than creating it.
+    """
+    if 'facility' not in g:
+        g.facility = facilities.acquire(g.facility_id, create=create)
+    return g.facility
+
+@twin.errorhandler(FacilityNotFound)
+def _unknown_facility(e):
+    return jsonify({'status': 'error', 'message': str(e)}), 404
+
+@twin.errorhandler(FacilityLimitError)
+def _facility_limit(e):
+    return jsonify({'status': 'error', 'message': str(e)}), 409
 
-@app.route('/api/metrics', methods=['GET'])
+@app.teardown_request
+def _release_facility(exc):
+    facility = g.pop('facility', None)
+    if facility is not None:
+        facilities.release(facility)
+
+# Monitoring history recorded from real optimizations, kept per process in
+# fixed-size rings with 1 s / 1 min / 1 h rollups (see timeseries.py)
+history = MetricsHistory()
+history.register('responseTimes', GAUGE)   # optimization latency, ms (submit to finish)
+history.register('accuracy', GAUGE)        # accuracy reported by the optimizer, %
+history.register('errors', COUNTER)        # failed optimizations
+history.register('throughput', COUNTER)    # finished optimizations
+MONITORING_SERIES = ('responseTimes', 'accuracy', 'errors', 'throughput')
+MONITORING_DEFAULT_WINDOW = 60
+MONITORING_MAX_WINDOW = 30 * 86400
+CARD_WINDOW = 300  # seconds of history behind the measured dashboard cards
+
+# Prometheus-style counters and latency histograms, served as text on /metrics
+registry = MetricsRegistry()
+instrument_app(app, registry)
+registry.histogram('optimization_duration_seconds', 'Optimization latency from submit to finish')
+registry.histogram('optimizer_phase_seconds', 'Time spent in each optimizer phase')
+registry.counter('optimizations_total', 'Finished optimizations by problem, method and status')
+registry.gauge('optimization_queue_pending', 'Optimizations queued or running')
+registry.counter('optimization_cache_total', 'Optimization requests served from the result cache (hit), a running job (joined) or a new solve (miss)')
+registry.gauge('optimization_cache_entries', 'Results held in the optimization result cache')
+registry.gauge('event_stream_subscribers', 'Connected live stream clients')
+
+registry.gauge('facilities_active', 'Facility twins held in memory')
+
+def _randomize_metrics(metrics, simulation):
+    # Latency, accuracy, errors and load are measured (see _current_metrics)
+    metrics['costSaved'] = simulation.randint(80, 150)
+    metrics['energySaved'] = simulation.randint(80, 150)
+
+def _current_metrics(facility, metrics=None):
+    """Dashboard card values; outside demo mode the optimizer cards are measured"""
+    metrics = metrics if metrics is not None else facility.state.get('metrics')
+    if facility.mode()['demo']:
+        return metrics
+    latencies = history.series('responseTimes').recent(CARD_WINDOW)
+    accuracy = history.series('accuracy').recent(CARD_WINDOW)
+    metrics['activeOptimizations'] = job_queue.pending_count()
+    metrics['responseTime'] = round(float(latencies.mean())) if len(latencies) else 0
+    if len(accuracy):
+        metrics['accuracy'] = round(float(accuracy.mean()), 2)
+    metrics['errors'] = int(history.series('errors').recent(CARD_WINDOW).sum())
+    return metrics
+
+@twin.route('/metrics', methods=['GET'])
 def get_metrics():
     """Get real-time metrics"""
+    facility = _facility()
     # Only update randomly if not in demo mode
-    if not demo_mode:
-        metrics_data['activeOptimizations'] = random.randint(5, 15)
-        metrics_data['responseTime'] = random.randint(80, 150)
-        metrics_data['accuracy'] = random.randint(92, 98)
-        metrics_data['errors'] = random.randint(0, 5)
-        metrics_data['costSaved'] = random.randint(80, 150)
-        metrics_data['energySaved'] = random.randint(80, 150)
+    if not facility.mode()['demo']:
+        metrics = facility.state.update('metrics', lambda metrics: _randomize_metrics(metrics, facility.simulation))
+        return jsonify(_current_metrics(facility, metrics))
     
-    return jsonify(metrics_data)
+    return jsonify(facility.state.get('metrics'))
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus text exposition of request latencies and optimizer timings"""
+    return Response(registry.render(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+def _collect_live_gauges(registry):
+    registry.set('optimization_queue_pending', job_queue.pending_count())
+    active = facilities.active()
+    registry.set('event_stream_subscribers', sum(facility.events.subscriber_count() for facility in active))
+    registry.set('optimization_cache_entries', sum(facility.results.stats()['entries'] for facility in active))
+    registry.set('facilities_active', len(active))
 
-@app.route('/api/monitoring', methods=['GET'])
+registry.add_collector(_collect_live_gauges)
+
+@twin.route('/monitoring', methods=['GET'])
 def get_monitoring():
-    """Get monitoring chart data"""
-    chart_data['responseTimes'] = generate_chart_data()
-    chart_data['accuracy'] = [
-        {'time': f'{i * 2}s', 'value': random.randint(90, 99)}
-        for i in range(10)
-    ]
-    chart_data['errors'] = [
-        {'time': f'{i * 2}s', 'value': random.randint(0, 8)}
-        for i in range(10)
-    ]
-    
-    return jsonify(chart_data)
+    """Get monitoring chart data for the last ?window=<seconds> (default 60)"""
+    try:
+        window = float(request.args.get('window', MONITORING_DEFAULT_WINDOW))
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'window must be a number of seconds'}), 400
+    window = min(max(window, 1), MONITORING_MAX_WINDOW)
+    return jsonify(history.chart(MONITORING_SERIES, window))
 
-@app.route('/api/hospital/stats', methods=['GET'])
+def _randomize_hospital(stats, simulation):
+    simulation.advance_hospital_counts(stats)
+
+def _randomize_warehouse(stats, simulation):
+    simulation.advance_warehouse_counts(stats)
+
+def _wants_rows():
+    """Row payloads are large, so stats only include them on ?include=rows"""
+    return 'rows' in request.args.get('include', '').split(',')
+
+@twin.route('/hospital/stats', methods=['GET'])
 def get_hospital_stats():
     """Get hospital statistics"""
-    if not demo_mode and not custom_mode:
-        hospital_stats['occupied'] = random.randint(60, 75)
-        hospital_stats['available'] = hospital_stats['totalBeds'] - hospital_stats['occupied']
-        if 'bedData' in hospital_stats:
-            del hospital_stats['bedData']
-    elif custom_mode and uploaded_data['hospital']:
-        hospital_stats['bedData'] = uploaded_data['hospital']
-        hospital_stats['totalBeds'] = len(uploaded_data['hospital'])
-        occupied_count = sum(1 for bed in uploaded_data['hospital'] if bed.get('status', '').lower() in ['occupied', 'cleaning', 'critical'])
-        hospital_stats['occupied'] = occupied_count
-        hospital_stats['available'] = hospital_stats['totalBeds'] - hospital_stats['occupied']
-    else:
-        hospital_stats['available'] = hospital_stats['totalBeds'] - hospital_stats['occupied']
+    facility = _facility()
+    mode = facility.mode()
+    store = facility.custom_dataset('hospital', mode)
+    if not mode['demo'] and not mode['custom']:
+        facility.state.update('hospital', lambda stats: _randomize_hospital(stats, facility.simulation))
     
-    if 'occupiedColor' not in hospital_stats:
-        hospital_stats['occupiedColor'] = '#ef4444'
-    if 'labelPrefix' not in hospital_stats:
-        hospital_stats['labelPrefix'] = 'Room'
-    
-    return jsonify(hospital_stats)
+    response = facility.hospital_summary(store)
+    if not store:
+        response['available'] = response['totalBeds'] - response['occupied']
+    response.setdefault('occupiedColor', '#ef4444')
+    response.setdefault('labelPrefix', 'Room')
+    if store and _wants_rows():
+        response['bedData'] = store.rows
+    return jsonify(response)
 
-@app.route('/api/warehouse/stats', methods=['GET'])
+@twin.route('/warehouse/stats', methods=['GET'])
 def get_warehouse_stats():
     """Get warehouse statistics"""
-    if not demo_mode and not custom_mode:
-        warehouse_stats['occupied'] = random.randint(25, 35)
-        warehouse_stats['available'] = warehouse_stats['totalShelves'] - warehouse_stats['occupied']
-        if 'shelfData' in warehouse_stats:
-            del warehouse_stats['shelfData']
-    elif custom_mode and uploaded_data['warehouse']:
-        warehouse_stats['shelfData'] = uploaded_data['warehouse']
-        warehouse_stats['totalShelves'] = len(uploaded_data['warehouse'])
-        occupied_count = sum(1 for shelf in uploaded_data['warehouse'] if int(shelf.get('item_count', 0)) > 0)
-        warehouse_stats['occupied'] = occupied_count
-        warehouse_stats['available'] = warehouse_stats['totalShelves'] - warehouse_stats['occupied']
-    else:
-        warehouse_stats['available'] = warehouse_stats['totalShelves'] - warehouse_stats['occupied']
+    facility = _facility()
+    mode = facility.mode()
+    store = facility.custom_dataset('warehouse', mode)
+    if not mode['demo'] and not mode['custom']:
+        facility.state.update('warehouse', lambda stats: _randomize_warehouse(stats, facility.simulation))
     
-    if 'occupiedColor' not in warehouse_stats:
-        warehouse_stats['occupiedColor'] = '#f59e0b'
-    if 'labelPrefix' not in warehouse_stats:
-        warehouse_stats['labelPrefix'] = 'S'
-    
-    return jsonify(warehouse_stats)
+    response = facility.warehouse_summary(store)
+    if not store:
+        response['available'] = response['totalShelves'] - response['occupied']
+    response.setdefault('occupiedColor', '#f59e0b')
+    response.setdefault('labelPrefix', 'S')
+    if store and _wants_rows():
+        response['shelfData'] = store.rows
+    return jsonify(response)
 
-@app.route('/api/optimize', methods=['POST'])
-def optimize():
-    """Run quantum optimization"""
-    data = request.get_json()
+def _record_result(problem_type, result, duration_ms, status):
+    """Monitoring history and Prometheus metrics for one finished optimization"""
+    if duration_ms is not None:
+        history.record('responseTimes', duration_ms)
+        registry.observe('optimization_duration_seconds', duration_ms / 1000, problem=problem_type)
+    if status == 'done':
+        history.record('throughput', 1)
+        if result.get('accuracy') is not None:
+            history.record('accuracy', result['accuracy'])
+        for name, ms in result.get('timings', {}).items():
+            if name != 'total_ms':
+                registry.observe('optimizer_phase_seconds', ms / 1000, problem=problem_type, phase=name[:-3])
+    else:
+        history.record('errors', 1)
+    registry.inc('optimizations_total', problem=problem_type, method=result.get('method', 'none'), status=status)
+
+def _record_optimization(job):
+    """Update dashboard metrics when a queued optimization finishes"""
+    with _inflight_lock:
+        facility, key = _inflight_keys.pop(job['id'], (None, None))
+        if key is not None:
+            _inflight.pop(key, None)
+    if key is not None and job['status'] == 'done':
+        facility.results.put(key, job['result'])
+
+    if job['type'] == 'batch' and job['status'] == 'done':
+        # One entry per scenario, timed by the optimizer itself
+        for entry in job['result']:
+            result = entry['result']
+            status = 'failed' if result.get('status') == 'error' else 'done'
+            _record_result(entry['type'], result, result.get('response_time'), status)
+    else:
+        _record_result(job['type'], job['result'] or {}, job['durationMs'], job['status'])
+
+    if facility is not None:
+        facility.events.publish('metrics', _current_metrics(facility))
+        facility.events.publish('optimization', {'jobId': job['id'], 'type': job['type'], 'status': job['status']})
+
+# Finished results are served again while the data they came from is unchanged
+# (see result_cache.py, one cache per facility); identical requests while one
+# is running join that job. The worker pool is shared by all facilities.
+# Re-entrant: a job that finishes before submit returns runs its completion hook in the submitting thread
+_inflight_lock = threading.RLock()
+_inflight = {}       # cache key -> id of the job computing it
+_inflight_keys = {}  # job id -> (facility, cache key)
+
+def _result_key(facility, optimization_type, mode, dataset):
+    """Cache key that changes whenever the data the optimization reads may have changed"""
+    return (facility.id, optimization_type, mode, facility.state.get('resultsGeneration'),
+            dataset.version if dataset is not None else None)
+
+job_queue = OptimizationJobQueue(
+    max_workers=OPTIMIZER_WORKERS,
+    max_pending=OPTIMIZER_MAX_PENDING,
+    on_complete=_record_optimization,
+    # Each worker imports Qiskit and builds its optimizer before taking jobs
+    initializer=warm_worker
+)
+
+def _load_quantum():
+    """Start the worker pool and report Qiskit's readiness inside it"""
+    status = job_queue.warm_up(engine_status)
+    if status['state'] != READY:
+        raise EngineUnavailable(status['error'] or 'Qiskit not available in the optimizer workers')
+    return status
+
+quantum = LazyEngine('quantum', _load_quantum)
+ENGINES = {'quantum': quantum, 'gemini': gemini, 'elevenlabs': elevenlabs}
+_warm_lock = threading.Lock()
+_warm_started = False
+
+@app.before_request
+def _ensure_engines_warm():
+    """Load the heavy engines in the background once the server takes its first request"""
+    global _warm_started
+    if _warm_started:
+        return
+    with _warm_lock:
+        if not _warm_started:
+            for engine in ENGINES.values():
+                engine.warm()
+            _warm_started = True
+
+def _submit_optimization():
+    """Validate the request body and queue the job. Returns (job_id, error_response)."""
+    data = request.get_json(silent=True) or {}
     optimization_type = data.get('type', 'hospital')
-    
-    try:
-        # Simulate optimization processing time
-        time.sleep(1)
-        
-        # Run quantum optimization
-        result = optimizer.optimize(optimization_type)
-        
-        # Update metrics
-        metrics_data['activeOptimizations'] += 1
-        metrics_data['responseTime'] = result.get('response_time', random.randint(80, 150))
-        metrics_data['accuracy'] = result.get('accuracy', random.randint(92, 98))
-        
+    mode = data.get('mode', 'auto')
+    if optimization_type not in ('hospital', 'warehouse'):
+        return None, (jsonify({'status': 'error', 'message': f'Unknown problem type: {optimization_type}'}), 400)
+    if mode not in ('auto', 'decompose'):
+        return None, (jsonify({'status': 'error', 'message': f'Unknown optimization mode: {mode}'}), 400)
+    facility = _facility()
+    # The columnar store pickles as a handful of arrays for the worker process.
+    # The job queue pickles it later, so it gets a copy the simulator cannot change meanwhile
+    store = facility.custom_dataset(optimization_type, copy=True)
+    dataset = store if store else None
+    if mode == 'decompose' and not dataset:
+        return None, (jsonify({'status': 'error', 'message': 'Decomposition mode needs an uploaded dataset'}), 400)
+
+    key = _result_key(facility, optimization_type, mode, dataset)
+    # Held across submit so the job cannot finish before it is registered as in flight
+    with _inflight_lock:
+        if key in _inflight:
+            registry.inc('optimization_cache_total', result='joined')
+            return _inflight[key], None
+        cached = facility.results.get(key)
+        if cached is not None:
+            registry.inc('optimization_cache_total', result='hit')
+            return job_queue.add_finished(optimization_type, cached, owner=facility.id), None
+        registry.inc('optimization_cache_total', result='miss')
+        try:
+            job_id = job_queue.submit(
+                optimization_type, run_optimization, optimization_type, dataset, mode, facility.simulation.job_options(),
+                owner=facility.id
+            )
+        except QueueFullError as e:
+            response = jsonify({'status': 'busy', 'message': str(e)})
+            response.headers['Retry-After'] = '1'
+            return None, (response, 429)
+        except PoolUnavailableError as e:
+            response = jsonify({'status': 'error', 'message': str(e)})
+            response.headers['Retry-After'] = '5'
+            return None, (response, 503)
+        job = job_queue.get(job_id)
+        if job['status'] in ('done', 'failed'):
+            # Already finished, and its completion hook found no key to cache under
+            if job['status'] == 'done':
+                facility.results.put(key, job['result'])
+            return job_id, None
+        _inflight[key] = job_id
+        _inflight_keys[job_id] = (facility, key)
+    return job_id, None
+
+def _job_response(job):
+    """Serialize a job for the status endpoints, leaving out the result payload"""
+    return {key: value for key, value in job.items() if key != 'result'}
+
+@twin.route('/optimize', methods=['POST'])
+def optimize():
+    """Run quantum optimization and wait for the result"""
+    job_id, error = _submit_optimization()
+    if error:
+        return error
+
+    job = job_queue.wait(job_id, timeout=OPTIMIZE_SYNC_TIMEOUT)
+    if job['status'] == 'done':
         return jsonify({
             'status': 'success',
-            'message': f'Optimization completed for {optimization_type}',
-            'result': result
+            'message': f"Optimization completed for {job['type']}",
+            'jobId': job_id,
+            'cached': job['cached'],
+            'result': job['result']
         })
-    except Exception as e:
-        metrics_data['errors'] += 1
-        return jsonify({
-            'status': 'error',
-            'message': str(e)
-        }), 500
+    if job['status'] == 'failed':
+        return jsonify({'status': 'error', 'message': job['error'], 'jobId': job_id}), 500
+    # Still running: let the client continue by polling
+    return jsonify({'status': 'pending', 'jobId': job_id, 'job': _job_response(job)}), 202
+
+@twin.route('/optimize/jobs', methods=['POST'])
+def submit_optimization_job():
+    """Queue an optimization and return its job id immediately"""
+    job_id, error = _submit_optimization()
+    if error:
+        return error
+    return jsonify({'status': 'accepted', 'jobId': job_id, 'job': _job_response(job_queue.get(job_id))}), 202
+
+@twin.route('/optimize/jobs/<job_id>', methods=['GET'])
+def get_optimization_job(job_id):
+    """Get job status. Pass ?wait=<seconds> to long-poll until it finishes."""
+    try:
+        wait_seconds = min(float(request.args.get('wait', 0)), LONG_POLL_MAX_WAIT)
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'wait must be a number of seconds'}), 400
+
+    # Jobs are looked up within the facility that submitted them
+    if wait_seconds > 0:
+        job = job_queue.wait(job_id, timeout=wait_seconds, owner=g.facility_id)
+    else:
+        job = job_queue.get(job_id, owner=g.facility_id)
+    if job is None:
+        return jsonify({'status': 'error', 'message': 'Unknown job'}), 404
+    return jsonify({'status': 'success', 'job': _job_response(job)})
+
+@twin.route('/optimize/jobs/<job_id>/result', methods=['GET'])
+def get_optimization_result(job_id):
+    """Get the result of a finished job"""
+    job = job_queue.get(job_id, owner=g.facility_id)
+    if job is None:
+        return jsonify({'status': 'error', 'message': 'Unknown job'}), 404
+    if job['status'] == 'failed':
+        return jsonify({'status': 'error', 'message': job['error'], 'jobId': job_id}), 500
+    if job['status'] != 'done':
+        return jsonify({'status': 'pending', 'job': _job_response(job)}), 202
+    return jsonify({'status': 'success', 'jobId': job_id, 'result': job['result']})
+
+def _batch_problems(facility, data):
+    """
+    Validated problems for a batch request, one per scenario
+
+    Raises:
+        ValueError with a message for the client
+    """
+    scenarios = data.get('scenarios')
+    if not isinstance(scenarios, list) or not scenarios:
+        raise ValueError('scenarios must be a non-empty list')
+    if len(scenarios) > BATCH_MAX_SCENARIOS:
+        raise ValueError(f'At most {BATCH_MAX_SCENARIOS} scenarios per batch')
+    default_type = data.get('type', 'hospital')
+    default_mode = data.get('mode', 'auto')
+    datasets = {}
+    problems = []
+    for index, spec in enumerate(scenarios):
+        if not isinstance(spec, dict):
+            raise ValueError(f'Scenario {index}: must be an object')
+        spec = dict(spec)
+        name = str(spec.pop('name', f'scenario-{index + 1}'))
+        problem_type = spec.pop('type', default_type)
+        mode = spec.pop('mode', default_mode)
+        if problem_type not in ('hospital', 'warehouse'):
+            raise ValueError(f'Scenario {index} ({name}): unknown problem type: {problem_type}')
+        if mode not in ('auto', 'decompose'):
+            raise ValueError(f'Scenario {index} ({name}): unknown optimization mode: {mode}')
+        if problem_type not in datasets:
+            datasets[problem_type] = facility.custom_dataset(problem_type, copy=True) or None
+        dataset = datasets[problem_type]
+        if mode == 'decompose' and dataset is None:
+            raise ValueError(f'Scenario {index} ({name}): decomposition mode needs an uploaded dataset')
+        try:
+            scenario = validate_scenario(problem_type, spec, dataset is not None)
+        except ValueError as e:
+            raise ValueError(f'Scenario {index} ({name}): {e}')
+        problems.append({
+            'index': index, 'name': name, 'type': problem_type, 'mode': mode,
+            'dataset': dataset, 'scenario': scenario
+        })
+    return problems
+
+def _batch_chunks(problems, count):
+    """Split problems into up to count runs ordered by structure, so each chunk mostly shares one"""
+    ordered = sorted(problems, key=lambda p: structure_key(p['type'], p['dataset'] is not None, p['scenario']))
+    size = -(-len(ordered) // count)
+    return [ordered[k:k + size] for k in range(0, len(ordered), size)]
+
+def _ndjson(payload):
+    return json.dumps(payload) + '\n'
 
-@app.route('/api/demo/update', methods=['POST'])
+@twin.route('/optimize/batch', methods=['POST'])
+def optimize_batch():
+    """
+    Optimize many what-if scenarios in one request
+
+    Body: {"type", "mode", "scenarios": [{"name", "type", "mode", "beds", ...}]}
+    (see scenarios.py for the override fields). Scenarios are grouped by
+    structure into chunks that fan out over the worker pool, and results are
+    streamed back as newline-delimited JSON as each chunk completes.
+    """
+    facility = _facility()
+    data = request.get_json(silent=True) or {}
+    try:
+        problems = _batch_problems(facility, data)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    if job_queue.pending_count() >= job_queue.max_pending:
+        response = jsonify({'status': 'busy', 'message': 'Optimization queue is full'})
+        response.headers['Retry-After'] = '1'
+        return response, 429
+
+    batch_id = uuid.uuid4().hex
+    chunks = _batch_chunks(problems, min(len(problems), OPTIMIZER_WORKERS * BATCH_CHUNKS_PER_WORKER))
+    options = facility.simulation.job_options()
+
+    def failed_entries(chunk, message):
+        return [{'index': p['index'], 'type': p['type'], 'result': {'status': 'error', 'message': message}} for p in chunk]
+
+    def stream():
+        started = time.perf_counter()
+        pending = list(chunks)
+        running = {}
+        unavailable = []  # (chunk, message) for chunks the worker pool could not take
+        completed = failed = 0
+        yield _ndjson({'event': 'accepted', 'batchId': batch_id, 'scenarios': len(problems), 'chunks': len(chunks)})
+        while pending or running or unavailable:
+            # Chunks wait for free queue slots rather than failing the batch
+            while pending:
+                try:
+                    job_id = job_queue.submit('batch', run_optimization_batch, pending[0], options, owner=facility.id)
+                except QueueFullError:
+                    break
+                except PoolUnavailableError as e:
+                    unavailable.append((pending.pop(0), str(e)))
+                    continue
+                running[job_id] = pending.pop(0)
+            if unavailable:
+                chunk, message = unavailable.pop(0)
+                entries = failed_entries(chunk, message)
+            elif not running:
+                time.sleep(BATCH_RETRY_SECONDS)
+                continue
+            else:
+                job_id, job = next(job_queue.as_completed(list(running)))
+                chunk = running.pop(job_id)
+                if job is None:
+                    entries = failed_entries(chunk, 'Batch job was dropped from the job history')
+                else:
+                    entries = job['result'] if job['status'] == 'done' else failed_entries(chunk, job['error'])
+            problem = {p['index']: p for p in chunk}
+            for entry in entries:
+                completed += 1
+                failed += entry['result'].get('status') == 'error'
+                source = problem[entry['index']]
+                yield _ndjson({
+                    'event': 'result',
+                    'index': entry['index'],
+                    'name': source['name'],
+                    'type': entry['type'],
+                    'scenario': source['scenario'],
+                    'result': entry['result']
+                })
+            facility.events.publish('batch', {'batchId': batch_id, 'completed': completed, 'total': len(problems)})
+        yield _ndjson({
+            'event': 'done',
+            'batchId': batch_id,
+            'completed': completed,
+            'failed': failed,
+            'durationMs': round((time.perf_counter() - started) * 1000, 2)
+        })
+
+    response = Response(stream_with_context(stream()), mimetype='application/x-ndjson')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@twin.route('/optimize/queue', methods=['GET'])
+def get_optimization_queue():
+    """Get queue depth, worker pool size and result cache hit/miss counts"""
+    return jsonify({'status': 'success', 'queue': job_queue.stats(), 'cache': _facility().results.stats()})
+
+def _apply_demo_hospital(stats, hospital_data):
+    if 'totalBeds' in hospital_data:
+        stats['totalBeds'] = int(hospital_data['totalBeds'])
+    if 'occupied' in hospital_data:
+        stats['occupied'] = int(hospital_data['occupied'])
+    if 'occupiedColor' in hospital_data:
+        stats['occupiedColor'] = str(hospital_data['occupiedColor'])
+    if 'labelPrefix' in hospital_data:
+        stats['labelPrefix'] = str(hospital_data['labelPrefix'])
+    stats['available'] = stats['totalBeds'] - stats['occupied']
+
+def _apply_demo_warehouse(stats, warehouse_data):
+    if 'totalShelves' in warehouse_data:
+        stats['totalShelves'] = int(warehouse_data['totalShelves'])
+    if 'occupied' in warehouse_data:
+        stats['occupied'] = int(warehouse_data['occupied'])
+    if 'occupiedColor' in warehouse_data:
+        stats['occupiedColor'] = str(warehouse_data['occupiedColor'])
+    if 'labelPrefix' in warehouse_data:
+        stats['labelPrefix'] = str(warehouse_data['labelPrefix'])
+    stats['available'] = stats['totalShelves'] - stats['occupied']
+
+def _apply_demo_metrics(metrics, m_data):
+    if 'activeOptimizations' in m_data: metrics['activeOptimizations'] = int(m_data['activeOptimizations'])
+    if 'responseTime' in m_data: metrics['responseTime'] = int(m_data['responseTime'])
+    if 'accuracy' in m_data: metrics['accuracy'] = int(m_data['accuracy'])
+    if 'errors' in m_data: metrics['errors'] = int(m_data['errors'])
+
+@twin.route('/demo/update', methods=['POST'])
 def update_demo_data():
     """Update demo data manually"""
-    global demo_mode, hospital_stats, warehouse_stats, metrics_data
-    
     try:
         data = request.get_json()
         
@@ -290,139 +756,424 @@ def update_demo_data():
             return jsonify({'status': 'error', 'message': 'No data provided'}), 400
         
         # Validate and update hospital data
+        facility = _facility(create=True)
         if data.get('hospital'):
-            hospital_data = data['hospital']
             try:
-                if 'totalBeds' in hospital_data:
-                    hospital_stats['totalBeds'] = int(hospital_data['totalBeds'])
-                if 'occupied' in hospital_data:
-                    hospital_stats['occupied'] = int(hospital_data['occupied'])
-                if 'occupiedColor' in hospital_data:
-                    hospital_stats['occupiedColor'] = str(hospital_data['occupiedColor'])
-                if 'labelPrefix' in hospital_data:
-                    hospital_stats['labelPrefix'] = str(hospital_data['labelPrefix'])
-                hospital_stats['available'] = hospital_stats['totalBeds'] - hospital_stats['occupied']
+                facility.state.update('hospital', lambda stats: _apply_demo_hospital(stats, data['hospital']))
             except (ValueError, TypeError) as e:
                 return jsonify({'status': 'error', 'message': f'Hospital data error: {str(e)}'}), 400
         
         # Validate and update warehouse data
         if data.get('warehouse'):
-            warehouse_data = data['warehouse']
             try:
-                if 'totalShelves' in warehouse_data:
-                    warehouse_stats['totalShelves'] = int(warehouse_data['totalShelves'])
-                if 'occupied' in warehouse_data:
-                    warehouse_stats['occupied'] = int(warehouse_data['occupied'])
-                if 'occupiedColor' in warehouse_data:
-                    warehouse_stats['occupiedColor'] = str(warehouse_data['occupiedColor'])
-                if 'labelPrefix' in warehouse_data:
-                    warehouse_stats['labelPrefix'] = str(warehouse_data['labelPrefix'])
-                warehouse_stats['available'] = warehouse_stats['totalShelves'] - warehouse_stats['occupied']
+                facility.state.update('warehouse', lambda stats: _apply_demo_warehouse(stats, data['warehouse']))
             except (ValueError, TypeError) as e:
                 return jsonify({'status': 'error', 'message': f'Warehouse data error: {str(e)}'}), 400
         
         # Validate and update metrics data
         if data.get('metrics'):
-            m_data = data['metrics']
             try:
-                if 'activeOptimizations' in m_data: metrics_data['activeOptimizations'] = int(m_data['activeOptimizations'])
-                if 'responseTime' in m_data: metrics_data['responseTime'] = int(m_data['responseTime'])
-                if 'accuracy' in m_data: metrics_data['accuracy'] = int(m_data['accuracy'])
-                if 'errors' in m_data: metrics_data['errors'] = int(m_data['errors'])
+                facility.state.update('metrics', lambda metrics: _apply_demo_metrics(metrics, data['metrics']))
             except (ValueError, TypeError) as e:
                 return jsonify({'status': 'error', 'message': f'Metrics data error: {str(e)}'}), 400
         
-        demo_mode = True
-        return jsonify({'status': 'success', 'message': 'Demo data updated', 'data': {'hospital': hospital_stats, 'warehouse': warehouse_stats, 'metrics': metrics_data}})
+        facility.state.update('mode', lambda mode: mode.update(demo=True))
+        facility.invalidate_results()
+        hospital = facility.hospital_summary()
+        warehouse = facility.warehouse_summary()
+        metrics = facility.state.get('metrics')
+        facility.events.publish('hospital', hospital)
+        facility.events.publish('warehouse', warehouse)
+        facility.events.publish('metrics', metrics)
+        return jsonify({'status': 'success', 'message': 'Demo data updated', 'data': {'hospital': hospital, 'warehouse': warehouse, 'metrics': metrics}})
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
-@app.route('/api/demo/reset', methods=['POST'])
+@twin.route('/demo/reset', methods=['POST'])
 def reset_demo_data():
     """Reset to random data mode"""
-    global demo_mode, custom_mode, uploaded_data
-    demo_mode = False
-    custom_mode = False
-    uploaded_data = {'hospital': [], 'warehouse': []}
+    facility = _facility()
+    facility.state.set('mode', {'demo': False, 'custom': False})
+    facility.state.set_dataset('hospital', None)
+    facility.state.set_dataset('warehouse', None)
+    if facility.journal:
+        facility.journal.reset('hospital')
+        facility.journal.reset('warehouse')
+    facility.invalidate_results()
+    facility.events.publish('reset', {'mode': 'random'})
     return jsonify({'status': 'success', 'message': 'Reset to random data mode'})
 
-@app.route('/api/hospital/next-available', methods=['GET'])
+@twin.route('/hospital/next-available', methods=['GET'])
 def get_next_available_room():
-    """Get next available room number"""
-    available = hospital_stats['available']
-    occupied = hospital_stats['occupied']
-    if available > 0:
+    """
+    Get next available room number. With an uploaded dataset this is the
+    available bed nearest the entrance by walking distance (within ?ward=<number>
+    when given), or nearest the bed given as ?near=<bed_id>. ?category=<name>
+    limits either to one bed category and ?count=N lists the N nearest.
+    """
+    facility = _facility()
+    store = facility.custom_dataset('hospital')
+    stats = facility.hospital_summary(store)
+    available = stats['available']
+    occupied = stats['occupied']
+    if available <= 0:
+        return jsonify({'status': 'no_availability', 'message': 'No rooms available', 'nextAvailableRoom': None})
+    if not store:
         return jsonify({'status': 'success', 'nextAvailableRoom': occupied + 1, 'totalAvailable': available})
-    return jsonify({'status': 'no_availability', 'message': 'No rooms available', 'nextAvailableRoom': None})
+
+    try:
+        count = min(max(int(request.args.get('count', 1)), 1), NEAREST_MAX_COUNT)
+        ward = request.args.get('ward')
+        ward = int(ward) if ward is not None else None
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'count and ward must be integers'}), 400
+    beds = store.availability
+    category = request.args.get('category')
+    if category is not None:
+        category = beds.category_code(category)
+        if category is None:
+            return jsonify({'status': 'error', 'message': f"Unknown bed category {request.args['category']}"}), 404
+    near = request.args.get('near')
+    if near:
+        index = store.find(near)
+        if index is None:
+            return jsonify({'status': 'error', 'message': f'Unknown bed {near}'}), 404
+        rows, distances = beds.nearest(float(beds.layout.x[index]), float(beds.layout.y[index]), count, category)
+    else:
+        rows = beds.first(count, ward, category)
+        distances = beds.distance[rows]
+    nearest = [
+        {
+            'bed_id': str(store.ids[row]),
+            'ward': int(beds.ward[row]),
+            'category': beds.categories[beds.category[row]],
+            'distance': round(float(distance), 2)
+        }
+        for row, distance in zip(rows.tolist(), distances.tolist())
+    ]
+    if not nearest:
+        return jsonify({'status': 'no_availability', 'message': 'No matching rooms available',
+                        'nextAvailableRoom': None, 'totalAvailable': available})
+    return jsonify({
+        'status': 'success',
+        'nextAvailableRoom': nearest[0]['bed_id'],
+        'distance': nearest[0]['distance'],
+        'totalAvailable': available,
+        'nearest': nearest
+    })
+
+@twin.route('/hospital/availability', methods=['GET'])
+def get_bed_availability():
+    """Available beds per bed category, with the next bed to assign in each"""
+    store = _facility().custom_dataset('hospital')
+    if not store:
+        return jsonify({'status': 'error', 'message': 'No hospital dataset uploaded'}), 404
+    return jsonify({
+        'status': 'success',
+        'totalAvailable': store.summary()['available'],
+        'byCategory': store.availability.by_category()
+    })
+
+@twin.route('/layout/<facility_type>', methods=['GET'])
+def get_layout(facility_type):
+    """Floor coordinates of the uploaded shelves or beds, for the 3D views"""
+    if facility_type not in ('hospital', 'warehouse'):
+        return jsonify({'status': 'error', 'message': f'Unknown facility type {facility_type}'}), 400
+    store = _facility().custom_dataset(facility_type)
+    if not store:
+        return jsonify({'status': 'error', 'message': f'No {facility_type} dataset uploaded'}), 404
+    return jsonify({'status': 'success', 'layout': layout_for(store).to_dict()})
 
 @app.route('/api/health', methods=['GET'])
 def health():
-    """Health check endpoint"""
-    return jsonify({'status': 'healthy', 'timestamp': datetime.now().isoformat()})
+    """
+    Health check endpoint with per-engine readiness. The server is healthy as
+    soon as it answers; ?ready=1 returns 503 until every engine has finished
+    loading (or found it cannot), for readiness probes.
+    """
+    ready = all(engine.settled for engine in ENGINES.values())
+    body = {
+        'status': 'healthy',
+        'timestamp': datetime.now().isoformat(),
+        'ready': ready,
+        'engines': {name: engine.status() for name, engine in ENGINES.items()},
+        'speechCache': speech_cache.stats()
+    }
+    if request.args.get('ready') and not ready:
+        return jsonify(body), 503
+    return jsonify(body)
 
-@app.route('/api/upload/dataset', methods=['POST'])
+@twin.route('/upload/dataset', methods=['POST'])
 def upload_dataset():
     """Upload a CSV dataset"""
-    global custom_mode, uploaded_data, current_dataset_info, demo_mode
     if 'file' not in request.files:
         return jsonify({'status': 'error', 'message': 'No file part'}), 400
     file = request.files['file']
     if file.filename == '':
         return jsonify({'status': 'error', 'message': 'No selected file'}), 400
     if file:
+        facility = _facility(create=True)
+        total_bytes = request.content_length
+
+        def report_progress(dataset_type, rows, bytes_read):
+            facility.events.publish('upload', {
+                'filename': file.filename,
+                'type': dataset_type,
+                'rows': rows,
+                'bytesRead': bytes_read,
+                'totalBytes': total_bytes
+            })
+
         try:
-            stream = io.StringIO(file.stream.read().decode("UTF8"), newline=None)
-            csv_input = csv.DictReader(stream)
-            data_list = list(csv_input)
-            if not data_list:
-                return jsonify({'status': 'error', 'message': 'Empty CSV file'}), 400
-            headers = set(data_list[0].keys())
-            dataset_type = None
-            if 'bed_id' in headers:
-                dataset_type = 'hospital'
-            elif 'shelf_id' in headers:
-                dataset_type = 'warehouse'
-            else:
-                return jsonify({'status': 'error', 'message': 'Unknown dataset format'}), 400
-            uploaded_data[dataset_type] = data_list
-            custom_mode = True
-            demo_mode = False
-            current_dataset_info = {'type': dataset_type, 'count': len(data_list), 'filename': file.filename, 'timestamp': datetime.now().isoformat()}
-            return jsonify({'status': 'success', 'message': f'Loaded {len(data_list)} rows for {dataset_type}'})
+            dataset_type, store, preview = read_csv_dataset(file.stream, progress=report_progress)
+        except DatasetFormatError as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 400
         except Exception as e:
             return jsonify({'status': 'error', 'message': f'Failed to parse CSV: {str(e)}'}), 500
+        dataset_info = {'type': dataset_type, 'count': len(store), 'filename': file.filename, 'timestamp': datetime.now().isoformat()}
+        facility.replace_dataset(dataset_type, store, dataset_info)
+        facility.state.set('dataset', dataset_info)
+        facility.state.set('mode', {'demo': False, 'custom': True})
+        facility.invalidate_results()
+        # Row payloads are not pushed; clients refetch the stats endpoint once
+        facility.events.publish('dataset', dataset_info)
+        return jsonify({
+            'status': 'success',
+            'message': f'Loaded {len(store)} rows for {dataset_type}',
+            'summary': dict(dataset_info, preview=preview)
+        })
+
+@twin.route('/history/<dataset_type>', methods=['GET'])
+def get_dataset_history(dataset_type):
+    """
+    Time travel over the journaled dataset: the snapshots kept, or with
+    ?at=<ISO time or epoch seconds> or ?seq=<n> the dataset as it was then
+    (counters, plus rows on ?include=rows)
+    """
+    if dataset_type not in ('hospital', 'warehouse'):
+        return jsonify({'status': 'error', 'message': f'Unknown dataset type {dataset_type}'}), 400
+    journal = _facility().journal
+    if not journal:
+        return jsonify({'status': 'error', 'message': 'Dataset history is not recorded (see TWIN_DATA_DIR)'}), 404
+    at, seq = request.args.get('at'), request.args.get('seq')
+    if at is None and seq is None:
+        return jsonify(dict(journal.history(dataset_type), status='success'))
+    try:
+        if seq is not None:
+            found = journal.at(dataset_type, seq=int(seq))
+        else:
+            try:
+                when = float(at)
+            except ValueError:
+                when = datetime.fromisoformat(at).timestamp()
+            found = journal.at(dataset_type, when=when)
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'at must be an ISO time or epoch seconds and seq an integer'}), 400
+    if found is None:
+        return jsonify({'status': 'error', 'message': f'No {dataset_type} dataset recorded at that point'}), 404
+    store, point = found
+    response = dict(store.summary(), status='success', seq=point['seq'],
+                    time=datetime.fromtimestamp(point['time']).isoformat())
+    if _wants_rows():
+        response['bedData' if dataset_type == 'hospital' else 'shelfData'] = store.rows
+    return jsonify(response)
 
-@app.route('/api/dataset/current', methods=['GET'])
+@twin.route('/dataset/current', methods=['GET'])
 def get_current_dataset():
     """Get info about currently loaded dataset"""
-    return jsonify({'status': 'success', 'isCustom': custom_mode, 'info': current_dataset_info})
+    facility = _facility()
+    return jsonify({'status': 'success', 'isCustom': facility.mode()['custom'], 'info': facility.state.get('dataset')})
 
-@app.route('/api/demo/simulate', methods=['POST'])
+@twin.route('/demo/simulate', methods=['POST'])
 def simulate_data():
-    """Simulate random changes in uploaded data"""
-    global uploaded_data, custom_mode
-    if not custom_mode:
+    """Advance the uploaded data by one workload step (arrivals, discharges, cleaning, picks, restocks)"""
+    facility = _facility()
+    if not facility.mode()['custom']:
         return jsonify({'status': 'ignored', 'message': 'Not in custom mode'})
-    changes = []
     try:
-        if uploaded_data['hospital']:
-            for _ in range(random.randint(1, 2)):
-                idx = random.randint(0, len(uploaded_data['hospital']) - 1)
-                bed = uploaded_data['hospital'][idx]
-                bed['status'] = 'occupied' if bed.get('status', 'available').lower() == 'available' else 'available'
-                changes.append(f"Bed {bed.get('bed_id', idx)} status toggled")
-        if uploaded_data['warehouse']:
-            for _ in range(random.randint(1, 2)):
-                idx = random.randint(0, len(uploaded_data['warehouse']) - 1)
-                shelf = uploaded_data['warehouse'][idx]
-                try:
-                    count = int(shelf.get('item_count', 0))
-                    shelf['item_count'] = str(max(0, count + random.randint(-5, 5)))
-                    changes.append(f"Shelf {shelf.get('shelf_id', idx)} count updated")
-                except: pass
+        advance_beds = facility.journaled('hospital', 'simulate', facility.simulation.advance_beds)
+        advance_shelves = facility.journaled('warehouse', 'simulate', facility.simulation.advance_shelves)
+        changed_beds = facility.state.update_dataset('hospital', advance_beds) or []
+        changed_shelves = facility.state.update_dataset('warehouse', advance_shelves) or []
+        if changed_beds or changed_shelves:
+            facility.invalidate_results()
+        changes = [f"Bed {bed['bed_id']} is now {bed['status']}" for bed in changed_beds]
+        changes += [f"Shelf {shelf['shelf_id']} now holds {shelf['item_count']} items" for shelf in changed_shelves]
+        facility.publish_changes(changed_beds, changed_shelves)
         return jsonify({'status': 'success', 'changes': changes})
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+@twin.route('/simulation/config', methods=['GET', 'POST'])
+def simulation_config():
+    """
+    Get or change the simulation settings: seed, latency (seconds of simulated
+    optimizer work), step_seconds and event rates per minute. Posting a seed,
+    even null, restarts the random stream.
+    """
+    simulation = _facility().simulation
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        try:
+            simulation.configure(**data)
+        except (TypeError, ValueError) as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 400
+    return jsonify({'status': 'success', 'config': simulation.config()})
+
+@twin.route('/simulation/run', methods=['POST'])
+def run_simulation():
+    """
+    Fast-forward the uploaded twin through simulated time (seconds, hours
+    and/or days) with the discrete-event simulator, for what-if analysis.
+    Returns a report and a timeline; with apply=true the end state replaces
+    the live data.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        seconds = (float(data.get('seconds', 0)) + float(data.get('hours', 0)) * 3600
+                   + float(data.get('days', 0)) * 86400)
+        sample_seconds = float(data.get('sampleSeconds', DEFAULT_SAMPLE_SECONDS))
+    except (TypeError, ValueError):
+        return jsonify({'status': 'error', 'message': 'seconds, hours, days and sampleSeconds must be numbers'}), 400
+    if not 0 < seconds <= MAX_FAST_FORWARD:
+        return jsonify({'status': 'error', 'message': f'Simulated time must be between 0 and {MAX_FAST_FORWARD // 86400} days'}), 400
+    facility = _facility()
+    simulation = facility.simulation
+    # Copies, so the ticker and live simulator can go on while the run reads them
+    hospital = facility.custom_dataset('hospital', copy=True)
+    warehouse = facility.custom_dataset('warehouse', copy=True)
+    if hospital is None and warehouse is None:
+        return jsonify({'status': 'error', 'message': 'Upload a dataset first'}), 400
+
+    simulator = TwinSimulator(
+        simulation.config(), hospital, warehouse, seed=simulation.child_seed(), sample_seconds=sample_seconds
+    )
+    start = time.perf_counter()
+    simulator.advance(seconds)
+    elapsed_ms = round((time.perf_counter() - start) * 1000, 2)
+
+    applied = False
+    if data.get('apply'):
+        originals = {'hospital': hospital, 'warehouse': warehouse}
+        writes = {'hospital': simulator.write_beds, 'warehouse': simulator.write_shelves}
+        fns = {
+            dataset_type: facility.journaled(dataset_type, 'run', writes[dataset_type])
+            for dataset_type, original in originals.items() if original is not None
+        }
+        # Only overwrite the data the run started from, both datasets or neither
+        changed = facility.state.update_datasets(fns, check=lambda stores: all(
+            stores[dataset_type] is not None and stores[dataset_type].version == originals[dataset_type].version
+            for dataset_type in fns
+        ))
+        if changed is None:
+            return jsonify({'status': 'error', 'message': 'The data changed during the run; nothing was applied'}), 409
+        facility.publish_changes(changed.get('hospital'), changed.get('warehouse'))
+        applied = True
+
+    return jsonify({
+        'status': 'success',
+        'simulatedSeconds': seconds,
+        'elapsedMs': elapsed_ms,
+        'applied': applied,
+        'report': simulator.report(),
+        'timeline': simulator.samples
+    })
+
+@twin.route('/simulation/start', methods=['POST'])
+def start_live_simulation():
+    """Run the discrete-event simulator against the live twin at ?speed simulated seconds per second"""
+    facility = _facility()
+    if not facility.mode()['custom']:
+        return jsonify({'status': 'error', 'message': 'Upload a dataset first'}), 400
+    data = request.get_json(silent=True) or {}
+    try:
+        facility.live_simulation.start(data.get('speed'))
+    except (TypeError, ValueError) as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    status = facility.live_simulation.status()
+    facility.events.publish('simulation', status)
+    return jsonify(dict(status, status='success'))
+
+@twin.route('/simulation/stop', methods=['POST'])
+def stop_live_simulation():
+    facility = _facility()
+    facility.live_simulation.stop()
+    status = facility.live_simulation.status()
+    facility.events.publish('simulation', status)
+    return jsonify(dict(status, status='success'))
+
+@twin.route('/simulation/status', methods=['GET'])
+def get_live_simulation_status():
+    return jsonify(dict(_facility().live_simulation.status(), status='success'))
+
+def _random_mode_ticker():
+    """Push monitoring history on a timer, and in random mode let the twin "change"; only while someone is watching"""
+    while True:
+        time.sleep(RANDOM_TICK_SECONDS)
+        # Watched facilities hold a stream open, so they stay in memory
+        for facility in facilities.active():
+            events = facility.events
+            if not events.subscriber_count():
+                continue
+            events.publish('monitoring', history.chart(MONITORING_SERIES, MONITORING_DEFAULT_WINDOW))
+            mode = facility.mode()
+            if mode['demo'] or mode['custom']:
+                continue
+            simulation = facility.simulation
+            metrics = facility.state.update('metrics', lambda metrics: _randomize_metrics(metrics, simulation))
+            events.publish('metrics', _current_metrics(facility, metrics))
+            hospital = facility.state.update('hospital', lambda stats: _randomize_hospital(stats, simulation))
+            warehouse = facility.state.update('warehouse', lambda stats: _randomize_warehouse(stats, simulation))
+            events.publish('hospital', hospital)
+            events.publish('warehouse', warehouse)
+
+_ticker_lock = threading.Lock()
+_ticker_started = False
+
+def _ensure_ticker():
+    global _ticker_started
+    with _ticker_lock:
+        if not _ticker_started:
+            threading.Thread(target=_random_mode_ticker, daemon=True).start()
+            _ticker_started = True
+
+@twin.route('/stream', methods=['GET'])
+def stream_events():
+    """Server-Sent Events stream of state changes (metrics, hospital, warehouse, dataset, ...)"""
+    _ensure_ticker()
+    events = _facility().events
+    client = events.subscribe()
+    response = Response(stream_with_context(events.stream(client)), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/api/facilities', methods=['GET'])
+def list_facilities():
+    """Facilities known to this server: those in memory with their status, and those evicted to disk"""
+    active = {facility.id: facility.status() for facility in facilities.active()}
+    listed = [active.get(facility_id, {'id': facility_id, 'active': False}) for facility_id in facilities.ids()]
+    return jsonify({'status': 'success', 'facilities': listed, 'registry': facilities.stats()})
+
+@app.route('/api/facilities', methods=['POST'])
+def create_facility():
+    """Create a facility: body {"id": "<facility_id>"}. An existing facility is returned as is."""
+    data = request.get_json(silent=True) or {}
+    facility_id = data.get('id')
+    if not valid_facility_id(facility_id):
+        return jsonify({'status': 'error', 'message': f'Invalid facility id: {facility_id}'}), 400
+    existed = facilities.exists(facility_id)
+    try:
+        facility = facilities.acquire(facility_id, create=True)
+    except FacilityLimitError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 409
+    try:
+        return jsonify({'status': 'success', 'facility': facility.status()}), 200 if existed else 201
+    finally:
+        facilities.release(facility)
+
+app.register_blueprint(twin, url_prefix='/api')
+app.register_blueprint(twin, url_prefix='/api/facilities/<facility_id>', name='facility')
+
 if __name__ == '__main__':
-    app.run(debug=True, port=5000, host='0.0.0.0')
+    app.run(debug=True, port=5000, host='0.0.0.0', threaded=True)
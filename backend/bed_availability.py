@@ -0,0 +1,170 @@
+"""
+Index of free beds for next-available lookups
+
+Answering "which bed is free" used to mean scanning every bed. BedAvailability
+keeps the free beds of an uploaded hospital in min-heaps, ordered by walking
+distance from the ward entrance (see facility_layout.py):
+
+- one heap over all beds, one per bed category and one per ward and category,
+  so the next free bed for any of them is the top of one heap (a ward across
+  categories looks at that ward's few category heaps)
+- HospitalDataset.set_status reports every change with update(), which pushes
+  a bed that became free; beds that stop being free are dropped lazily when
+  they reach the top of a heap. Each bed is in a heap at most once, so the
+  heaps never grow past the bed count.
+- a free mask per category is kept alongside, so "N nearest free beds to X"
+  runs the layout's grid search without rebuilding a mask
+
+Lookups and updates are O(log n). The index is derived data: it is not pickled
+with the store and is rebuilt on first use after a reload.
+"""
+import heapq
+import threading
+
+import numpy as np
+
+from facility_layout import layout_for
+
+# Heap levels: every bed, per category, per (ward, category)
+ALL, CATEGORY, WARD = range(3)
+
+
+class BedAvailability:
+    def __init__(self, beds):
+        """
+        Args:
+            beds: HospitalDataset to index; keep it current by calling
+                update() on status changes (set_status does)
+        """
+        n = len(beds)
+        self.ids = beds.ids
+        self.layout = layout_for(beds)
+        self.categories = list(beds.category.categories)
+        self._category_codes = {category: code for code, category in enumerate(self.categories)}
+        self.category = beds.category.codes.astype(np.int64)
+        self.ward = self.layout.groups
+        # Beds by walking distance from the entrance; heaps hold positions in this order
+        self.distance = self.layout.walk_from(0.0, 0.0).astype(np.float64)
+        self.order = np.lexsort((np.arange(n), self.distance))
+        self.position = np.empty(n, dtype=np.int64)
+        self.position[self.order] = np.arange(n)
+
+        self.free = beds.available_mask()
+        self.free_by_category = np.zeros((len(self.categories), n), dtype=bool)
+        self.free_by_category[self.category, np.arange(n)] = self.free
+        self.free_count = np.bincount(self.category[self.free], minlength=len(self.categories))
+        self._queued = np.zeros((3, n), dtype=bool)
+        self._queued[:, self.free] = True
+        self._heaps = [{}, {}, {}]
+        # Free positions in ascending order already form a valid heap
+        free_positions = self.position[self.free]
+        for level in (ALL, CATEGORY, WARD):
+            keys = self._key(level, self.free.nonzero()[0])
+            grouped = np.lexsort((free_positions, keys))
+            keys, positions = keys[grouped], free_positions[grouped]
+            distinct, starts = np.unique(keys, return_index=True)
+            for key, chunk in zip(distinct.tolist(), np.split(positions, starts[1:])):
+                self._heaps[level][key] = chunk.tolist()
+        self._lock = threading.Lock()
+
+    def _key(self, level, rows):
+        if level == ALL:
+            return np.zeros_like(rows)
+        if level == CATEGORY:
+            return self.category[rows]
+        return self.ward[rows] * len(self.categories) + self.category[rows]
+
+    def category_code(self, category):
+        """Code for a category name, or None when no bed has that category"""
+        return self._category_codes.get(str(category).strip().lower())
+
+    def update(self, row, available):
+        """Record that bed row is now free (available=True) or not"""
+        with self._lock:
+            if self.free[row] == available:
+                return
+            code = self.category[row]
+            self.free[row] = available
+            self.free_by_category[code, row] = available
+            self.free_count[code] += 1 if available else -1
+            if not available:
+                return
+            for level in (ALL, CATEGORY, WARD):
+                if not self._queued[level, row]:
+                    key = int(self._key(level, row))
+                    heapq.heappush(self._heaps[level].setdefault(key, []), int(self.position[row]))
+                    self._queued[level, row] = True
+
+    def _pop(self, level, key):
+        """Pop the nearest free bed from one heap, discarding stale entries; None when empty"""
+        heap = self._heaps[level].get(key)
+        while heap:
+            row = self.order[heapq.heappop(heap)]
+            if self.free[row]:
+                return row
+            self._queued[level, row] = False
+        return None
+
+    def _first(self, level, key, k):
+        taken = []
+        while len(taken) < k:
+            row = self._pop(level, key)
+            if row is None:
+                break
+            taken.append(row)
+        # Put the free beds back; they stay queued
+        heap = self._heaps[level].get(key)
+        for row in taken:
+            heapq.heappush(heap, int(self.position[row]))
+        return taken
+
+    def first(self, k=1, ward=None, category=None):
+        """
+        Up to k free beds nearest the entrance, nearest first
+
+        Args:
+            ward: optional ward number to search
+            category: optional category code (see category_code)
+
+        Returns:
+            array of rows
+        """
+        with self._lock:
+            if ward is None:
+                if category is None:
+                    found = self._first(ALL, 0, k)
+                else:
+                    found = self._first(CATEGORY, category, k)
+            else:
+                codes = range(len(self.categories)) if category is None else (category,)
+                found = []
+                for code in codes:
+                    found.extend(self._first(WARD, ward * len(self.categories) + code, k))
+                found = sorted(found, key=lambda row: self.position[row])[:k]
+        return np.array(found, dtype=np.int64)
+
+    def nearest(self, px, py, k=1, category=None):
+        """
+        Up to k free beds closest to (px, py) by walking distance
+
+        Returns:
+            (rows, distances) arrays
+        """
+        with self._lock:
+            if category is None:
+                allowed, count = self.free, int(self.free_count.sum())
+            else:
+                allowed, count = self.free_by_category[category], int(self.free_count[category])
+            # The grid only reads the mask, but update() must not change it mid-search
+            return self.layout.nearest(px, py, k, allowed=allowed, allowed_count=count)
+
+    def by_category(self):
+        """Free beds per category with the next one to assign"""
+        summary = {}
+        for code, category in enumerate(self.categories):
+            nearest = self.first(1, category=code)
+            summary[category] = {
+                'available': int(self.free_count[code]),
+                'next': str(self.ids[nearest[0]]) if len(nearest) else None
+            }
+        return summary
@@ -0,0 +1,274 @@
+"""
+Benchmark harness for the optimizer and the API hot paths
+
+Measures QuantumOptimizer.optimize for both problem types across dataset
+scales, in simulation mode (classical engines and simulated fallback only) and
+Qiskit-Aer mode (when qiskit-aer is installed), then the latency and throughput
+of the stats and upload endpoints through the Flask test client using
+sample_data replicated 1x-100x. Results are written as JSON with a stable
+layout so runs from different versions can be diffed, or compared directly
+with --compare.
+
+Usage:
+    python benchmark.py --output bench.json
+    python benchmark.py --quick --compare bench.json
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+SAMPLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'sample_data')
+SAMPLE_FILES = {
+    'hospital': 'hospital_dataset.csv',
+    'warehouse': 'warehouse_dataset.csv'
+}
+
+OPTIMIZER_SCALES = (1, 2, 5)
+API_SCALES = (1, 10, 100)
+OPTIMIZER_MODES = ('simulation', 'aer')
+STATS_REQUESTS = 200
+UPLOAD_REPEATS = 3
+OPTIMIZER_REPEATS = 3
+
+
+def scaled_rows(dataset_type, scale):
+    """sample_data rows replicated `scale` times with unique, layout-preserving ids"""
+    with open(os.path.join(SAMPLE_DIR, SAMPLE_FILES[dataset_type]), newline='') as f:
+        rows = list(csv.DictReader(f))
+    count = len(rows)
+    scaled = []
+    for copy in range(scale):
+        for index, row in enumerate(rows):
+            row = dict(row)
+            if dataset_type == 'hospital':
+                row['bed_id'] = str(copy * count + int(row['bed_id']))
+                if row.get('patient_id'):
+                    row['patient_id'] = f"{row['patient_id']}-{copy}"
+            else:
+                prefix = row['shelf_id'].split('-')[0]
+                row['shelf_id'] = f'{prefix}-{copy * count + index + 1:06d}'
+            scaled.append(row)
+    return scaled
+
+
+def to_csv_bytes(rows):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=list(rows[0].keys()))
+    writer.writeheader()
+    writer.writerows(rows)
+    return buffer.getvalue().encode('utf-8')
+
+
+def summarize(samples_ms):
+    """Latency statistics for a list of millisecond samples"""
+    ordered = sorted(samples_ms)
+
+    def percentile(p):
+        return round(float(np.percentile(ordered, p)), 3)
+
+    total_s = sum(ordered) / 1000
+    return {
+        'runs': len(ordered),
+        'min_ms': round(ordered[0], 3),
+        'mean_ms': round(statistics.fmean(ordered), 3),
+        'p50_ms': percentile(50),
+        'p95_ms': percentile(95),
+        'p99_ms': percentile(99),
+        'max_ms': round(ordered[-1], 3),
+        'ops_per_s': round(len(ordered) / total_s, 2) if total_s else None
+    }
+
+
+def _timed(fn, repeats):
+    samples, result = [], None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples, result
+
+
+def _optimizer_for(mode):
+    """QuantumOptimizer configured for a benchmark mode, or (None, reason) when unavailable"""
+    from quantum_optimizer import QuantumOptimizer
+
+    optimizer = QuantumOptimizer()
+    if mode == 'simulation':
+        optimizer.use_quantum = False
+        return optimizer, None
+    if not optimizer.use_quantum:
+        return None, 'qiskit not available'
+    try:
+        from qiskit_aer.primitives import Sampler as AerSampler
+    except ImportError:
+        return None, 'qiskit-aer not installed'
+    optimizer.sampler = AerSampler()
+    return optimizer, None
+
+
+def bench_optimizer(scales, modes, repeats, seed, latency=None):
+    from dataset_store import load_dataset
+
+    results = []
+    for mode in modes:
+        optimizer, skipped = _optimizer_for(mode)
+        for problem in ('hospital', 'warehouse'):
+            # Scale 0 is the built-in demo problem (QAOA or simulated fallback)
+            for scale in (0,) + tuple(scales):
+                case = {'problem': problem, 'mode': mode, 'scale': scale}
+                if skipped:
+                    results.append(dict(case, skipped=skipped))
+                    continue
+                dataset = load_dataset(problem, scaled_rows(problem, scale)) if scale else None
+                case['rows'] = len(dataset) if dataset is not None else 0
+                optimizer.simulation.configure(seed=seed, latency=latency)
+                try:
+                    samples, result = _timed(lambda: optimizer.optimize(problem, dataset), repeats)
+                except Exception as e:
+                    results.append(dict(case, error=str(e)))
+                    continue
+                case.update(summarize(samples))
+                case['method'] = result.get('method')
+                case['timings'] = result.get('timings')
+                results.append(case)
+                print(f"optimizer {mode:10s} {problem:9s} x{scale:<3d} {case['p50_ms']:10.2f} ms  {case['method']}", file=sys.stderr)
+    return results
+
+
+def bench_api(scales, stats_requests, upload_repeats):
+    os.environ.setdefault('STATE_BACKEND', 'memory')
+    # Journal uploads into a scratch directory rather than the real twin data
+    os.environ.setdefault('TWIN_DATA_DIR', tempfile.mkdtemp(prefix='bench-twin-'))
+    from app import app, job_queue
+
+    client = app.test_client()
+    results = []
+    try:
+        for scale in scales:
+            for problem in ('hospital', 'warehouse'):
+                payload = to_csv_bytes(scaled_rows(problem, scale))
+                filename = f'{problem}_x{scale}.csv'
+
+                def upload():
+                    response = client.post(
+                        '/api/upload/dataset',
+                        data={'file': (io.BytesIO(payload), filename)},
+                        content_type='multipart/form-data'
+                    )
+                    if response.status_code != 200:
+                        raise RuntimeError(f'upload failed: {response.get_json()}')
+
+                samples, _ = _timed(upload, upload_repeats)
+                stats = summarize(samples)
+                stats['mb_per_s'] = round(len(payload) / 2**20 / (stats['mean_ms'] / 1000), 2)
+                results.append(dict({'endpoint': '/api/upload/dataset', 'problem': problem, 'scale': scale,
+                                     'bytes': len(payload)}, **stats))
+
+                endpoint = f'/api/{problem}/stats'
+                samples, _ = _timed(lambda: client.get(endpoint), stats_requests)
+                results.append(dict({'endpoint': endpoint, 'problem': problem, 'scale': scale}, **summarize(samples)))
+
+                rows_requests = max(1, stats_requests // (10 * scale))
+                samples, _ = _timed(lambda: client.get(endpoint, query_string={'include': 'rows'}), rows_requests)
+                results.append(dict({'endpoint': f'{endpoint}?include=rows', 'problem': problem, 'scale': scale},
+                                    **summarize(samples)))
+                print(f"api x{scale:<3d} {problem:9s} upload {results[-3]['p50_ms']:9.2f} ms  "
+                      f"stats {results[-2]['p50_ms']:7.3f} ms  rows {results[-1]['p50_ms']:9.2f} ms", file=sys.stderr)
+    finally:
+        job_queue.shutdown()
+    return results
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _case_key(case):
+    return tuple(case.get(field) for field in ('endpoint', 'problem', 'mode', 'scale'))
+
+
+def compare(previous, current):
+    """Print p50 changes for cases present in both runs"""
+    before = {_case_key(case): case for section in ('optimizer', 'api') for case in previous.get(section, [])}
+    for section in ('optimizer', 'api'):
+        for case in current.get(section, []):
+            old = before.get(_case_key(case))
+            if not old or 'p50_ms' not in old or 'p50_ms' not in case:
+                continue
+            change = (case['p50_ms'] - old['p50_ms']) / old['p50_ms'] * 100 if old['p50_ms'] else 0.0
+            label = ' '.join(str(part) for part in _case_key(case) if part is not None)
+            print(f"{label:50s} {old['p50_ms']:10.3f} -> {case['p50_ms']:10.3f} ms  {change:+7.1f}%")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the optimizer and API hot paths')
+    parser.add_argument('--output', help='write results JSON here (default: stdout)')
+    parser.add_argument('--compare', help='previous results JSON to compare p50 latencies against')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--latency', type=float, help='simulated optimizer latency in seconds (default: SIM_LATENCY or 0.5)')
+    parser.add_argument('--optimizer-scales', type=int, nargs='*', default=list(OPTIMIZER_SCALES))
+    parser.add_argument('--api-scales', type=int, nargs='*', default=list(API_SCALES))
+    parser.add_argument('--modes', nargs='*', default=list(OPTIMIZER_MODES), choices=OPTIMIZER_MODES)
+    parser.add_argument('--repeats', type=int, default=OPTIMIZER_REPEATS)
+    parser.add_argument('--stats-requests', type=int, default=STATS_REQUESTS)
+    parser.add_argument('--skip-optimizer', action='store_true')
+    parser.add_argument('--skip-api', action='store_true')
+    parser.add_argument('--quick', action='store_true', help='small scales and fewer repeats')
+    args = parser.parse_args(argv)
+
+    if args.quick:
+        args.optimizer_scales = [1]
+        args.api_scales = [1, 10]
+        args.repeats = 1
+        args.stats_requests = 50
+
+    results = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'revision': _git_revision(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'seed': args.seed,
+            'latency': args.latency
+        },
+        'optimizer': [],
+        'api': []
+    }
+    if not args.skip_optimizer:
+        results['optimizer'] = bench_optimizer(args.optimizer_scales, args.modes, args.repeats, args.seed, args.latency)
+    if not args.skip_api:
+        results['api'] = bench_api(args.api_scales, args.stats_requests, UPLOAD_REPEATS)
+
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), results)
+
+
+if __name__ == '__main__':
+    main()
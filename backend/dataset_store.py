@@ -0,0 +1,692 @@
+"""
+Columnar, typed stores for uploaded datasets
+
+Each dataset keeps its fields as NumPy columns (integers parsed once at load,
+status, zone and bed category interned as small category codes, patient ids
+as a fixed-width string column widened as longer ids arrive) plus an index from
+bed_id/shelf_id to row, built on first lookup. Occupancy aggregates are
+adjusted on every mutation, so stats requests never rescan the rows. Row
+dicts are only built on demand for API payloads.
+
+Mutations go through the store methods; editing the columns directly would
+leave the counters stale.
+
+Optional x and y columns give each row floor coordinates in metres, used by
+the facility layout instead of positions derived from the ids.
+Hospital uploads may add a category column (bed category / priority class,
+e.g. icu or general; 'general' when missing), which the free-bed index groups
+by.
+
+Uploads are read with read_csv_dataset, which decodes and parses the upload
+stream CHUNK_ROWS rows at a time and appends each chunk straight into typed
+columns, so memory stays proportional to the final columns rather than to
+several copies of the raw file.
+"""
+import csv
+import io
+from datetime import datetime, timezone
+
+import numpy as np
+
+OCCUPIED_BED_STATUSES = ('occupied', 'cleaning', 'critical')
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Rows parsed per chunk while streaming an upload
+CHUNK_ROWS = 50000
+
+
+class DatasetFormatError(ValueError):
+    """The uploaded CSV is empty, of an unknown type, or has invalid rows"""
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (ValueError, TypeError):
+        return 0
+
+
+def _int_column(values):
+    """Parse a chunk of integer strings, treating anything unparseable as 0"""
+    try:
+        return np.array(values, dtype=np.int64).astype(np.int32)
+    except (ValueError, OverflowError):
+        return np.fromiter((_to_int(value) for value in values), dtype=np.int32, count=len(values))
+
+
+def _coordinate_column(values, name, first_row):
+    """Parse a chunk of coordinates; unlike counts, a bad coordinate is an error"""
+    try:
+        column = np.array([str(value).strip() for value in values], dtype=np.float64)
+    except ValueError:
+        column = np.full(len(values), np.nan)
+    bad = np.flatnonzero(~np.isfinite(column))
+    if len(bad):
+        raise DatasetFormatError(f"Row {first_row + bad[0]}: {name} must be a number")
+    return column
+
+
+def _parse_timestamp(value):
+    """Epoch seconds for a naive 'YYYY-MM-DD[ HH:MM:SS]' timestamp, NaN when unparseable"""
+    try:
+        return _epoch_seconds(np.array([str(value).strip()], dtype='datetime64[s]'))[0]
+    except ValueError:
+        return np.nan
+
+
+def _timestamp_column(values):
+    """Parse a chunk of timestamps in one pass, falling back per value on bad input"""
+    try:
+        return _epoch_seconds(np.array([value.strip() for value in values], dtype='datetime64[s]'))
+    except ValueError:
+        return np.fromiter((_parse_timestamp(value) for value in values), dtype=np.float64, count=len(values))
+
+
+def _epoch_seconds(stamps):
+    seconds = stamps.astype(np.int64).astype(np.float64)
+    seconds[np.isnat(stamps)] = np.nan
+    return seconds
+
+
+def _normalize_status(value):
+    return str(value).strip().lower()
+
+
+def _normalize_zone(value):
+    return value or 'default'
+
+
+def _normalize_category(value):
+    return str(value).strip().lower() or 'general'
+
+
+def _code_dtype(count):
+    """Smallest unsigned integer type that can index count categories"""
+    return np.min_scalar_type(max(count - 1, 0))
+
+
+def _fit_strings(column, values):
+    """column, widened when one of the new values is longer than its fixed width"""
+    width = max((len(value) for value in values), default=0)
+    if width > column.dtype.itemsize // np.dtype('U1').itemsize:
+        return column.astype(f'U{width}')
+    return column
+
+
+def _format_timestamp(value):
+    # Timestamps are naive wall-clock times, kept as if they were UTC
+    return '' if np.isnan(value) else datetime.fromtimestamp(value, timezone.utc).strftime(TIMESTAMP_FORMAT)
+
+
+class Categorical:
+    """
+    String column stored as small integer codes into a shared category list
+
+    The codes use the smallest unsigned type that fits the categories (uint8
+    up to 256) and are widened when a new category outgrows it.
+    """
+
+    def __init__(self, values=(), normalize=None):
+        self.normalize = normalize
+        self.categories = []
+        self._lookup = {}
+        self.codes = self._encode(values)
+
+    @classmethod
+    def from_codes(cls, codes, categories, normalize=None):
+        """Column over existing codes and categories (e.g. read back from a snapshot)"""
+        column = cls(normalize=normalize)
+        column.categories = list(categories)
+        column._lookup = {value: code for code, value in enumerate(column.categories)}
+        column.codes = codes
+        return column
+
+    def code(self, value):
+        if self.normalize:
+            value = self.normalize(value)
+        code = self._lookup.get(value)
+        if code is None:
+            code = len(self.categories)
+            self.categories.append(value)
+            self._lookup[value] = code
+            codes = getattr(self, 'codes', None)
+            if codes is not None and code > np.iinfo(codes.dtype).max:
+                self.codes = codes.astype(_code_dtype(len(self.categories)))
+        return code
+
+    def _encode(self, values):
+        """Codes for a batch of values, normalizing each distinct value once"""
+        values = np.asarray(list(values), dtype=str)
+        if not len(values):
+            return np.array([], dtype=_code_dtype(len(self.categories)))
+        distinct, inverse = np.unique(values, return_inverse=True)
+        mapping = np.array([self.code(value) for value in distinct.tolist()], dtype=_code_dtype(len(self.categories)))
+        return mapping[inverse.ravel()]
+
+    def extend(self, values):
+        self.codes = np.concatenate((self.codes, self._encode(values)))
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, index):
+        return self.categories[self.codes[index]]
+
+    def set(self, index, value):
+        self.codes[index] = self.code(value)
+
+    def values(self):
+        """Decoded values as a NumPy string array"""
+        return np.array(self.categories, dtype=str)[self.codes] if len(self.codes) else np.array([], dtype=str)
+
+    def counts(self):
+        """Rows per category, indexed like categories"""
+        return np.bincount(self.codes, minlength=len(self.categories))
+
+
+class DatasetStore:
+    dataset_type = None
+    id_column = None
+
+    def __init__(self, ids):
+        self.ids = np.asarray(ids, dtype=str)
+        self._index = None
+        # Bumped on every mutation so callers can tell whether anything changed
+        self.version = 0
+        # Optional (x, y) floor coordinates from the upload
+        self.coordinates = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getstate__(self):
+        # The id index is rebuilt on demand, so it is not pickled or shared
+        state = dict(self.__dict__)
+        state['_index'] = None
+        return state
+
+    @property
+    def index(self):
+        """bed_id/shelf_id -> row, built on first lookup"""
+        if self._index is None:
+            self._index = {row_id: row for row, row_id in enumerate(self.ids.tolist())}
+        return self._index
+
+    def find(self, row_id):
+        """Row number for a bed_id/shelf_id, or None"""
+        return self.index.get(str(row_id))
+
+    def row(self, index):
+        raise NotImplementedError
+
+    def _rows_coordinates(self, rows):
+        """Take x/y from row dicts that have both (from_rows)"""
+        if rows and all(row.get('x') not in (None, '') and row.get('y') not in (None, '') for row in rows):
+            self.coordinates = (
+                _coordinate_column([row['x'] for row in rows], 'x', 1),
+                _coordinate_column([row['y'] for row in rows], 'y', 1)
+            )
+        return self
+
+    @property
+    def rows(self):
+        """All rows as dicts of strings, in upload format (built on demand)"""
+        return [self.row(index) for index in range(len(self))]
+
+    def summary(self):
+        raise NotImplementedError
+
+    def columns(self):
+        """The arrays and Categoricals that make up the store, by upload column name (for snapshots)"""
+        raise NotImplementedError
+
+    @classmethod
+    def from_columns(cls, columns):
+        """Rebuild a store from columns(), with each Categorical given as (codes, categories)"""
+        raise NotImplementedError
+
+    def copy(self):
+        """Independent copy of the rows, e.g. to snapshot or ship while the original keeps changing"""
+        columns = {
+            name: (column.codes.copy(), list(column.categories)) if isinstance(column, Categorical) else np.array(column)
+            for name, column in self.columns().items()
+        }
+        store = type(self).from_columns(columns)
+        store.coordinates = self.coordinates
+        store.version = self.version
+        return store
+
+    def delta(self, index):
+        """JSON-compatible mutable fields of one row, exact enough to replay with apply_deltas"""
+        raise NotImplementedError
+
+    def apply_deltas(self, changes):
+        """
+        Replay many delta() values at once and recount the aggregates
+
+        Args:
+            changes: {row index: delta values}, holding the last values per row
+        """
+        raise NotImplementedError
+
+
+class HospitalDataset(DatasetStore):
+    dataset_type = 'hospital'
+    id_column = 'bed_id'
+
+    def __init__(self, bed_ids, patient_ids, statuses, last_updated, categories=None):
+        """
+        Args:
+            bed_ids: bed identifiers
+            patient_ids: patient identifier per bed ('' when empty)
+            statuses: bed status strings (case-insensitive) or a prebuilt Categorical
+            last_updated: epoch seconds (NaN when unknown)
+            categories: bed category / priority class per bed (e.g. icu, general),
+                strings or a prebuilt Categorical; all 'general' when omitted
+        """
+        super().__init__(bed_ids)
+        self.patient_ids = np.asarray(patient_ids, dtype=str)
+        self.status = statuses if isinstance(statuses, Categorical) else Categorical(statuses, normalize=_normalize_status)
+        self.last_updated = np.asarray(last_updated, dtype=np.float64)
+        if categories is None:
+            categories = np.full(len(self.ids), 'general')
+        self.category = categories if isinstance(categories, Categorical) else Categorical(categories, normalize=_normalize_category)
+        self._recount()
+        # Free-bed index (see bed_availability.py), built on first lookup
+        self._availability = None
+
+    def _recount(self):
+        counts = self.status.counts()
+        self.status_counts = {category: int(count) for category, count in zip(self.status.categories, counts)}
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        state['_availability'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        # Stores pickled when patient ids were still an object column
+        self.patient_ids = np.asarray(self.patient_ids, dtype=str)
+
+    @classmethod
+    def from_rows(cls, rows):
+        return cls(
+            [row.get('bed_id', idx) for idx, row in enumerate(rows)],
+            [row.get('patient_id') or '' for row in rows],
+            [str(row.get('status', 'available')) for row in rows],
+            _timestamp_column([str(row.get('last_updated', '')) for row in rows]),
+            [str(row.get('category') or '') for row in rows]
+        )._rows_coordinates(rows)
+
+    @classmethod
+    def builder(cls, header):
+        return _ColumnBuilder(cls, header, {
+            'bed_id': [],
+            'patient_id': [],
+            'status': Categorical(normalize=_normalize_status),
+            'last_updated': [],
+            'category': Categorical(normalize=_normalize_category)
+        })
+
+    @staticmethod
+    def parse_chunk(columns, column):
+        columns['bed_id'].append(np.array(column('bed_id'), dtype=str))
+        columns['patient_id'].append(np.array(column('patient_id'), dtype=str))
+        columns['status'].extend(column('status', 'available'))
+        columns['last_updated'].append(_timestamp_column(column('last_updated')))
+        columns['category'].extend(column('category', 'general'))
+
+    @property
+    def occupied(self):
+        return sum(self.status_counts.get(status, 0) for status in OCCUPIED_BED_STATUSES)
+
+    def available_mask(self):
+        """Boolean mask of beds not in an occupied status"""
+        occupied = [code for code, status in enumerate(self.status.categories) if status in OCCUPIED_BED_STATUSES]
+        return ~np.isin(self.status.codes, occupied)
+
+    @property
+    def availability(self):
+        """BedAvailability index of free beds, kept current by set_status"""
+        index = getattr(self, '_availability', None)
+        while index is None:
+            from bed_availability import BedAvailability
+            version = self.version
+            self._availability = BedAvailability(self)
+            # A status change while building may have missed the new index
+            index = self._availability if self.version == version else None
+        return index
+
+    def row(self, index):
+        return {
+            'bed_id': str(self.ids[index]),
+            'patient_id': str(self.patient_ids[index]),
+            'status': self.status[index],
+            'last_updated': _format_timestamp(self.last_updated[index]),
+            'category': self.category[index]
+        }
+
+    def set_status(self, index, status, patient_id=None, timestamp=None):
+        """Change one bed's status (and optionally its patient and last_updated epoch seconds); returns the updated row"""
+        old = self.status[index]
+        self.status.set(index, status)
+        if patient_id is not None:
+            self.patient_ids = _fit_strings(self.patient_ids, (patient_id,))
+            self.patient_ids[index] = patient_id
+        if timestamp is not None:
+            self.last_updated[index] = timestamp
+        new = self.status[index]
+        self.status_counts[old] -= 1
+        self.status_counts[new] = self.status_counts.get(new, 0) + 1
+        self.version += 1
+        availability = getattr(self, '_availability', None)
+        if availability is not None:
+            availability.update(index, new not in OCCUPIED_BED_STATUSES)
+        return self.row(index)
+
+    def columns(self):
+        return {
+            'bed_id': self.ids,
+            'patient_id': self.patient_ids,
+            'status': self.status,
+            'last_updated': self.last_updated,
+            'category': self.category
+        }
+
+    @classmethod
+    def from_columns(cls, columns):
+        return cls(
+            columns['bed_id'],
+            columns['patient_id'],
+            Categorical.from_codes(*columns['status'], normalize=_normalize_status),
+            columns['last_updated'],
+            Categorical.from_codes(*columns['category'], normalize=_normalize_category)
+        )
+
+    def delta(self, index):
+        updated = self.last_updated[index]
+        return {
+            'status': self.status[index],
+            'patient_id': str(self.patient_ids[index]),
+            'last_updated': None if np.isnan(updated) else float(updated)
+        }
+
+    def apply_deltas(self, changes):
+        if not changes:
+            return
+        indices = np.fromiter(changes, dtype=np.int64, count=len(changes))
+        values = list(changes.values())
+        self.status.codes[indices] = [self.status.code(value['status']) for value in values]
+        patient_ids = [value['patient_id'] for value in values]
+        self.patient_ids = _fit_strings(self.patient_ids, patient_ids)
+        self.patient_ids[indices] = patient_ids
+        self.last_updated[indices] = [np.nan if value['last_updated'] is None else value['last_updated'] for value in values]
+        self._recount()
+        self._availability = None
+        self.version += len(changes)
+
+    def summary(self):
+        total = len(self)
+        occupied = self.occupied
+        return {
+            'totalBeds': total,
+            'occupied': occupied,
+            'available': total - occupied,
+            'byStatus': {status: count for status, count in self.status_counts.items() if count}
+        }
+
+
+class WarehouseDataset(DatasetStore):
+    dataset_type = 'warehouse'
+    id_column = 'shelf_id'
+
+    def __init__(self, shelf_ids, capacity, item_count, zones):
+        """
+        Args:
+            shelf_ids: shelf identifiers
+            capacity: shelf capacity (int)
+            item_count: items currently on the shelf (int)
+            zones: zone name per shelf or a prebuilt Categorical
+        """
+        super().__init__(shelf_ids)
+        self.capacity = np.asarray(capacity, dtype=np.int32)
+        self.item_count = np.asarray(item_count, dtype=np.int32)
+        self.zone = zones if isinstance(zones, Categorical) else Categorical(zones, normalize=_normalize_zone)
+        self._recount()
+
+    def _recount(self):
+        zones_count = len(self.zone.categories)
+        stocked = (self.item_count > 0).astype(np.int64)
+        self.zone_shelves = np.bincount(self.zone.codes, minlength=zones_count).astype(np.int64)
+        self.zone_occupied = np.bincount(self.zone.codes, weights=stocked, minlength=zones_count).astype(np.int64)
+        self.zone_items = np.bincount(self.zone.codes, weights=self.item_count, minlength=zones_count).astype(np.int64)
+        self.zone_capacity = np.bincount(self.zone.codes, weights=self.capacity, minlength=zones_count).astype(np.int64)
+
+    @classmethod
+    def from_rows(cls, rows):
+        return cls(
+            [row.get('shelf_id', idx) for idx, row in enumerate(rows)],
+            [_to_int(row.get('capacity', 0)) for row in rows],
+            [max(0, _to_int(row.get('item_count', 0))) for row in rows],
+            [row.get('zone') or '' for row in rows]
+        )._rows_coordinates(rows)
+
+    @classmethod
+    def builder(cls, header):
+        return _ColumnBuilder(cls, header, {
+            'shelf_id': [],
+            'capacity': [],
+            'item_count': [],
+            'zone': Categorical(normalize=_normalize_zone)
+        })
+
+    @staticmethod
+    def parse_chunk(columns, column):
+        columns['shelf_id'].append(np.array(column('shelf_id'), dtype=str))
+        columns['capacity'].append(_int_column(column('capacity')))
+        columns['item_count'].append(np.maximum(_int_column(column('item_count')), 0))
+        columns['zone'].extend(column('zone'))
+
+    @property
+    def occupied(self):
+        return int(self.zone_occupied.sum())
+
+    def row(self, index):
+        return {
+            'shelf_id': str(self.ids[index]),
+            'capacity': str(int(self.capacity[index])),
+            'item_count': str(int(self.item_count[index])),
+            'zone': self.zone[index]
+        }
+
+    def set_item_count(self, index, count):
+        """Change one shelf's item count and return the updated row"""
+        count = max(0, int(count))
+        old = int(self.item_count[index])
+        zone = self.zone.codes[index]
+        self.item_count[index] = count
+        self.zone_items[zone] += count - old
+        self.zone_occupied[zone] += (count > 0) - (old > 0)
+        self.version += 1
+        return self.row(index)
+
+    def columns(self):
+        return {
+            'shelf_id': self.ids,
+            'capacity': self.capacity,
+            'item_count': self.item_count,
+            'zone': self.zone
+        }
+
+    @classmethod
+    def from_columns(cls, columns):
+        return cls(
+            columns['shelf_id'],
+            columns['capacity'],
+            columns['item_count'],
+            Categorical.from_codes(*columns['zone'], normalize=_normalize_zone)
+        )
+
+    def delta(self, index):
+        return {'item_count': int(self.item_count[index])}
+
+    def apply_deltas(self, changes):
+        if not changes:
+            return
+        indices = np.fromiter(changes, dtype=np.int64, count=len(changes))
+        self.item_count[indices] = [max(0, int(value['item_count'])) for value in changes.values()]
+        self._recount()
+        self.version += len(changes)
+
+    def summary(self):
+        total = len(self)
+        occupied = self.occupied
+        return {
+            'totalShelves': total,
+            'occupied': occupied,
+            'available': total - occupied,
+            'totalItems': int(self.zone_items.sum()),
+            'totalCapacity': int(self.zone_capacity.sum()),
+            'zones': {
+                zone: {
+                    'shelves': int(self.zone_shelves[code]),
+                    'occupied': int(self.zone_occupied[code]),
+                    'items': int(self.zone_items[code]),
+                    'capacity': int(self.zone_capacity[code])
+                }
+                for code, zone in enumerate(self.zone.categories)
+            }
+        }
+
+
+DATASET_TYPES = {
+    'hospital': HospitalDataset,
+    'warehouse': WarehouseDataset
+}
+
+
+def load_dataset(dataset_type, rows):
+    """Build the columnar store for a list of CSV row dicts"""
+    return DATASET_TYPES[dataset_type].from_rows(rows)
+
+
+class _ColumnBuilder:
+    """Accumulates parsed chunks for one dataset type and assembles the store"""
+
+    def __init__(self, dataset_class, header, columns):
+        self.dataset_class = dataset_class
+        self.header = header
+        self.positions = {name: header.index(name) for name in columns if name in header}
+        self.columns = columns
+        # x/y are only used when both columns are present
+        self.coordinates = ([], []) if 'x' in header and 'y' in header else None
+        self.preview = []
+        self.rows = 0
+
+    def add(self, rows):
+        """Parse one chunk of csv.reader rows, each padded to the header width"""
+        if len(self.preview) < 5:
+            self.preview.extend(dict(zip(self.header, row)) for row in rows[:5 - len(self.preview)])
+        fields = list(zip(*rows))
+
+        def column(name, default=''):
+            position = self.positions.get(name)
+            return fields[position] if position is not None else [default] * len(rows)
+
+        id_column = self.dataset_class.id_column
+        missing = np.flatnonzero(np.char.strip(np.array(column(id_column), dtype=str)) == '')
+        if len(missing):
+            raise DatasetFormatError(f"Row {self.rows + missing[0] + 1}: missing {id_column}")
+        self.dataset_class.parse_chunk(self.columns, column)
+        if self.coordinates is not None:
+            for name, parsed in zip(('x', 'y'), self.coordinates):
+                parsed.append(_coordinate_column(fields[self.header.index(name)], name, self.rows + 1))
+        self.rows += len(rows)
+
+    def build(self):
+        store = self.dataset_class(*(
+            column if isinstance(column, Categorical) else np.concatenate(column)
+            for column in self.columns.values()
+        ))
+        _check_unique_ids(store.ids, self.dataset_class.id_column)
+        if self.coordinates is not None:
+            store.coordinates = tuple(np.concatenate(parsed) for parsed in self.coordinates)
+        return store
+
+
+def _check_unique_ids(ids, id_column):
+    """Reject repeated ids: rows are looked up (and their changes recorded) by id"""
+    order = np.argsort(ids, kind='stable')
+    repeated = order[1:][ids[order[1:]] == ids[order[:-1]]]
+    if len(repeated):
+        row = int(repeated.min())
+        raise DatasetFormatError(f"Row {row + 1}: duplicate {id_column} {ids[row]}")
+
+
+def detect_dataset_type(header):
+    """Dataset type for a CSV header, from its id column"""
+    for dataset_type, dataset_class in DATASET_TYPES.items():
+        if dataset_class.id_column in header:
+            return dataset_type
+    raise DatasetFormatError('Unknown dataset format')
+
+
+def read_csv_dataset(stream, chunk_rows=CHUNK_ROWS, progress=None):
+    """
+    Stream a CSV upload into a columnar store
+
+    The type is chosen from the header alone. Rows are decoded and parsed
+    chunk_rows at a time and appended to the typed columns as they arrive.
+
+    Args:
+        stream: binary file-like object (e.g. the upload's file.stream)
+        chunk_rows: rows parsed per chunk
+        progress: optional callback(dataset_type, rows_loaded, bytes_read) after each chunk
+
+    Returns:
+        (dataset_type, store, preview) where preview holds the first few rows as dicts
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    try:
+        reader = csv.reader(text)
+        header = next(reader, None)
+        if not header:
+            raise DatasetFormatError('Empty CSV file')
+        header = [name.strip() for name in header]
+        dataset_type = detect_dataset_type(header)
+        builder = DATASET_TYPES[dataset_type].builder(header)
+
+        width = len(header)
+        chunk = []
+        for row in reader:
+            if len(row) != width:
+                if not row or (len(row) == 1 and not row[0].strip()):
+                    continue
+                # Short rows read as empty trailing fields, extra fields are dropped
+                row = (row + [''] * width)[:width]
+            chunk.append(row)
+            if len(chunk) >= chunk_rows:
+                builder.add(chunk)
+                chunk = []
+                if progress:
+                    progress(dataset_type, builder.rows, _bytes_read(stream))
+        if chunk:
+            builder.add(chunk)
+        if not builder.rows:
+            raise DatasetFormatError('Empty CSV file')
+        if progress:
+            progress(dataset_type, builder.rows, _bytes_read(stream))
+        return dataset_type, builder.build(), builder.preview
+    except UnicodeDecodeError as e:
+        raise DatasetFormatError(f'File is not valid UTF-8: {e.reason}')
+    finally:
+        # Leave the caller's stream open
+        text.detach()
+
+
+def _bytes_read(stream):
+    try:
+        return stream.tell()
+    except (AttributeError, OSError, ValueError):
+        return None
@@ -0,0 +1,236 @@
+"""
+Decomposition of large facility problems into QAOA-sized clusters
+
+Simulated QAOA only copes with a handful of qubits, so a full warehouse or
+hospital is split into small clusters (pick stops within a zone, free beds
+within a ward). With Qiskit available the clusters are solved with QAOA
+concurrently on a process pool; otherwise each gets an exact classical solve
+that takes microseconds, so they are solved inline. The pieces are stitched
+back together with a classical repair step.
+
+Decomposition runs inside an optimizer job worker, and every worker that
+decomposes starts its own cluster pool. The pool is therefore sized to the
+worker's share of the CPUs (cpu_count / OPTIMIZER_WORKERS) unless
+DECOMPOSITION_WORKERS is set.
+"""
+import itertools
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from bed_assignment import BedAssigner, WALK_MINUTES_PER_METRE
+from warehouse_routing import WarehouseRouter, improve_tour, nearest_neighbour_tour, node_distances, tour_length
+
+# Cluster sizes the QAOA templates are compiled for
+CLUSTER_STOPS = 4   # closed route over 4 stops -> 12 route qubits
+CLUSTER_BEDS = 10   # bed selection -> 10 qubits plus slack
+
+# Share of free beds opened for admissions, as in the single-ward QAOA model
+TARGET_FILL = 0.6
+
+OPTIMIZER_WORKERS = int(os.environ.get('OPTIMIZER_WORKERS', 2))
+DECOMPOSITION_WORKERS = int(os.environ.get(
+    'DECOMPOSITION_WORKERS', max(1, (os.cpu_count() or 1) // max(1, OPTIMIZER_WORKERS))
+))
+REPAIR_TIME_BUDGET = 0.05
+
+_pool = None
+_cluster_optimizer = None
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=DECOMPOSITION_WORKERS)
+    return _pool
+
+
+def _exact_route(dist):
+    """Brute-force closed tour from node 0 for tiny clusters"""
+    n = len(dist)
+    best, best_order = math.inf, list(range(n))
+    for perm in itertools.permutations(range(1, n)):
+        order = (0,) + perm
+        length = sum(dist[a][b] for a, b in zip(order, order[1:] + order[:1]))
+        if length < best:
+            best, best_order = length, list(order)
+    return best_order
+
+
+def _get_optimizer():
+    """QuantumOptimizer of this process, kept for its compile cache and warm starts"""
+    global _cluster_optimizer
+    from quantum_optimizer import QuantumOptimizer
+    if _cluster_optimizer is None:
+        _cluster_optimizer = QuantumOptimizer()
+    return _cluster_optimizer
+
+
+def _solve_cluster(task):
+    """
+    Worker entry point for one cluster; also called inline
+
+    Returns:
+        (solution, solved_with_qaoa)
+    """
+    optimizer = _get_optimizer()
+    kind = task[0]
+    if kind == 'route':
+        dist = task[1]
+        order = optimizer._qaoa_route(dist) if optimizer.use_quantum else None
+        return (order, True) if order is not None else (_exact_route(dist), False)
+    if kind == 'select':
+        costs, count = task[1], task[2]
+        chosen = optimizer._qaoa_select(costs, count) if optimizer.use_quantum else None
+        return (chosen, True) if chosen is not None else (sorted(np.argsort(costs, kind='stable')[:count].tolist()), False)
+    raise ValueError(f"Unknown cluster task: {kind}")
+
+
+def _chunks(items, size):
+    return [items[k:k + size] for k in range(0, len(items), size)]
+
+
+def _solve_all(tasks):
+    """Solve cluster tasks, concurrently when they run QAOA, preserving order"""
+    # Classical cluster solves are cheaper than pickling them to a pool
+    if len(tasks) <= 1 or DECOMPOSITION_WORKERS <= 1 or not _get_optimizer().use_quantum:
+        return [_solve_cluster(task) for task in tasks]
+    chunksize = max(1, len(tasks) // (DECOMPOSITION_WORKERS * 4))
+    return list(_get_pool().map(_solve_cluster, tasks, chunksize=chunksize))
+
+
+def decompose_warehouse(shelves):
+    """
+    Route every zone as a chain of QAOA-sized clusters
+
+    Each zone's stops are ordered along a nearest-neighbour sweep and cut into
+    clusters of CLUSTER_STOPS. Cluster tours are solved in parallel, then
+    opened at the cheapest point to join the previous cluster, and the stitched
+    zone tour is repaired with 2-opt and Or-opt.
+    """
+    start = time.perf_counter()
+    router = WarehouseRouter(shelves)
+    dist = router.dist
+
+    zones = {}
+    for idx in router.pick_list():
+        zones.setdefault(router.zones[idx], []).append(idx + 1)
+
+    tasks, layout = [], []
+    for zone in sorted(zones):
+        nodes = np.array([0] + zones[zone])
+        sweep = nodes[nearest_neighbour_tour(node_distances(dist, nodes))][1:]
+        clusters = _chunks(sweep.tolist(), CLUSTER_STOPS)
+        for cluster in clusters:
+            tasks.append(('route', dist[np.ix_(cluster, cluster)].tolist()))
+        layout.append((zone, clusters))
+
+    solutions = iter(_solve_all(tasks))
+    deadline = time.perf_counter() + REPAIR_TIME_BUDGET
+    tours, qaoa_clusters, total, baseline = [], 0, 0.0, 0.0
+    for zone, clusters in layout:
+        path = [0]
+        for cluster in clusters:
+            order, used_qaoa = next(solutions)
+            qaoa_clusters += used_qaoa
+            path.extend(_join_cycle(path[-1], [cluster[k] for k in order], dist))
+        tour = np.array(path)
+        stitched = tour_length(tour, dist)
+
+        # Classical repair across cluster boundaries
+        local = node_distances(dist, tour)
+        repaired = improve_tour(np.arange(len(tour)), local, deadline)
+        length = tour_length(repaired, local)
+        total += length
+        baseline += tour_length(np.array([0] + zones[zone]), dist)
+        tours.append({
+            'zone': zone,
+            'stops': [router.ids[tour[k] - 1] for k in repaired[1:]],
+            'distance': round(length, 2),
+            'stitched_distance': round(stitched, 2),
+            'clusters': len(clusters)
+        })
+
+    return {
+        'tours': tours,
+        'total_distance': round(total, 2),
+        'baseline_distance': round(baseline, 2),
+        'stops': sum(len(nodes) for nodes in zones.values()),
+        'clusters': len(tasks),
+        'qaoa_clusters': int(qaoa_clusters),
+        'solve_ms': round((time.perf_counter() - start) * 1000, 2)
+    }
+
+
+def _join_cycle(entry, cycle, dist):
+    """Open a cluster cycle into a path, choosing start and direction closest to entry"""
+    best, best_path = math.inf, cycle
+    n = len(cycle)
+    for direction in (cycle, cycle[::-1]):
+        for k in range(n):
+            path = direction[k:] + direction[:k]
+            cost = dist[entry, path[0]] + sum(dist[a, b] for a, b in zip(path, path[1:]))
+            if cost < best:
+                best, best_path = cost, path
+    return best_path
+
+
+def decompose_hospital(beds):
+    """
+    Choose which free beds to open for admissions, ward by ward
+
+    Free beds (available or cleaning) are grouped by ward and cut into
+    clusters of CLUSTER_BEDS. Each cluster opens TARGET_FILL of its beds at
+    the lowest walk + turnaround cost. The repair step replaces any cluster
+    answer with the wrong bed count and then makes sure each ward opened its
+    cheapest beds, swapping across cluster boundaries where needed.
+    """
+    start = time.perf_counter()
+    assigner = BedAssigner(beds)
+    cost = assigner.walk * WALK_MINUTES_PER_METRE + assigner.ready_in
+    free = np.nonzero(np.isin(assigner.status, ('available', 'cleaning')))[0]
+
+    tasks, layout = [], []
+    for ward in np.unique(assigner.ward[free]):
+        ward_beds = free[assigner.ward[free] == ward]
+        ward_beds = ward_beds[np.argsort(assigner.walk[ward_beds], kind='stable')]
+        for cluster in _chunks(ward_beds.tolist(), CLUSTER_BEDS):
+            count = int(math.ceil(len(cluster) * TARGET_FILL))
+            tasks.append(('select', cost[cluster].tolist(), count))
+            layout.append((int(ward), cluster, count))
+
+    opened = {}
+    qaoa_clusters = repaired = 0
+    for (ward, cluster, count), (chosen, used_qaoa) in zip(layout, _solve_all(tasks)):
+        qaoa_clusters += used_qaoa
+        if len(set(chosen)) != count:
+            chosen = np.argsort(cost[cluster], kind='stable')[:count].tolist()
+            repaired += 1
+        opened.setdefault(ward, []).extend(cluster[k] for k in chosen)
+
+    # Ward-level repair: the ward's quota should go to its cheapest free beds
+    selection = []
+    for ward, chosen in opened.items():
+        ward_beds = free[assigner.ward[free] == ward]
+        best = ward_beds[np.argsort(cost[ward_beds], kind='stable')[:len(chosen)]]
+        if cost[best].sum() < cost[chosen].sum() - 1e-9:
+            repaired += 1
+            chosen = best.tolist()
+        selection.extend(chosen)
+
+    occupied = int(np.isin(assigner.status, ('occupied', 'critical')).sum())
+    num_beds = len(assigner.ids)
+    return {
+        'opened': [assigner.ids[idx] for idx in sorted(selection)],
+        'assignments': len(selection),
+        'utilization': round((occupied + len(selection)) / num_beds * 100, 2) if num_beds else 0.0,
+        'objective': round(float(cost[selection].sum()), 4),
+        'wards': len(opened),
+        'clusters': len(tasks),
+        'qaoa_clusters': int(qaoa_clusters),
+        'repaired': repaired,
+        'solve_ms': round((time.perf_counter() - start) * 1000, 2)
+    }
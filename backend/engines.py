@@ -0,0 +1,98 @@
+"""
+Lazily loaded heavy dependencies
+
+Importing Qiskit or the AI SDKs takes seconds, so none of them is imported
+when a module loads. Each is wrapped in a LazyEngine that loads it on first
+use, or ahead of time in a background thread with warm(), and reports its
+readiness for /api/health:
+
+- cold: nothing has asked for it yet
+- loading: the import is running
+- ready: loaded and usable
+- unavailable: not installed or not configured; callers fall back to the
+  simulated optimizer or mock responses
+- failed: the loader raised an unexpected error
+"""
+import threading
+import time
+
+COLD = 'cold'
+LOADING = 'loading'
+READY = 'ready'
+UNAVAILABLE = 'unavailable'
+FAILED = 'failed'
+
+
+class EngineUnavailable(Exception):
+    """Raised by a loader when its dependency is not installed or not configured"""
+
+
+class LazyEngine:
+    def __init__(self, name, loader):
+        """
+        Args:
+            name: label used in logs and health reports
+            loader: function that imports and sets up the dependency, returning
+                the object callers use; raises EngineUnavailable or ImportError
+                when it cannot be used
+        """
+        self.name = name
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._state = COLD
+        self._value = None
+        self._error = None
+        self._load_ms = None
+
+    def _claim(self):
+        """True for the one caller that gets to run the loader"""
+        with self._lock:
+            if self._state != COLD:
+                return False
+            self._state = LOADING
+            return True
+
+    def _load(self):
+        started = time.perf_counter()
+        value, error = None, None
+        try:
+            value, state = self._loader(), READY
+        except (EngineUnavailable, ImportError) as e:
+            state, error = UNAVAILABLE, str(e)
+        except Exception as e:
+            state, error = FAILED, str(e)
+            print(f"Warning: loading {self.name} failed: {e}")
+        with self._lock:
+            self._state, self._value, self._error = state, value, error
+            self._load_ms = round((time.perf_counter() - started) * 1000, 2)
+        self._done.set()
+
+    def warm(self):
+        """Start loading in a background thread, unless loading already started"""
+        if self._claim():
+            threading.Thread(target=self._load, name=f'warm-{self.name}', daemon=True).start()
+        return self
+
+    def get(self, timeout=None):
+        """
+        The loaded object, loading it in this thread if nobody has started yet
+
+        Returns:
+            None when the engine is unavailable, failed, or still loading after
+            timeout seconds
+        """
+        if self._claim():
+            self._load()
+        self._done.wait(timeout)
+        with self._lock:
+            return self._value if self._state == READY else None
+
+    @property
+    def settled(self):
+        """True once loading has finished, successfully or not"""
+        return self._done.is_set()
+
+    def status(self):
+        with self._lock:
+            return {'state': self._state, 'loadMs': self._load_ms, 'error': self._error}
@@ -0,0 +1,61 @@
+"""
+Server-Sent Events broker for pushing twin state changes to dashboards
+"""
+import json
+import queue
+import threading
+
+
+class EventBroker:
+    def __init__(self, max_queue=256, heartbeat=15):
+        """
+        Args:
+            max_queue: events buffered per client before the oldest are dropped
+            heartbeat: seconds between keep-alive comments on an idle stream
+        """
+        self.max_queue = max_queue
+        self.heartbeat = heartbeat
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def subscribe(self):
+        client = queue.Queue(maxsize=self.max_queue)
+        with self._lock:
+            self._subscribers.add(client)
+        return client
+
+    def unsubscribe(self, client):
+        with self._lock:
+            self._subscribers.discard(client)
+
+    def publish(self, event, data):
+        """Send an event to every connected client. Slow clients lose their oldest events."""
+        message = f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for client in subscribers:
+            while True:
+                try:
+                    client.put_nowait(message)
+                    break
+                except queue.Full:
+                    try:
+                        client.get_nowait()
+                    except queue.Empty:
+                        pass
+
+    def stream(self, client):
+        """Generator of SSE frames for one client; unsubscribes when the client goes away"""
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    yield client.get(timeout=self.heartbeat)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+        finally:
+            self.unsubscribe(client)
@@ -0,0 +1,391 @@
+"""
+Facility layout: floor coordinates, spatial index and walking distances
+
+Shelves and beds get floor coordinates in metres, loaded from x/y columns in
+the upload when present and otherwise derived from their ids:
+
+- shelves fill parallel aisles of SHELVES_PER_AISLE slots, one block of
+  aisles per zone, in shelf number order
+- beds fill ward corridors of WARD_SIZE beds in bed number order, with the
+  nursing station in the middle of each corridor
+
+Both are parallel-aisle floors: x picks the aisle (or corridor) and y is the
+position along it, with cross-aisles at the front (y=0) and back. Walking
+distance follows the aisles. Node 0 of every layout is the dispatch dock /
+ward entrance at the front of the first aisle; point i is node i + 1.
+
+A FacilityLayout precomputes the all-pairs walking distance matrix once (for
+facilities up to DENSE_LIMIT nodes; larger ones compute just the entries
+asked for) and keeps a uniform grid index for nearest-neighbour queries.
+Layouts depend only on ids, zones and coordinates, so layout_for() caches
+them per process and repeated optimizations of the same facility reuse them.
+"""
+import hashlib
+import math
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Warehouse layout parameters (metres)
+SHELVES_PER_AISLE = 20
+SHELF_PITCH = 1.5
+AISLE_SPACING = 3.0
+ZONE_GAP = 6.0
+
+# Hospital layout parameters (metres)
+WARD_SIZE = 20
+BED_PITCH = 4.0
+WARD_SPACING = 8.0
+
+# Nodes up to which the full distance matrix is kept (4096^2 float32 = 64 MB)
+DENSE_LIMIT = 4096
+# Average points per grid cell
+POINTS_PER_CELL = 4
+# Below this many candidates a nearest query just measures them all
+BRUTE_FORCE_LIMIT = 256
+LAYOUT_CACHE_SIZE = 8
+
+_TRAILING_NUMBER = re.compile(r'(\d+)\s*$')
+
+
+def aisle_distance(x1, y1, x2, y2, aisle_length):
+    """
+    Walking distance between points in a parallel-aisle layout (broadcasts)
+
+    Points in the same aisle walk straight along it. Otherwise the walker
+    leaves through the front (y=0) or back cross-aisle, whichever is shorter.
+    """
+    dx = np.abs(x1 - x2)
+    through_front = y1 + y2
+    cross = dx + np.minimum(through_front, 2 * aisle_length - through_front)
+    return np.where(dx < 1e-6, np.abs(y1 - y2), cross)
+
+
+def _id_numbers(ids):
+    """Numeric part of each id (row number when there is none)"""
+    return np.array([
+        int(match.group(1)) if match else idx
+        for idx, match in enumerate(_TRAILING_NUMBER.search(row_id) for row_id in ids.tolist())
+    ], dtype=np.int64)
+
+
+def shelf_coordinates(shelves):
+    """
+    Derive aisle coordinates for a WarehouseDataset
+
+    Shelves are grouped by zone, sorted by the numeric part of shelf_id and
+    filled into aisles of SHELVES_PER_AISLE slots. Each zone occupies its own
+    block of aisles.
+
+    Returns:
+        (x, y) arrays of floats, in row order
+    """
+    numbers = _id_numbers(shelves.ids)
+    x = np.zeros(len(shelves))
+    y = np.zeros(len(shelves))
+    offset = 0.0
+    zone_names = shelves.zone.categories
+    for code in sorted(range(len(zone_names)), key=lambda c: zone_names[c]):
+        members = np.nonzero(shelves.zone.codes == code)[0]
+        if not len(members):
+            continue
+        members = members[np.argsort(numbers[members], kind='stable')]
+        aisle, position = np.divmod(np.arange(len(members)), SHELVES_PER_AISLE)
+        x[members] = offset + aisle * AISLE_SPACING
+        y[members] = SHELF_PITCH * (position + 1)
+        aisles = (len(members) - 1) // SHELVES_PER_AISLE + 1
+        offset += aisles * AISLE_SPACING + ZONE_GAP
+    return x, y
+
+
+def bed_coordinates(beds):
+    """
+    Derive corridor coordinates for a HospitalDataset
+
+    Beds sorted by the numeric part of bed_id fill wards of WARD_SIZE beds,
+    one corridor per ward.
+
+    Returns:
+        (x, y, ward) arrays, in row order
+    """
+    order = np.argsort(_id_numbers(beds.ids), kind='stable')
+    slot = np.empty(len(beds), dtype=np.int64)
+    slot[order] = np.arange(len(beds))
+    ward, position = np.divmod(slot, WARD_SIZE)
+    return ward * WARD_SPACING, BED_PITCH * (position + 1.0), ward
+
+
+class AisleDistances:
+    """
+    Walking distances computed on demand for layouts too large for a full
+    matrix. Indexes like the dense matrix: d[i, j], d[np.ix_(a, b)],
+    d[tour, successors] and d[i] for a whole row.
+    """
+
+    def __init__(self, x, y, aisle_length):
+        self.x = x
+        self.y = y
+        self.aisle_length = aisle_length
+        self.shape = (len(x), len(x))
+
+    def __len__(self):
+        return len(self.x)
+
+    def __getitem__(self, key):
+        rows, cols = key if isinstance(key, tuple) else (key, slice(None))
+        if isinstance(cols, slice):
+            cols = np.arange(len(self.x))[cols]
+        rows, cols = np.broadcast_arrays(np.asarray(rows), np.asarray(cols))
+        return aisle_distance(self.x[rows], self.y[rows], self.x[cols], self.y[cols], self.aisle_length)
+
+
+class SpatialGrid:
+    def __init__(self, x, y, cell_size=None):
+        """
+        Uniform grid over 2-D points for nearest-neighbour search
+
+        Args:
+            x, y: point coordinates
+            cell_size: cell edge in metres (default: about POINTS_PER_CELL points per cell)
+        """
+        self.x = x
+        self.y = y
+        n = len(x)
+        self.x0, self.y0 = (float(x.min()), float(y.min())) if n else (0.0, 0.0)
+        if cell_size is None:
+            width = float(x.max()) - self.x0 if n else 0.0
+            height = float(y.max()) - self.y0 if n else 0.0
+            area = max(width, 1.0) * max(height, 1.0)
+            cell_size = math.sqrt(area * POINTS_PER_CELL / max(n, 1))
+        self.cell_size = cell_size
+        cx, cy = self._cell(x, y)
+        self.nx = int(cx.max()) + 1 if n else 0
+        self.ny = int(cy.max()) + 1 if n else 0
+        cell_ids = cx * max(self.ny, 1) + cy
+        order = np.argsort(cell_ids, kind='stable')
+        distinct, starts = np.unique(cell_ids[order], return_index=True)
+        ends = np.append(starts[1:], n)
+        self._cells = {int(cell): order[start:end] for cell, start, end in zip(distinct, starts, ends)}
+
+    def _cell(self, x, y):
+        return (np.floor((np.asarray(x) - self.x0) / self.cell_size).astype(np.int64),
+                np.floor((np.asarray(y) - self.y0) / self.cell_size).astype(np.int64))
+
+    def _ring(self, cx, cy, radius):
+        """Points in the cells at Chebyshev distance radius from cell (cx, cy)"""
+        found = []
+        for gx in range(max(cx - radius, 0), min(cx + radius, self.nx - 1) + 1):
+            edge = gx in (cx - radius, cx + radius)
+            for gy in (range(cy - radius, cy + radius + 1) if edge else (cy - radius, cy + radius)):
+                if 0 <= gy < self.ny:
+                    members = self._cells.get(gx * self.ny + gy)
+                    if members is not None:
+                        found.append(members)
+        return np.concatenate(found) if found else np.empty(0, dtype=np.int64)
+
+    def nearest(self, px, py, k=1, allowed=None, distance=None, allowed_count=None):
+        """
+        Up to k points closest to (px, py), nearest first
+
+        Args:
+            allowed: optional boolean mask of eligible points
+            allowed_count: number of True entries in allowed, when the caller
+                already knows it (saves a pass over the mask)
+            distance: optional fn(indices) -> distances from the query point;
+                must never be shorter than the straight line (default: straight line)
+
+        Returns:
+            (indices, distances) arrays
+        """
+        if distance is None:
+            def distance(indices):
+                return np.hypot(self.x[indices] - px, self.y[indices] - py)
+
+        if allowed_count is None and allowed is not None:
+            allowed_count = int(allowed.sum())
+        if allowed is not None and allowed_count <= BRUTE_FORCE_LIMIT:
+            candidates = np.flatnonzero(allowed)
+            measured = distance(candidates)
+            order = np.argsort(measured, kind='stable')[:k]
+            return candidates[order], measured[order]
+
+        cx, cy = (int(value) for value in self._cell(px, py))
+        last = max(cx, self.nx - 1 - cx, cy, self.ny - 1 - cy, 0)
+        best_idx = np.empty(0, dtype=np.int64)
+        best_dist = np.empty(0)
+        for radius in range(last + 1):
+            members = self._ring(cx, cy, radius)
+            if allowed is not None and len(members):
+                members = members[allowed[members]]
+            if len(members):
+                best_idx = np.concatenate((best_idx, members))
+                best_dist = np.concatenate((best_dist, distance(members)))
+                order = np.argsort(best_dist, kind='stable')[:k]
+                best_idx, best_dist = best_idx[order], best_dist[order]
+            # Every point beyond this ring is at least radius cells away
+            if len(best_idx) >= k and best_dist[-1] <= radius * self.cell_size:
+                break
+        return best_idx, best_dist
+
+
+class FacilityLayout:
+    def __init__(self, kind, ids, x, y, groups, aisle_length, stations=None, source='derived'):
+        """
+        Args:
+            kind: 'warehouse' or 'hospital'
+            ids: shelf/bed ids in row order
+            x, y: floor coordinates in metres (x picks the aisle, y runs along it)
+            groups: zone code / ward number per point
+            aisle_length: distance between the front and back cross-aisles
+            stations: optional (x, y) of each group's nursing station, indexed by group
+            source: 'derived' from the ids or 'loaded' from the upload
+        """
+        self.kind = kind
+        self.ids = list(ids)
+        self.groups = np.asarray(groups, dtype=np.int64)
+        self.aisle_length = float(aisle_length)
+        self.stations = stations
+        self.source = source
+        # Node 0 is the dock / entrance at the front of the first aisle
+        self.node_x = np.concatenate(([0.0], np.asarray(x, dtype=np.float64))).astype(np.float32)
+        self.node_y = np.concatenate(([0.0], np.asarray(y, dtype=np.float64))).astype(np.float32)
+        self._dist = None
+        self._grid = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def x(self):
+        return self.node_x[1:]
+
+    @property
+    def y(self):
+        return self.node_y[1:]
+
+    @property
+    def dense(self):
+        return len(self.node_x) <= DENSE_LIMIT
+
+    @property
+    def dist(self):
+        """Node-to-node walking distances (node 0 is the dock), built on first use"""
+        with self._lock:
+            if self._dist is None:
+                if self.dense:
+                    x, y = self.node_x, self.node_y
+                    self._dist = aisle_distance(x[:, None], y[:, None], x[None, :], y[None, :], self.aisle_length)
+                else:
+                    self._dist = AisleDistances(self.node_x, self.node_y, self.aisle_length)
+            return self._dist
+
+    @property
+    def grid(self):
+        with self._lock:
+            if self._grid is None:
+                self._grid = SpatialGrid(self.x, self.y)
+            return self._grid
+
+    def walk_from(self, px, py, indices=None):
+        """Walking distance from (px, py) to the given points (default: all)"""
+        x, y = (self.x, self.y) if indices is None else (self.x[indices], self.y[indices])
+        return aisle_distance(np.float32(px), np.float32(py), x, y, self.aisle_length)
+
+    def station_walk(self):
+        """Walking distance from each point to its group's nursing station"""
+        sx, sy = self.stations
+        return aisle_distance(self.x, self.y, sx[self.groups], sy[self.groups], self.aisle_length).astype(np.float64)
+
+    def nearest(self, px, py, k=1, allowed=None, allowed_count=None):
+        """
+        Up to k points closest to (px, py) by walking distance, nearest first
+
+        Returns:
+            (indices, distances) arrays
+        """
+        return self.grid.nearest(px, py, k, allowed, distance=lambda indices: self.walk_from(px, py, indices),
+                                 allowed_count=allowed_count)
+
+    def to_dict(self):
+        return {
+            'kind': self.kind,
+            'source': self.source,
+            'ids': self.ids,
+            'x': np.round(self.x, 3).tolist(),
+            'y': np.round(self.y, 3).tolist(),
+            'group': self.groups.tolist(),
+            'aisleLength': self.aisle_length,
+            'entrance': [0.0, 0.0]
+        }
+
+    @classmethod
+    def for_warehouse(cls, shelves):
+        coordinates = getattr(shelves, 'coordinates', None)
+        if coordinates is not None:
+            x, y = coordinates
+            return cls('warehouse', shelves.ids.tolist(), x, y, shelves.zone.codes,
+                       float(y.max()) + SHELF_PITCH if len(y) else SHELF_PITCH, source='loaded')
+        x, y = shelf_coordinates(shelves)
+        return cls('warehouse', shelves.ids.tolist(), x, y, shelves.zone.codes, SHELF_PITCH * (SHELVES_PER_AISLE + 1))
+
+    @classmethod
+    def for_hospital(cls, beds):
+        coordinates = getattr(beds, 'coordinates', None)
+        if coordinates is not None:
+            # One ward per corridor, with the station halfway along its beds
+            x, y = coordinates
+            corridors, ward = np.unique(x, return_inverse=True)
+            low = np.full(len(corridors), np.inf)
+            high = np.full(len(corridors), -np.inf)
+            np.minimum.at(low, ward, y)
+            np.maximum.at(high, ward, y)
+            stations = (corridors.astype(np.float32), ((low + high) / 2).astype(np.float32))
+            return cls('hospital', beds.ids.tolist(), x, y, ward,
+                       float(y.max()) + BED_PITCH if len(y) else BED_PITCH, stations, source='loaded')
+        x, y, ward = bed_coordinates(beds)
+        wards = int(ward.max()) + 1 if len(ward) else 0
+        stations = (
+            (np.arange(wards) * WARD_SPACING).astype(np.float32),
+            np.full(wards, BED_PITCH * (WARD_SIZE + 1) / 2, dtype=np.float32)
+        )
+        return cls('hospital', beds.ids.tolist(), x, y, ward, BED_PITCH * (WARD_SIZE + 1), stations)
+
+
+_layouts = OrderedDict()
+_layouts_lock = threading.Lock()
+
+
+def _fingerprint(store):
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(store.dataset_type.encode('utf-8'))
+    digest.update(store.ids.tobytes())
+    if store.dataset_type == 'warehouse':
+        digest.update('\0'.join(store.zone.categories).encode('utf-8'))
+        digest.update(store.zone.codes.tobytes())
+    coordinates = getattr(store, 'coordinates', None)
+    if coordinates is not None:
+        digest.update(coordinates[0].tobytes())
+        digest.update(coordinates[1].tobytes())
+    return digest.hexdigest()
+
+
+def layout_for(store):
+    """FacilityLayout for a dataset store, shared by every store with the same ids, zones and coordinates"""
+    key = _fingerprint(store)
+    with _layouts_lock:
+        layout = _layouts.get(key)
+        if layout is not None:
+            _layouts.move_to_end(key)
+            return layout
+    if store.dataset_type == 'warehouse':
+        layout = FacilityLayout.for_warehouse(store)
+    else:
+        layout = FacilityLayout.for_hospital(store)
+    with _layouts_lock:
+        _layouts[key] = layout
+        while len(_layouts) > LAYOUT_CACHE_SIZE:
+            _layouts.popitem(last=False)
+    return layout
@@ -0,0 +1,360 @@
+"""
+Registry of independent facility twins
+
+The backend used to hold exactly one twin: one set of counters, one pair of
+uploaded datasets, one result cache and one simulator. Sites now get a twin
+each, keyed by a facility id:
+
+- Facility bundles everything that belongs to one site: its state backend
+  (counters, mode, datasets), dataset journal, optimization result cache,
+  simulation engine, live simulator and live event stream.
+- FacilityRegistry creates a facility only when asked to (an explicit create
+  or a request that writes data); reads of an id that is neither in memory
+  nor on disk raise FacilityNotFound instead of leaving a directory behind.
+  At most max_facilities exist, and at most max_active of them are kept in
+  memory. Past that, the least recently used idle ones are evicted: their
+  datasets are already on disk (journal or SQLite file) and the journal also
+  saves the counters and mode, so the next request for the facility restores
+  it from there as it was.
+
+A facility is idle when no request is using it (acquire/release), no live
+simulation is running and nobody is subscribed to its stream. Facilities that
+could not be restored (in-memory state without a journal) are never evicted,
+and facilities in use are not either, so max_active is a soft bound.
+
+Loading and closing a facility reads and writes its files, so they run outside
+the registry lock: each one in progress is a Future that requests for the
+same facility wait on, while other facilities are served meanwhile.
+"""
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from event_stream import EventBroker
+from result_cache import ResultCache
+from simulation import SimulationEngine
+from state_backend import LocalStateBackend
+from twin_simulator import LiveSimulation
+
+DEFAULT_FACILITY = 'default'
+DEFAULT_MAX_ACTIVE = 16
+DEFAULT_MAX_FACILITIES = 256
+FACILITY_ID = re.compile(r'^[A-Za-z0-9][A-Za-z0-9_-]{0,63}$')
+
+
+def valid_facility_id(facility_id):
+    """Facility ids name directories on disk, so only letters, digits, _ and - are allowed"""
+    return bool(FACILITY_ID.match(facility_id or ''))
+
+
+class FacilityNotFound(Exception):
+    pass
+
+
+class FacilityLimitError(Exception):
+    pass
+
+
+class Facility:
+    """One site's twin"""
+
+    def __init__(self, facility_id, state, defaults, journal=None):
+        """
+        Args:
+            facility_id: id the facility is addressed by
+            state: StateBackend holding this facility's counters and datasets
+            defaults: initial values of the counters, mode etc. for a new facility
+            journal: optional TwinJournal its datasets and values are recorded in and restored from
+        """
+        self.id = facility_id
+        self.state = state
+        self.journal = journal
+        self.value_keys = list(defaults)
+        if journal:
+            state.initialize(journal.load_values())
+        state.initialize(defaults)
+        # Seeded source of every simulated value for this facility (see
+        # simulation.py); other facilities derive their own seed from SIM_SEED
+        self.simulation = SimulationEngine.from_env(None if facility_id == DEFAULT_FACILITY else facility_id)
+        self.results = ResultCache.from_env()
+        self.events = EventBroker()
+        self.live_simulation = LiveSimulation(
+            self.simulation, state, self._publish_live_simulation, wrap_update=self.journaled
+        )
+        self.users = 0
+        self.last_used = time.time()
+        if journal:
+            self.restore_datasets()
+
+    @property
+    def persistent(self):
+        """Whether the datasets survive eviction"""
+        return self.journal is not None or self.state.name != LocalStateBackend.name
+
+    def busy(self):
+        return self.live_simulation.running or self.events.subscriber_count() > 0
+
+    def restore_datasets(self):
+        for dataset_type in ('hospital', 'warehouse'):
+            started = time.perf_counter()
+            restored = self.journal.restore(dataset_type)
+            if restored is None:
+                continue
+            store, info = restored
+            self.state.set_dataset(dataset_type, store)
+            if info:
+                self.state.set('dataset', info)
+            self.state.set('mode', {'demo': False, 'custom': True})
+            print(f"Restored {len(store)} {dataset_type} rows of facility {self.id} from "
+                  f"{self.journal.directory} in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    def replace_dataset(self, dataset_type, store, info):
+        """Install an uploaded store, journaled under the same lock so no simulator tick slips in between"""
+        on_set = (lambda store: self.journal.snapshot(dataset_type, store, info)) if self.journal else None
+        self.state.set_dataset(dataset_type, store, on_set)
+
+    def journaled(self, dataset_type, source, fn):
+        """fn for state.update_dataset, recording the rows it changes in the journal"""
+        return self.journal.recording(dataset_type, source, fn) if self.journal else fn
+
+    def mode(self):
+        return self.state.get('mode')
+
+    def custom_dataset(self, dataset_type, mode=None, copy=False):
+        """
+        Uploaded DatasetStore for the type while in custom mode, else None
+
+        Args:
+            copy: return a copy that stays consistent while the twin keeps
+                changing, e.g. for a job that pickles it later
+        """
+        mode = mode or self.mode()
+        if not mode['custom']:
+            return None
+        return self.state.copy_dataset(dataset_type) if copy else self.state.get_dataset(dataset_type)
+
+    def hospital_summary(self, store=None):
+        """Hospital counters without the per-bed payload; an uploaded store supplies its own counters (O(1))"""
+        stats = self.state.get('hospital')
+        if store:
+            stats.update(store.summary())
+        return stats
+
+    def warehouse_summary(self, store=None):
+        """Warehouse counters without the per-shelf payload; an uploaded store supplies its own counters (O(1))"""
+        stats = self.state.get('warehouse')
+        if store:
+            stats.update(store.summary())
+        return stats
+
+    def invalidate_results(self):
+        """Forget cached optimization results after the twin's data changed"""
+        self.state.update('resultsGeneration', lambda generation: (generation or 0) + 1)
+        self.results.clear()
+
+    def publish_changes(self, changed_beds, changed_shelves):
+        """Push updated counters plus only the rows that changed"""
+        if changed_beds:
+            self.events.publish('hospital', dict(
+                self.hospital_summary(self.state.get_dataset('hospital')), changedBeds=changed_beds
+            ))
+        if changed_shelves:
+            self.events.publish('warehouse', dict(
+                self.warehouse_summary(self.state.get_dataset('warehouse')), changedShelves=changed_shelves
+            ))
+
+    def _publish_live_simulation(self, changed_beds, changed_shelves, status):
+        self.publish_changes(changed_beds, changed_shelves)
+        self.events.publish('simulation', status)
+
+    def status(self):
+        mode = self.mode()
+        return {
+            'id': self.id,
+            'active': True,
+            'mode': 'custom' if mode['custom'] else 'demo' if mode['demo'] else 'random',
+            'dataset': self.state.get('dataset'),
+            'simulationRunning': self.live_simulation.running,
+            'subscribers': self.events.subscriber_count(),
+            'lastUsed': self.last_used
+        }
+
+    def save_values(self):
+        """Write the counters and mode to the journal so they survive eviction"""
+        if self.journal:
+            self.journal.save_values({key: self.state.get(key) for key in self.value_keys})
+
+    def close(self):
+        self.live_simulation.stop()
+        if self.journal:
+            self.save_values()
+            self.journal.close()
+
+
+class FacilityRegistry:
+    def __init__(self, create, max_active=DEFAULT_MAX_ACTIVE, directory=None, max_facilities=DEFAULT_MAX_FACILITIES):
+        """
+        Args:
+            create: fn(facility_id) building a Facility, restoring it from disk
+                when it was evicted (or the process restarted)
+            max_active: facilities kept in memory before idle ones are evicted
+            directory: optional folder with one subdirectory per facility
+                stored on disk, listed by ids()
+            max_facilities: facilities that may exist, in memory or on disk
+        """
+        self.create = create
+        self.max_active = max_active
+        self.directory = directory
+        self.max_facilities = max_facilities
+        self._active = OrderedDict()  # id -> Facility, least recently used first
+        self._pending = {}            # id -> Future of a load or close in progress
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.evictions = 0
+
+    def _stored(self, facility_id):
+        return facility_id == DEFAULT_FACILITY or bool(
+            self.directory and os.path.isdir(os.path.join(self.directory, facility_id))
+        )
+
+    def exists(self, facility_id):
+        """Whether the facility is in memory or stored on disk"""
+        with self._lock:
+            return facility_id in self._active or facility_id in self._pending or self._stored(facility_id)
+
+    def acquire(self, facility_id, create=False):
+        """
+        The facility for facility_id, loaded if needed; hand it back with
+        release() when done so it can be evicted again
+
+        Args:
+            create: create the facility if it does not exist yet
+
+        Raises:
+            ValueError for an invalid facility id
+            FacilityNotFound if it does not exist and create is False
+            FacilityLimitError if creating it would exceed max_facilities
+        """
+        if not valid_facility_id(facility_id):
+            raise ValueError(f'Invalid facility id: {facility_id}')
+        while True:
+            with self._lock:
+                facility = self._active.get(facility_id)
+                if facility is not None:
+                    self._active.move_to_end(facility_id)
+                    facility.users += 1
+                    facility.last_used = time.time()
+                    evicted = self._evict()
+                    break
+                pending = self._pending.get(facility_id)
+                if pending is None:
+                    if not self._stored(facility_id):
+                        if not create:
+                            raise FacilityNotFound(f'Unknown facility: {facility_id}')
+                        if len(self._ids()) >= self.max_facilities:
+                            raise FacilityLimitError(f'Facility limit reached ({self.max_facilities})')
+                    loading = self._pending[facility_id] = Future()
+            if pending is not None:
+                # Another request is loading it, or it is being closed after
+                # eviction; wait and look again
+                try:
+                    pending.result()
+                except Exception:
+                    pass
+                continue
+            facility, evicted = self._load(facility_id, loading)
+            break
+        self._close(evicted)
+        return facility
+
+    def _load(self, facility_id, loading):
+        """Build the facility outside the lock and make it active, in use by the caller"""
+        try:
+            facility = self.create(facility_id)
+        except BaseException as e:
+            with self._lock:
+                del self._pending[facility_id]
+            loading.set_exception(e)
+            raise
+        with self._lock:
+            del self._pending[facility_id]
+            self._active[facility_id] = facility
+            self.loads += 1
+            facility.users += 1
+            facility.last_used = time.time()
+            evicted = self._evict()
+        loading.set_result(facility)
+        return facility, evicted
+
+    def release(self, facility):
+        with self._lock:
+            facility.users -= 1
+            facility.last_used = time.time()
+            evicted = self._evict()
+        self._close(evicted)
+
+    def _evict(self):
+        """
+        Drop least recently used idle facilities past max_active; call with the
+        lock held. Each stays pending until _close has saved and closed it.
+        """
+        evicted = []
+        for facility_id, facility in list(self._active.items()):
+            if len(self._active) <= self.max_active:
+                break
+            if facility.users or facility.busy() or not facility.persistent:
+                continue
+            del self._active[facility_id]
+            self._pending[facility_id] = Future()
+            evicted.append(facility)
+        self.evictions += len(evicted)
+        return evicted
+
+    def _close(self, facilities):
+        for facility in facilities:
+            try:
+                facility.close()
+            except Exception as e:
+                print(f"Warning: closing facility {facility.id} failed: {e}")
+            with self._lock:
+                closing = self._pending.pop(facility.id)
+            closing.set_result(None)
+
+    def close(self):
+        """Save and close every facility in memory, e.g. when the server stops"""
+        with self._lock:
+            facilities = list(self._active.values())
+            self._active.clear()
+            for facility in facilities:
+                self._pending[facility.id] = Future()
+        self._close(facilities)
+
+    def active(self):
+        """Facilities currently in memory, least recently used first"""
+        with self._lock:
+            return list(self._active.values())
+
+    def ids(self):
+        """Ids of the facilities in memory and of those stored on disk"""
+        with self._lock:
+            return sorted(self._ids())
+
+    def _ids(self):
+        ids = {DEFAULT_FACILITY} | set(self._active) | set(self._pending)
+        if self.directory and os.path.isdir(self.directory):
+            ids.update(name for name in os.listdir(self.directory)
+                       if valid_facility_id(name) and os.path.isdir(os.path.join(self.directory, name)))
+        return ids
+
+    def stats(self):
+        with self._lock:
+            return {
+                'active': len(self._active),
+                'maxActive': self.max_active,
+                'maxFacilities': self.max_facilities,
+                'loads': self.loads,
+                'evictions': self.evictions
+            }
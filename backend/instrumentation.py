@@ -0,0 +1,160 @@
+"""
+Lightweight instrumentation: phase timers, histograms and a Prometheus text endpoint
+
+PhaseTimer measures the phases of one optimization run inside the worker
+process; the timings travel back with the result. MetricsRegistry holds
+counters, gauges and fixed-bucket histograms in the web process and renders
+them in the Prometheus text exposition format for a local scraper.
+instrument_app() records a latency histogram per Flask route.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, request
+
+# Seconds; tuned for the spread between O(1) stats reads and QAOA solves
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class PhaseTimer:
+    """Wall-clock milliseconds per named phase; repeated phases accumulate"""
+
+    def __init__(self):
+        self.phases = {}
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + (time.perf_counter() - start) * 1000
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self._start) * 1000
+
+    def report(self):
+        """Rounded phase timings plus the total, for attaching to a result"""
+        timings = {f'{name}_ms': round(ms, 3) for name, ms in self.phases.items()}
+        timings['total_ms'] = round(self.elapsed_ms(), 3)
+        return timings
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    def __init__(self):
+        # name -> {'type', 'help', 'samples': {labels tuple: value or Histogram}}
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _family(self, name, kind, help_text):
+        family = self._metrics.get(name)
+        if family is None:
+            family = self._metrics[name] = {'type': kind, 'help': help_text, 'samples': {}}
+        return family
+
+    def counter(self, name, help_text=''):
+        with self._lock:
+            self._family(name, 'counter', help_text)
+
+    def gauge(self, name, help_text=''):
+        with self._lock:
+            self._family(name, 'gauge', help_text)
+
+    def histogram(self, name, help_text='', buckets=LATENCY_BUCKETS):
+        with self._lock:
+            self._family(name, 'histogram', help_text)['buckets'] = buckets
+
+    def inc(self, name, value=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            samples = self._family(name, 'counter', '')['samples']
+            samples[key] = samples.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._family(name, 'gauge', '')['samples'][key] = value
+
+    def observe(self, name, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            family = self._family(name, 'histogram', '')
+            histogram = family['samples'].get(key)
+            if histogram is None:
+                histogram = family['samples'][key] = Histogram(family.get('buckets', LATENCY_BUCKETS))
+            histogram.observe(value)
+
+    def add_collector(self, collect):
+        """Register fn(registry) called before each render, e.g. to set gauges from live objects"""
+        self._collectors.append(collect)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        for collect in self._collectors:
+            collect(self)
+        lines = []
+        with self._lock:
+            for name, family in sorted(self._metrics.items()):
+                if family['help']:
+                    lines.append(f"# HELP {name} {family['help']}")
+                lines.append(f"# TYPE {name} {family['type']}")
+                for key, sample in sorted(family['samples'].items()):
+                    if family['type'] == 'histogram':
+                        cumulative = 0
+                        for bound, count in zip(sample.buckets + (float('inf'),), sample.counts):
+                            cumulative += count
+                            le = '+Inf' if bound == float('inf') else repr(bound)
+                            lines.append(f"{name}_bucket{_labels(key + (('le', le),))} {cumulative}")
+                        lines.append(f"{name}_sum{_labels(key)} {sample.sum!r}")
+                        lines.append(f"{name}_count{_labels(key)} {sample.count}")
+                    else:
+                        lines.append(f"{name}{_labels(key)} {sample!r}")
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(key):
+    if not key:
+        return ''
+    return '{' + ','.join(f'{label}="{_escape(value)}"' for label, value in key) + '}'
+
+
+def instrument_app(app, registry, metric='http_request_duration_seconds'):
+    """Record a request latency histogram per route template, method and status"""
+    registry.histogram(metric, 'Flask request latency by route')
+
+    @app.before_request
+    def _start_timer():
+        g._request_start = time.perf_counter()
+
+    @app.after_request
+    def _observe_latency(response):
+        start = getattr(g, '_request_start', None)
+        if start is not None:
+            route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+            registry.observe(
+                metric, time.perf_counter() - start,
+                route=route, method=request.method, status=response.status_code
+            )
+        return response
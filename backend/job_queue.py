@@ -0,0 +1,287 @@
+"""
+Bounded job queue that runs optimizations on a process pool
+
+Jobs get an id at once and are polled or waited on by id; each carries an
+owner (the facility that submitted it) and is invisible to other owners. At
+most max_pending jobs run or wait at a time; submit raises QueueFullError past
+that. When a worker dies (out of memory, crash) the pool breaks: its jobs
+fail, and the next submission starts a fresh pool. PoolUnavailableError is
+raised only if that pool cannot start either. Finished jobs are kept for
+lookups until max_history newer ones have finished.
+"""
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+
+
+class QueueFullError(Exception):
+    """Raised when the queue already holds its maximum number of pending jobs"""
+
+
+class PoolUnavailableError(Exception):
+    """Raised when no working process pool could be started for a job"""
+
+
+class OptimizationJobQueue:
+    def __init__(self, max_workers=2, max_pending=8, max_history=256, on_complete=None, initializer=None):
+        """
+        Args:
+            max_workers: size of the worker process pool
+            max_pending: queued + running jobs allowed before submissions are rejected
+            max_history: finished jobs kept around for status/result lookups
+            on_complete: optional callback invoked with the job dict once it finishes
+            initializer: optional function each worker process runs before taking jobs
+        """
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.max_history = max_history
+        self.on_complete = on_complete
+        self.initializer = initializer
+        self._executor = None
+        self._jobs = OrderedDict()
+        self._futures = {}
+        self._events = {}
+        self._started = {}
+        self._lock = threading.Lock()
+        # Notified whenever a job finishes, for as_completed()
+        self._finished = threading.Condition(self._lock)
+
+    def _get_executor(self):
+        # Created lazily so importing the app does not fork workers
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers, initializer=self.initializer)
+        return self._executor
+
+    def _drop_executor(self, executor):
+        """
+        Forget a pool whose worker died, so the next submit starts a fresh
+        one; returns it for _shutdown. Call with the lock held.
+        """
+        if self._executor is executor:
+            self._executor = None
+            return executor
+        return None
+
+    @staticmethod
+    def _shutdown(executor):
+        # Not cancel_futures: cancelling runs job callbacks, which take the
+        # lock, in this thread. A broken pool fails its pending jobs itself.
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def _submit_to_pool(self, fn, *args, **kwargs):
+        """
+        (executor, future) for fn on the pool, replacing a broken pool once.
+        Call with the lock held.
+
+        Raises:
+            PoolUnavailableError if the fresh pool is broken too
+        """
+        executor = self._get_executor()
+        try:
+            return executor, executor.submit(fn, *args, **kwargs)
+        except BrokenProcessPool:
+            self._shutdown(self._drop_executor(executor))
+        executor = self._get_executor()
+        try:
+            return executor, executor.submit(fn, *args, **kwargs)
+        except BrokenProcessPool as e:
+            self._shutdown(self._drop_executor(executor))
+            raise PoolUnavailableError(f'Optimizer worker pool unavailable: {e}')
+
+    def warm_up(self, fn, *args):
+        """
+        Start the worker pool now and run fn(*args) in it, blocking until it
+        returns. Not tracked as a job and not counted against max_pending.
+        """
+        with self._lock:
+            executor, future = self._submit_to_pool(fn, *args)
+        try:
+            return future.result()
+        except BrokenProcessPool:
+            with self._lock:
+                broken = self._drop_executor(executor)
+            self._shutdown(broken)
+            raise
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._futures)
+
+    def submit(self, job_type, fn, *args, owner=None, **kwargs):
+        """
+        Queue fn(*args, **kwargs) on the worker pool
+
+        Args:
+            owner: optional id of whoever the job belongs to, kept on the job
+                so lookups can be limited to it
+
+        Returns:
+            the new job id
+
+        Raises:
+            QueueFullError if max_pending jobs are already queued or running
+            PoolUnavailableError if the worker pool is broken and could not be restarted
+        """
+        with self._lock:
+            if len(self._futures) >= self.max_pending:
+                raise QueueFullError(f'Optimization queue is full ({self.max_pending} jobs pending)')
+
+            job_id = uuid.uuid4().hex
+            self._jobs[job_id] = {
+                'id': job_id,
+                'type': job_type,
+                'owner': owner,
+                'status': 'queued',
+                'submittedAt': datetime.now().isoformat(),
+                'finishedAt': None,
+                'durationMs': None,
+                'result': None,
+                'error': None,
+                'cached': False
+            }
+            try:
+                executor, future = self._submit_to_pool(fn, *args, **kwargs)
+            except PoolUnavailableError:
+                del self._jobs[job_id]
+                raise
+            self._futures[job_id] = future
+            self._events[job_id] = threading.Event()
+            self._started[job_id] = time.perf_counter()
+
+        future.add_done_callback(lambda f: self._finish(job_id, f, executor))
+        return job_id
+
+    def _finish(self, job_id, future, executor):
+        broken = None
+        with self._lock:
+            self._futures.pop(job_id, None)
+            event = self._events.pop(job_id, None)
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job['finishedAt'] = datetime.now().isoformat()
+            # Submit to finish, queue wait included
+            started = self._started.pop(job_id, None)
+            if started is not None:
+                job['durationMs'] = round((time.perf_counter() - started) * 1000, 2)
+            try:
+                job['result'] = future.result()
+                job['status'] = 'done'
+            except BrokenProcessPool:
+                # A worker died (out of memory, crash): every job on that pool
+                # fails, and the next submit starts a new pool
+                job['error'] = 'Optimizer worker exited unexpectedly'
+                job['status'] = 'failed'
+                broken = self._drop_executor(executor)
+            except Exception as e:
+                job['error'] = str(e)
+                job['status'] = 'failed'
+            self._trim_history()
+            snapshot = dict(job)
+            self._finished.notify_all()
+        self._shutdown(broken)
+
+        if self.on_complete:
+            try:
+                self.on_complete(snapshot)
+            except Exception as e:
+                print(f"Warning: job completion hook failed: {e}")
+        if event is not None:
+            event.set()
+
+    def add_finished(self, job_type, result, owner=None):
+        """
+        Record a job that is already done, e.g. a cached result, without
+        running anything or calling on_complete
+
+        Returns:
+            the new job id
+        """
+        now = datetime.now().isoformat()
+        with self._lock:
+            job_id = uuid.uuid4().hex
+            self._jobs[job_id] = {
+                'id': job_id,
+                'type': job_type,
+                'owner': owner,
+                'status': 'done',
+                'submittedAt': now,
+                'finishedAt': now,
+                'durationMs': 0.0,
+                'result': result,
+                'error': None,
+                'cached': True
+            }
+            self._trim_history()
+            self._finished.notify_all()
+        return job_id
+
+    def _trim_history(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job_id not in self._futures]
+        for job_id in finished[:max(0, len(finished) - self.max_history)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id, owner=None):
+        """Return a copy of the job dict, or None if unknown (or, given an owner, not that owner's)"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or (owner is not None and job['owner'] != owner):
+                return None
+            future = self._futures.get(job_id)
+            if future is not None and future.running():
+                job['status'] = 'running'
+            return dict(job)
+
+    def wait(self, job_id, timeout=None, owner=None):
+        """Block until the job finishes or timeout (seconds) expires, then return its state"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or (owner is not None and job['owner'] != owner):
+                return None
+            event = self._events.get(job_id)
+        if event is not None:
+            event.wait(timeout)
+        return self.get(job_id, owner)
+
+    def as_completed(self, job_ids, timeout=None):
+        """
+        Yield (job_id, final state) for each job as it finishes, in completion order
+
+        Stops early once timeout (seconds, overall) expires; the state of an
+        unknown job id (e.g. trimmed from history) is None.
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        remaining = list(job_ids)
+        while remaining:
+            with self._finished:
+                while True:
+                    done = [job_id for job_id in remaining if job_id not in self._futures]
+                    if done:
+                        break
+                    wait = deadline - time.monotonic() if deadline is not None else None
+                    if wait is not None and wait <= 0:
+                        return
+                    self._finished.wait(wait)
+                states = [dict(self._jobs[job_id]) if job_id in self._jobs else None for job_id in done]
+            for job_id, job in zip(done, states):
+                remaining.remove(job_id)
+                yield job_id, job
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pending': len(self._futures),
+                'maxPending': self.max_pending,
+                'workers': self.max_workers,
+                'tracked': len(self._jobs)
+            }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
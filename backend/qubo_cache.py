@@ -0,0 +1,137 @@
+"""
+Compilation cache for QAOA problems keyed on problem structure
+
+Building a QuadraticProgram variable by variable, converting it to a QUBO /
+Ising operator and constructing the QAOA ansatz is the same work every time a
+facility of the same shape is optimized. A CompiledQubo keeps the constraint
+(penalty) part of the Ising operator and an ansatz whose objective
+coefficients are circuit parameters, so a new solve only rebinds numbers.
+
+Qiskit is imported inside the methods: this module is only used once the
+optimizer has loaded it (see engines.py), and importing it here would undo
+the lazy load.
+"""
+from collections import OrderedDict
+
+DEFAULT_CACHE_SIZE = 32
+
+
+class QubitLimitError(Exception):
+    """The compiled problem needs more qubits than the caller allows"""
+
+
+class CompiledQubo:
+    def __init__(self, key, template, penalty, reps, max_qubits=None):
+        """
+        Compile a QuadraticProgram template whose constraints are fixed and
+        whose objective is purely linear in the original variables.
+
+        Args:
+            key: structure key the entry is cached under
+            template: QuadraticProgram with variables and constraints (objective ignored)
+            penalty: constraint penalty; must dominate any objective it will be bound with
+            reps: QAOA layers in the ansatz
+            max_qubits: optional qubit limit, checked before the ansatz is built
+
+        Raises:
+            QubitLimitError if the QUBO (with slack variables) exceeds max_qubits
+        """
+        self.key = key
+        self.template = template
+        self.variable_names = [variable.name for variable in template.variables]
+        self.reps = reps
+
+        # Constraint part of the Ising operator, compiled once with a fixed
+        # penalty so it does not depend on the cost coefficients
+        from qiskit_optimization.converters import QuadraticProgramToQubo
+
+        template.minimize(constant=0)
+        self.converter = QuadraticProgramToQubo(penalty=penalty)
+        qubo = self.converter.convert(template)
+        self.penalty_operator, self.penalty_offset = qubo.to_ising()
+        self.num_qubits = self.penalty_operator.num_qubits
+        if max_qubits is not None and self.num_qubits > max_qubits:
+            raise QubitLimitError(f'{self.num_qubits} qubits exceed the limit of {max_qubits}')
+        self.ansatz = self._build_ansatz()
+
+    def _build_ansatz(self):
+        """QAOA circuit with gamma/beta per layer and one parameter per objective coefficient"""
+        from qiskit import QuantumCircuit
+        from qiskit.circuit import ParameterVector
+
+        gammas = ParameterVector('gamma', self.reps)
+        betas = ParameterVector('beta', self.reps)
+        self.coefficients = ParameterVector('h', len(self.variable_names))
+
+        circuit = QuantumCircuit(self.num_qubits)
+        circuit.h(range(self.num_qubits))
+        for layer in range(self.reps):
+            gamma = gammas[layer]
+            for label, weight in self.penalty_operator.to_list():
+                qubits = [q for q, pauli in enumerate(reversed(label)) if pauli == 'Z']
+                angle = 2 * float(weight.real) * gamma
+                if len(qubits) == 1:
+                    circuit.rz(angle, qubits[0])
+                elif len(qubits) == 2:
+                    circuit.rzz(angle, qubits[0], qubits[1])
+            # Objective x_i = (1 - Z_i) / 2 contributes -h_i / 2 on Z_i
+            for qubit, h in enumerate(self.coefficients):
+                circuit.rz(-h * gamma, qubit)
+            circuit.rx(2 * betas[layer], range(self.num_qubits))
+        return circuit
+
+    def bind(self, linear):
+        """
+        Rebind the objective coefficients
+
+        Args:
+            linear: dict of variable name -> coefficient
+
+        Returns:
+            (cost operator, offset, ansatz with only gamma/beta left free)
+        """
+        from qiskit.quantum_info import SparsePauliOp
+
+        values = [float(linear.get(name, 0.0)) for name in self.variable_names]
+        objective = SparsePauliOp.from_sparse_list(
+            [('Z', [qubit], -value / 2) for qubit, value in enumerate(values)],
+            num_qubits=self.num_qubits
+        )
+        operator = (self.penalty_operator + objective).simplify()
+        offset = self.penalty_offset + sum(values) / 2
+        ansatz = self.ansatz.assign_parameters(dict(zip(self.coefficients, values)))
+        return operator, offset, ansatz
+
+    def interpret(self, bitstring):
+        """Map a measured bitstring (qubit 0 rightmost) back to the template variables"""
+        bits = [int(bit) for bit in reversed(bitstring)]
+        return dict(zip(self.variable_names, self.converter.interpret(bits)))
+
+
+class QuboCache:
+    def __init__(self, max_entries=DEFAULT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_compile(self, key, build_template, penalty, reps, max_qubits=None):
+        """
+        Return the compiled entry for key, building it with build_template()
+        on a miss. Least recently used entries are evicted past max_entries.
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+        self.misses += 1
+        entry = CompiledQubo(key, build_template(), penalty, reps, max_qubits)
+        self._entries[key] = entry
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return entry
+
+    def stats(self):
+        return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,83 @@
+"""
+Cache of finished optimization results keyed on the twin's data state
+
+Asking for the same optimization twice (a repeated voice command, a dashboard
+refresh) while the data has not changed would redo the whole solve. Results
+are kept under a key that includes the dataset generation and version, so any
+change to the data produces a new key; entries also expire after a TTL and the
+least recently used ones are evicted past max_entries.
+
+Configure with RESULT_CACHE_SIZE (entries, 0 disables) and RESULT_CACHE_TTL
+(seconds).
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_CACHE_SIZE = 64
+DEFAULT_TTL = 300.0
+
+
+class ResultCache:
+    def __init__(self, max_entries=DEFAULT_CACHE_SIZE, ttl=DEFAULT_TTL):
+        """
+        Args:
+            max_entries: results kept before the least recently used is evicted (0 disables caching)
+            ttl: seconds a result stays valid
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, result)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_entries=int(os.environ.get('RESULT_CACHE_SIZE', DEFAULT_CACHE_SIZE)),
+            ttl=float(os.environ.get('RESULT_CACHE_TTL', DEFAULT_TTL))
+        )
+
+    def get(self, key):
+        """Cached result for key, or None on a miss or when it has expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, result):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'maxEntries': self.max_entries,
+                'ttlSeconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hitRate': round(self.hits / lookups, 3) if lookups else None
+            }
@@ -0,0 +1,128 @@
+"""
+What-if scenarios for batch optimization
+
+A scenario is a small dict of overrides applied to the uploaded dataset, or to
+the built-in demo problem when nothing is uploaded, before it is optimized:
+
+- hospital: beds (resize the ward: drop the last beds or add empty ones),
+  admissions (incoming patients to place on top of the current ones)
+- warehouse: shelves (resize: drop the last shelves or add empty ones),
+  capacityScale (multiply every shelf's capacity; items are capped to it)
+
+For the demo problems beds/shelves set the size of the QAOA model instead.
+Scenarios with the same structure_key() have the same layout, so a worker
+builds the layout (or compiles the QAOA model) once for all of them.
+"""
+import re
+
+import numpy as np
+
+from dataset_store import HospitalDataset, WarehouseDataset
+
+SCENARIO_FIELDS = {
+    'hospital': {'beds': int, 'admissions': int},
+    'warehouse': {'shelves': int, 'capacityScale': float}
+}
+# Demo QAOA sizes: one qubit per bed, n*(n-1) per route
+DEMO_LIMITS = {'beds': (2, 16), 'shelves': (2, 8)}
+MAX_RESIZE = 100000
+MAX_CAPACITY_SCALE = 100.0
+
+_TRAILING_NUMBER = re.compile(r'(\d+)\s*$')
+
+
+def validate_scenario(problem_type, spec, has_dataset):
+    """
+    Normalized overrides for one scenario
+
+    Raises:
+        ValueError for unknown fields or out-of-range values
+    """
+    fields = SCENARIO_FIELDS[problem_type]
+    unknown = set(spec) - set(fields)
+    if unknown:
+        raise ValueError(f"Unknown {problem_type} scenario field: {', '.join(sorted(unknown))}")
+    scenario = {}
+    for name, value in spec.items():
+        if value is None:
+            continue
+        try:
+            value = fields[name](value)
+        except (TypeError, ValueError):
+            raise ValueError(f'{name} must be a number')
+        low, high = (0.0, MAX_CAPACITY_SCALE) if name == 'capacityScale' else (0, MAX_RESIZE)
+        if name in DEMO_LIMITS and not has_dataset:
+            low, high = DEMO_LIMITS[name]
+        elif name in ('beds', 'shelves'):
+            low = 1
+        if not low <= value <= high:
+            raise ValueError(f'{name} must be between {low} and {high}')
+        scenario[name] = value
+    if not has_dataset and problem_type == 'hospital' and 'admissions' in scenario:
+        raise ValueError('admissions needs an uploaded hospital dataset')
+    if not has_dataset and 'capacityScale' in scenario:
+        raise ValueError('capacityScale needs an uploaded warehouse dataset')
+    return scenario
+
+
+def structure_key(problem_type, has_dataset, scenario):
+    """Scenarios with equal keys share a layout / compiled model"""
+    size = scenario.get('beds' if problem_type == 'hospital' else 'shelves')
+    return (problem_type, 'dataset' if has_dataset else 'demo', -1 if size is None else size)
+
+
+def _new_ids(ids, count, prefix=''):
+    """count ids numbered after the highest trailing number in ids"""
+    numbers = [int(match.group(1)) for match in map(_TRAILING_NUMBER.search, ids.tolist()) if match]
+    start = max(numbers, default=len(ids)) + 1
+    width = max((len(match.group(1)) for match in map(_TRAILING_NUMBER.search, ids[:1].tolist()) if match), default=0)
+    return np.array([f'{prefix}{number:0{width}d}' for number in range(start, start + count)], dtype=str)
+
+
+def _resize_hospital(beds, size):
+    n = len(beds)
+    if size <= n:
+        return HospitalDataset(beds.ids[:size], beds.patient_ids[:size], beds.status.values()[:size],
+                               beds.last_updated[:size], beds.category.values()[:size])
+    extra = size - n
+    return HospitalDataset(
+        np.concatenate((beds.ids, _new_ids(beds.ids, extra))),
+        np.concatenate((beds.patient_ids, np.full(extra, '', dtype=str))),
+        np.concatenate((beds.status.values(), np.full(extra, 'available'))),
+        np.concatenate((beds.last_updated, np.full(extra, np.nan))),
+        np.concatenate((beds.category.values(), np.full(extra, 'general')))
+    )
+
+
+def _resize_warehouse(shelves, size):
+    n = len(shelves)
+    zones = shelves.zone.values()
+    if size <= n:
+        return WarehouseDataset(shelves.ids[:size], shelves.capacity[:size], shelves.item_count[:size], zones[:size])
+    extra = size - n
+    # New empty shelves go round-robin into the existing zones, sized like the average shelf
+    names = sorted(set(zones.tolist())) or ['default']
+    capacity = int(round(float(shelves.capacity.mean()))) if n else 100
+    return WarehouseDataset(
+        np.concatenate((shelves.ids, _new_ids(shelves.ids, extra, prefix='N-'))),
+        np.concatenate((shelves.capacity, np.full(extra, capacity))),
+        np.concatenate((shelves.item_count, np.zeros(extra, dtype=np.int32))),
+        np.concatenate((zones, np.array([names[k % len(names)] for k in range(extra)], dtype=str)))
+    )
+
+
+def apply_scenario(problem_type, dataset, scenario):
+    """A new dataset store with the scenario's overrides applied (the input is left alone)"""
+    if problem_type == 'hospital':
+        if scenario.get('beds') is not None and scenario['beds'] != len(dataset):
+            return _resize_hospital(dataset, scenario['beds'])
+        return dataset
+
+    shelves = dataset
+    if scenario.get('shelves') is not None and scenario['shelves'] != len(shelves):
+        shelves = _resize_warehouse(shelves, scenario['shelves'])
+    scale = scenario.get('capacityScale')
+    if scale is not None and scale != 1.0:
+        capacity = np.round(shelves.capacity * scale).astype(np.int32)
+        shelves = WarehouseDataset(shelves.ids, capacity, np.minimum(shelves.item_count, capacity), shelves.zone.values())
+    return shelves
@@ -0,0 +1,345 @@
+"""
+Seedable simulation engine for the digital twin
+
+Everything in the twin that is simulated rather than measured draws from one
+SimulationEngine: the optimizer's fallback results, the random-mode counters,
+the demo cost/energy cards and the /api/demo/simulate workload. With a seed the
+same sequence of requests produces the same numbers, and the artificial
+latency of the simulated optimizer can be set to zero, so high-load scenarios
+can be replayed quickly and exactly.
+
+The workload is event-driven. Each step covers a span of simulated time in
+which patient arrivals, discharges, bed cleaning, picks and restocks happen at
+configurable rates:
+
+- arrivals are a Poisson process per 100 beds; an arrival takes a random
+  available bed under a generated patient id, or is turned away when the
+  ward is full
+- each occupied bed is discharged at discharge_rate (per minute), which
+  clears its patient, and each bed being cleaned becomes available at
+  cleaning_rate
+- picks per 100 shelves hit a random shelf and take 1-5 items when it has
+  stock; restocks per 100 shelves refill a random shelf that has fallen to
+  the reorder level (20% of capacity)
+
+Events inside a step are applied in time order, so a discharge early in the
+step frees a bed for a later arrival. Each engine keeps a simulated clock that
+moves forward by one step per call and never falls behind the dataset's
+newest last_updated, and every bed change is stamped with its event time.
+
+Configure with SIM_SEED, SIM_LATENCY (seconds), SIM_STEP_SECONDS and the rate
+variables in RATE_ENV, or at runtime through /api/simulation/config.
+"""
+import os
+import threading
+import time
+import zlib
+
+import numpy as np
+
+DEFAULT_LATENCY = 0.5       # seconds the simulated optimizer "computes"
+DEFAULT_STEP_SECONDS = 60.0  # simulated seconds per tick or simulate call (one minute)
+
+# Events per minute; the defaults settle around 65% of beds and 60% of shelves in use
+DEFAULT_RATES = {
+    'arrival_rate': 1.3,     # patient arrivals per 100 beds
+    'discharge_rate': 0.02,  # per occupied bed (50 minute stays on average)
+    'cleaning_rate': 0.2,    # per bed being cleaned (5 minutes on average)
+    'pick_rate': 20.0,       # picks per 100 shelves
+    'restock_rate': 3.0      # restocks per 100 shelves
+}
+RATE_ENV = {
+    'arrival_rate': 'SIM_ARRIVAL_RATE',
+    'discharge_rate': 'SIM_DISCHARGE_RATE',
+    'cleaning_rate': 'SIM_CLEANING_RATE',
+    'pick_rate': 'SIM_PICK_RATE',
+    'restock_rate': 'SIM_RESTOCK_RATE'
+}
+PICK_SIZE = (1, 5)
+REORDER_LEVEL = 0.2  # fraction of capacity at which a shelf is due for restocking
+# Counters-only warehouse (no item counts): picks needed to empty a shelf
+PICKS_PER_LOAD = 10
+PATIENT_PREFIX = 'SIM-'
+
+_UNSET = object()
+
+
+class RandomSet:
+    """Set of ints with O(1) add, discard and uniform random removal"""
+
+    def __init__(self, items=()):
+        self.items = []
+        self.position = {}
+        for item in items:
+            self.add(item)
+
+    def __len__(self):
+        return len(self.items)
+
+    def add(self, item):
+        if item not in self.position:
+            self.position[item] = len(self.items)
+            self.items.append(item)
+
+    def discard(self, item):
+        k = self.position.pop(item, None)
+        if k is None:
+            return
+        last = self.items.pop()
+        if k < len(self.items):
+            self.items[k] = last
+            self.position[last] = k
+
+    def pop_at(self, fraction):
+        """Remove and return the item at fraction (0 <= fraction < 1) of the current order"""
+        item = self.items[int(fraction * len(self.items))]
+        self.discard(item)
+        return item
+
+    def pop_random(self, rng):
+        return self.pop_at(rng.random())
+
+
+def _env_float(name, default):
+    value = os.environ.get(name)
+    return float(value) if value not in (None, '') else default
+
+
+class SimulationEngine:
+    def __init__(self, seed=None, latency=DEFAULT_LATENCY, step_seconds=DEFAULT_STEP_SECONDS, **rates):
+        """
+        Args:
+            seed: integer seed, or None for a fresh random stream
+            latency: seconds of artificial delay for simulated optimizations (0 disables)
+            step_seconds: simulated seconds covered by one workload step
+            **rates: overrides for DEFAULT_RATES (events per minute)
+        """
+        self._lock = threading.RLock()
+        self.seed = None
+        self.latency = DEFAULT_LATENCY
+        self.step_seconds = DEFAULT_STEP_SECONDS
+        self.rates = dict(DEFAULT_RATES)
+        self.rng = np.random.default_rng()
+        self.clock = None  # simulated epoch seconds at the end of the last bed step; set on first use
+        self.configure(seed=seed, latency=latency, step_seconds=step_seconds, **rates)
+
+    @classmethod
+    def from_env(cls, stream=None):
+        """
+        Engine configured from the environment
+
+        Args:
+            stream: optional name (e.g. a facility id) mixed into SIM_SEED, so
+                engines for different streams stay reproducible without
+                producing the same numbers
+        """
+        seed = os.environ.get('SIM_SEED')
+        seed = int(seed) if seed not in (None, '') else None
+        if seed is not None and stream is not None:
+            seed = int(np.random.SeedSequence([seed, zlib.crc32(stream.encode('utf-8'))]).generate_state(1)[0])
+        return cls(
+            seed=seed,
+            latency=_env_float('SIM_LATENCY', DEFAULT_LATENCY),
+            step_seconds=_env_float('SIM_STEP_SECONDS', DEFAULT_STEP_SECONDS),
+            **{rate: _env_float(name, DEFAULT_RATES[rate]) for rate, name in RATE_ENV.items()}
+        )
+
+    def configure(self, seed=_UNSET, latency=None, step_seconds=None, **rates):
+        """
+        Change settings; passing seed (even None) restarts the random stream
+
+        Raises:
+            ValueError for unknown rates or negative values
+        """
+        unknown = set(rates) - set(DEFAULT_RATES)
+        if unknown:
+            raise ValueError(f"Unknown simulation rate: {', '.join(sorted(unknown))}")
+        values = dict(rates, latency=latency, step_seconds=step_seconds)
+        for name, value in values.items():
+            if value is not None and float(value) < 0:
+                raise ValueError(f'{name} must not be negative')
+        with self._lock:
+            if seed is not _UNSET:
+                self.seed = int(seed) if seed is not None else None
+                self.rng = np.random.default_rng(self.seed)
+                self.clock = None
+            if latency is not None:
+                self.latency = float(latency)
+            if step_seconds is not None:
+                self.step_seconds = float(step_seconds)
+            for name, value in rates.items():
+                if value is not None:
+                    self.rates[name] = float(value)
+
+    def config(self):
+        with self._lock:
+            return dict(self.rates, seed=self.seed, latency=self.latency, step_seconds=self.step_seconds)
+
+    def child_seed(self):
+        """Seed for an independent stream drawn from this one, or None when unseeded"""
+        with self._lock:
+            return int(self.rng.integers(2**32)) if self.seed is not None else None
+
+    def job_options(self):
+        """
+        Settings for one optimization job in a worker process. Seeded engines
+        hand each job its own seed from the main stream, so results do not
+        depend on which worker picks the job up.
+        """
+        return {'seed': self.child_seed(), 'latency': self.latency}
+
+    def delay(self):
+        """Artificial processing time of a simulated optimization"""
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+    def uniform(self, low, high):
+        with self._lock:
+            return float(self.rng.uniform(low, high))
+
+    def randint(self, low, high):
+        """Integer in [low, high], both inclusive like random.randint"""
+        with self._lock:
+            return int(self.rng.integers(low, high + 1))
+
+    def choice(self, options):
+        with self._lock:
+            return options[int(self.rng.integers(len(options)))]
+
+    def _seconds(self, seconds):
+        return self.step_seconds if seconds is None else float(seconds)
+
+    def _hazard(self, rate, seconds):
+        """Probability that a unit with a per-minute rate has its event within the step"""
+        return 1.0 - np.exp(-rate * seconds / 60.0)
+
+    def _poisson_times(self, rate_per_minute, seconds):
+        count = self.rng.poisson(rate_per_minute * seconds / 60.0)
+        return self.rng.uniform(0.0, seconds, count)
+
+    def _unit_times(self, units, rate, seconds):
+        """(unit indices, event times) for units whose per-unit event falls within the step"""
+        units = np.asarray(units)
+        hit = self.rng.random(len(units)) < self._hazard(rate, seconds)
+        return units[hit], self.rng.uniform(0.0, seconds, int(hit.sum()))
+
+    # Counters-only twin (random mode)
+
+    def advance_hospital_counts(self, stats, seconds=None):
+        """Apply one step of arrivals and discharges to {'totalBeds', 'occupied'} in place"""
+        seconds = self._seconds(seconds)
+        with self._lock:
+            total, occupied = int(stats['totalBeds']), int(stats['occupied'])
+            occupied = min(max(occupied, 0), total)
+            discharges = int(self.rng.binomial(occupied, self._hazard(self.rates['discharge_rate'], seconds)))
+            arrivals = int(self.rng.poisson(self.rates['arrival_rate'] * total / 100 * seconds / 60.0))
+        occupied -= discharges
+        admitted = min(arrivals, total - occupied)
+        stats['occupied'] = occupied + admitted
+        stats['available'] = total - stats['occupied']
+        return {'arrivals': admitted, 'turnedAway': arrivals - admitted, 'discharges': discharges}
+
+    def advance_warehouse_counts(self, stats, seconds=None):
+        """Apply one step of picks and restocks to {'totalShelves', 'occupied'} in place"""
+        seconds = self._seconds(seconds)
+        with self._lock:
+            total, occupied = int(stats['totalShelves']), int(stats['occupied'])
+            occupied = min(max(occupied, 0), total)
+            scale = total / 100 * seconds / 60.0
+            picks = int(self.rng.poisson(self.rates['pick_rate'] * scale))
+            restocks = int(self.rng.poisson(self.rates['restock_rate'] * scale))
+            # A pick lands on a stocked shelf with probability occupied/total and
+            # empties it once in PICKS_PER_LOAD; a restock only counts on an empty shelf
+            emptied = int(self.rng.binomial(picks, occupied / total / PICKS_PER_LOAD)) if total else 0
+            refilled = int(self.rng.binomial(restocks, (total - occupied) / total)) if total else 0
+        stats['occupied'] = min(max(occupied - emptied + refilled, 0), total)
+        stats['available'] = total - stats['occupied']
+        return {'picks': picks, 'restocks': refilled, 'stockouts': emptied}
+
+    # Uploaded datasets (custom mode)
+
+    def advance_beds(self, beds, seconds=None):
+        """
+        Apply one step of patient flow to a HospitalDataset
+
+        Returns:
+            the changed rows, one per bed
+        """
+        seconds = self._seconds(seconds)
+        statuses = beds.status.values()
+        occupied = np.flatnonzero((statuses == 'occupied') | (statuses == 'critical'))
+        cleaning = np.flatnonzero(statuses == 'cleaning')
+        updated = beds.last_updated
+        latest = float(np.nanmax(updated)) if len(updated) and np.isfinite(updated).any() else None
+        with self._lock:
+            start = self.clock if self.clock is not None else latest if latest is not None else time.time()
+            if latest is not None and latest > start:
+                start = latest
+            self.clock = start + seconds
+            discharged, discharge_times = self._unit_times(occupied, self.rates['discharge_rate'], seconds)
+            cleaned, cleaned_times = self._unit_times(cleaning, self.rates['cleaning_rate'], seconds)
+            arrival_times = self._poisson_times(self.rates['arrival_rate'] * len(beds) / 100, seconds)
+            timeline = sorted(
+                [(t, 'discharge', int(i)) for t, i in zip(discharge_times, discharged)]
+                + [(t, 'cleaned', int(i)) for t, i in zip(cleaned_times, cleaned)]
+                + [(t, 'arrival', None) for t in arrival_times],
+                key=lambda event: event[0]
+            )
+            picks = self.rng.random(len(arrival_times))
+            patients = self.rng.integers(16 ** 8, size=len(arrival_times))
+
+        free = RandomSet(np.flatnonzero(statuses == 'available').tolist())
+        changed = {}
+        arrivals = 0
+        for t, kind, idx in timeline:
+            when = start + t
+            if kind == 'discharge':
+                changed[idx] = beds.set_status(idx, 'cleaning', '', when)
+            elif kind == 'cleaned':
+                changed[idx] = beds.set_status(idx, 'available', timestamp=when)
+                free.add(idx)
+            elif free:
+                idx = free.pop_at(picks[arrivals])
+                patient = f'{PATIENT_PREFIX}{int(patients[arrivals]):08X}'
+                changed[idx] = beds.set_status(idx, 'occupied', patient, when)
+            arrivals += kind == 'arrival'
+        return list(changed.values())
+
+    def advance_shelves(self, shelves, seconds=None):
+        """
+        Apply one step of picks and restocks to a WarehouseDataset
+
+        Returns:
+            the changed rows, one per shelf
+        """
+        seconds = self._seconds(seconds)
+        n = len(shelves)
+        with self._lock:
+            pick_times = self._poisson_times(self.rates['pick_rate'] * n / 100, seconds)
+            restock_times = self._poisson_times(self.rates['restock_rate'] * n / 100, seconds)
+            pick_shelves = self.rng.integers(n, size=len(pick_times)) if n else []
+            pick_sizes = self.rng.integers(PICK_SIZE[0], PICK_SIZE[1] + 1, size=len(pick_times))
+            restock_picks = self.rng.random(len(restock_times))
+        timeline = sorted(
+            [(t, int(i), -int(size)) for t, i, size in zip(pick_times, pick_shelves, pick_sizes)]
+            + [(t, None, float(r)) for t, r in zip(restock_times, restock_picks)],
+            key=lambda event: event[0]
+        )
+
+        due = RandomSet(np.flatnonzero(shelves.item_count <= shelves.capacity * REORDER_LEVEL).tolist())
+        changed = {}
+        for _, idx, amount in timeline:
+            if idx is None:
+                if not due:
+                    continue
+                # Restock a random shelf at or below the reorder level
+                idx = due.pop_at(amount)
+                target = int(shelves.capacity[idx])
+            else:
+                target = max(int(shelves.item_count[idx]) + amount, 0)
+                if target <= shelves.capacity[idx] * REORDER_LEVEL:
+                    due.add(idx)
+            if target != int(shelves.item_count[idx]):
+                changed[idx] = shelves.set_item_count(idx, target)
+        return list(changed.values())
+
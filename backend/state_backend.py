@@ -0,0 +1,353 @@
+"""
+Shared state for the digital twin
+
+The Flask handlers keep the twin's counters (metrics, hospital and warehouse
+stats, mode flags, dataset info) and the uploaded dataset stores in a state
+backend instead of module globals, so they can be read and changed safely from
+request threads, the random-mode ticker and job callbacks.
+
+Two implementations share one interface:
+
+- LocalStateBackend keeps everything in this process behind a lock. Enough for
+  one (threaded) server process.
+- SQLiteStateBackend keeps the state in a local SQLite file (WAL mode), so
+  several worker processes serve the same twin. Read-modify-write updates run
+  in an immediate transaction, and dataset stores are cached per process and
+  only reloaded when another worker has changed them. A dataset update that
+  reports the rows it changed is stored as a small delta row. Readers apply
+  those deltas to their cached store, and the whole store is pickled again
+  only every COMPACT_EVERY updates.
+
+Values stored under a key are JSON-compatible dicts/lists/scalars. Updates go
+through update(key, fn), which passes the current value to fn and stores what
+fn leaves behind, so concurrent writers never lose each other's changes.
+
+Pick the backend with STATE_BACKEND=memory|sqlite (and STATE_DB for the file).
+"""
+import copy
+import json
+import os
+import pickle
+import sqlite3
+import threading
+
+DEFAULT_STATE_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'twin_state.db')
+SQLITE_TIMEOUT = 10.0
+COMPACT_EVERY = 200  # dataset deltas stored before the store is pickled in full again
+
+
+class StateBackend:
+    def initialize(self, defaults):
+        """Store each default value unless the key already exists (e.g. set by another worker)"""
+        raise NotImplementedError
+
+    def get(self, key):
+        """Copy of the value stored under key"""
+        raise NotImplementedError
+
+    def set(self, key, value):
+        raise NotImplementedError
+
+    def update(self, key, fn):
+        """
+        Atomically apply fn to the value under key
+
+        fn may mutate the value in place or return a replacement. Returns a
+        copy of the stored result.
+        """
+        raise NotImplementedError
+
+    def get_dataset(self, dataset_type):
+        """Current DatasetStore for the type, or None. Treat it as read-only."""
+        raise NotImplementedError
+
+    def copy_dataset(self, dataset_type):
+        """
+        The dataset as it is now, safe to hand to another thread or process
+        (e.g. pickled by the job queue) while updates go on, or None
+        """
+        raise NotImplementedError
+
+    def set_dataset(self, dataset_type, store, on_set=None):
+        """
+        Replace the dataset. on_set(store), if given, runs before any other
+        thread can see or change the new store (e.g. to journal it).
+        """
+        raise NotImplementedError
+
+    def update_dataset(self, dataset_type, fn):
+        """
+        Atomically apply fn(store) to the dataset and persist the result
+
+        Returns whatever fn returns. fn is not called when no dataset is loaded.
+        fn should return the rows it changed (as returned by the store's
+        setters), which lets a backend persist only those.
+        """
+        raise NotImplementedError
+
+    def update_datasets(self, fns, check=None):
+        """
+        Atomically apply fn(store) to several datasets: all or none
+
+        Args:
+            fns: dict of dataset type -> fn, each as for update_dataset
+            check: optional check(stores) given every current store (type ->
+                store or None) before anything changes; when it returns False
+                no fn is called
+
+        Returns:
+            dict of dataset type -> what its fn returned, or None if check failed
+        """
+        raise NotImplementedError
+
+
+def _apply(fn, value):
+    result = fn(value)
+    return value if result is None else result
+
+
+class LocalStateBackend(StateBackend):
+    """In-process state guarded by a single re-entrant lock"""
+
+    name = 'memory'
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._values = {}
+        self._datasets = {}
+
+    def initialize(self, defaults):
+        with self._lock:
+            for key, value in defaults.items():
+                self._values.setdefault(key, copy.deepcopy(value))
+
+    def get(self, key):
+        with self._lock:
+            return copy.deepcopy(self._values.get(key))
+
+    def set(self, key, value):
+        with self._lock:
+            self._values[key] = copy.deepcopy(value)
+
+    def update(self, key, fn):
+        with self._lock:
+            self._values[key] = _apply(fn, self._values.get(key))
+            return copy.deepcopy(self._values[key])
+
+    def get_dataset(self, dataset_type):
+        with self._lock:
+            return self._datasets.get(dataset_type)
+
+    def copy_dataset(self, dataset_type):
+        # Copied under the lock, so the version always matches the rows
+        with self._lock:
+            store = self._datasets.get(dataset_type)
+            return store.copy() if store is not None else None
+
+    def set_dataset(self, dataset_type, store, on_set=None):
+        with self._lock:
+            self._datasets[dataset_type] = store
+            if on_set:
+                on_set(store)
+
+    def update_dataset(self, dataset_type, fn):
+        with self._lock:
+            store = self._datasets.get(dataset_type)
+            return fn(store) if store is not None else None
+
+    def update_datasets(self, fns, check=None):
+        with self._lock:
+            if check and not check({dataset_type: self._datasets.get(dataset_type) for dataset_type in fns}):
+                return None
+            return {dataset_type: self.update_dataset(dataset_type, fn) for dataset_type, fn in fns.items()}
+
+
+class SQLiteStateBackend(StateBackend):
+    """State in a local SQLite file shared by every worker process on the host"""
+
+    name = 'sqlite'
+
+    def __init__(self, path=DEFAULT_STATE_DB):
+        self.path = path
+        self._local = threading.local()
+        # Per-process cache of unpickled stores: type -> (revision, store)
+        self._dataset_cache = {}
+        self._cache_lock = threading.Lock()
+        with self._transaction() as db:
+            db.execute('CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS datasets '
+                '(type TEXT PRIMARY KEY, revision INTEGER NOT NULL, data BLOB)'
+            )
+            # Changed rows per update since the pickled store (revision in datasets)
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS dataset_deltas '
+                '(type TEXT NOT NULL, revision INTEGER NOT NULL, data TEXT NOT NULL, PRIMARY KEY (type, revision))'
+            )
+
+    def _connection(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=SQLITE_TIMEOUT, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db = db
+        return db
+
+    def _transaction(self):
+        return _Transaction(self._connection())
+
+    def initialize(self, defaults):
+        with self._transaction() as db:
+            db.executemany(
+                'INSERT OR IGNORE INTO state (key, value) VALUES (?, ?)',
+                [(key, json.dumps(value)) for key, value in defaults.items()]
+            )
+
+    def get(self, key):
+        row = self._connection().execute('SELECT value FROM state WHERE key = ?', (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key, value):
+        with self._transaction() as db:
+            db.execute('INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)', (key, json.dumps(value)))
+
+    def update(self, key, fn):
+        with self._transaction() as db:
+            row = db.execute('SELECT value FROM state WHERE key = ?', (key,)).fetchone()
+            value = _apply(fn, json.loads(row[0]) if row else None)
+            db.execute('INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)', (key, json.dumps(value)))
+        return value
+
+    def _load_dataset(self, db, dataset_type):
+        """
+        (revision, store) for the type. The cached store is brought up to date
+        with the deltas stored since, and unpickled only after a new upload or
+        compaction.
+        """
+        row = db.execute(
+            'SELECT revision, (SELECT MAX(revision) FROM dataset_deltas WHERE type = datasets.type) '
+            'FROM datasets WHERE type = ?', (dataset_type,)
+        ).fetchone()
+        if row is None:
+            return 0, None
+        base, latest = row[0], max(row[0], row[1] or 0)
+        with self._cache_lock:
+            cached = self._dataset_cache.get(dataset_type)
+        if cached and cached[0] == latest:
+            return cached
+        if cached and cached[1] is not None and cached[0] >= base:
+            # Other threads may be reading the cached store, so deltas go onto a copy
+            revision, store = cached[0], cached[1].copy()
+        else:
+            data = db.execute('SELECT data FROM datasets WHERE type = ?', (dataset_type,)).fetchone()[0]
+            revision, store = base, pickle.loads(data) if data is not None else None
+        if store is not None and latest > revision:
+            changes, version = {}, store.version
+            for (data,) in db.execute(
+                'SELECT data FROM dataset_deltas WHERE type = ? AND revision > ? ORDER BY revision',
+                (dataset_type, revision)
+            ):
+                delta = json.loads(data)
+                changes.update((int(index), values) for index, values in delta['rows'].items())
+                version = delta['version']
+            store.apply_deltas(changes)
+            # Same version as in the writing process, so every worker agrees on it
+            store.version = version
+        loaded = (latest, store)
+        with self._cache_lock:
+            self._dataset_cache[dataset_type] = loaded
+        return loaded
+
+    def _store_dataset(self, db, dataset_type, revision, store):
+        data = pickle.dumps(store, protocol=pickle.HIGHEST_PROTOCOL) if store is not None else None
+        db.execute(
+            'INSERT OR REPLACE INTO datasets (type, revision, data) VALUES (?, ?, ?)',
+            (dataset_type, revision, data)
+        )
+        db.execute('DELETE FROM dataset_deltas WHERE type = ?', (dataset_type,))
+        with self._cache_lock:
+            self._dataset_cache[dataset_type] = (revision, store)
+
+    def _store_delta(self, db, dataset_type, revision, store, rows):
+        # Uploads reject repeated ids, so each changed row maps back to one index
+        indices = [store.find(row[store.id_column]) for row in rows]
+        changes = {index: store.delta(index) for index in indices}
+        db.execute(
+            'INSERT INTO dataset_deltas (type, revision, data) VALUES (?, ?, ?)',
+            (dataset_type, revision, json.dumps({'version': store.version, 'rows': changes}))
+        )
+        with self._cache_lock:
+            self._dataset_cache[dataset_type] = (revision, store)
+
+    def get_dataset(self, dataset_type):
+        return self._load_dataset(self._connection(), dataset_type)[1]
+
+    def copy_dataset(self, dataset_type):
+        # Cached stores are never changed in place (updates work on a copy)
+        return self.get_dataset(dataset_type)
+
+    def set_dataset(self, dataset_type, store, on_set=None):
+        with self._transaction() as db:
+            revision, _ = self._load_dataset(db, dataset_type)
+            self._store_dataset(db, dataset_type, revision + 1, store)
+            if on_set:
+                on_set(store)
+
+    def update_dataset(self, dataset_type, fn):
+        with self._transaction() as db:
+            return self._update_dataset(db, dataset_type, fn)
+
+    def update_datasets(self, fns, check=None):
+        with self._transaction() as db:
+            if check and not check({dataset_type: self._load_dataset(db, dataset_type)[1] for dataset_type in fns}):
+                return None
+            return {dataset_type: self._update_dataset(db, dataset_type, fn) for dataset_type, fn in fns.items()}
+
+    def _update_dataset(self, db, dataset_type, fn):
+        revision, cached = self._load_dataset(db, dataset_type)
+        if cached is None:
+            return None
+        # Work on a private copy: other threads may be reading the cached store
+        store = cached.copy()
+        result = fn(store)
+        if store.version == cached.version:
+            return result
+        base = db.execute('SELECT revision FROM datasets WHERE type = ?', (dataset_type,)).fetchone()[0]
+        rows = result if isinstance(result, list) and all(isinstance(row, dict) for row in result) else None
+        if rows and revision - base < COMPACT_EVERY:
+            self._store_delta(db, dataset_type, revision + 1, store, rows)
+        else:
+            self._store_dataset(db, dataset_type, revision + 1, store)
+        return result
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT, so read-modify-write is serialized across processes"""
+
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute('BEGIN IMMEDIATE')
+        return self.db
+
+    def __exit__(self, exc_type, exc, tb):
+        self.db.execute('ROLLBACK' if exc_type else 'COMMIT')
+        return False
+
+
+STATE_BACKENDS = {
+    LocalStateBackend.name: LocalStateBackend,
+    SQLiteStateBackend.name: SQLiteStateBackend
+}
+
+
+def create_state_backend(kind=None, path=None):
+    """Build the backend named by kind (or STATE_BACKEND), defaulting to in-process memory"""
+    kind = kind or os.environ.get('STATE_BACKEND', LocalStateBackend.name)
+    if kind not in STATE_BACKENDS:
+        raise ValueError(f"Unknown state backend: {kind}")
+    if kind == SQLiteStateBackend.name:
+        return SQLiteStateBackend(path or os.environ.get('STATE_DB', DEFAULT_STATE_DB))
+    return LocalStateBackend()
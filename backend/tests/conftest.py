@@ -0,0 +1,77 @@
+"""
+Shared fixtures for the backend tests
+
+Run from the backend directory with `python -m pytest tests`. The backend
+modules are imported as top-level modules, as app.py does.
+"""
+import io
+import os
+import sys
+import tempfile
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# Read when app.py is imported: no journal on disk, no simulated optimizer
+# delay and no result cache, so every optimize request reaches the job queue
+os.environ.update(
+    TWIN_DATA_DIR='',
+    FACILITY_DIR=tempfile.mkdtemp(prefix='twin-facilities-'),
+    SIM_LATENCY='0',
+    RESULT_CACHE_SIZE='0',
+    OPTIMIZER_WORKERS='1'
+)
+os.environ.pop('SIM_SEED', None)
+
+STATUSES = ('available', 'occupied', 'cleaning', 'critical')
+
+
+def _hospital_csv(beds=200):
+    """CSV upload of beds cycling through the statuses"""
+    lines = ['bed_id,patient_id,status,last_updated']
+    for bed in range(1, beds + 1):
+        status = STATUSES[bed % len(STATUSES)]
+        patient = f'P-{bed:05d}' if status in ('occupied', 'critical') else ''
+        lines.append(f'{bed},{patient},{status},2025-12-29 {bed % 24:02d}:00:00')
+    return '\n'.join(lines).encode('utf-8')
+
+
+def _warehouse_csv(shelves=120, zones=3):
+    """CSV upload of shelves over a few zones, every third one empty"""
+    lines = ['shelf_id,capacity,item_count,zone']
+    for shelf in range(shelves):
+        zone = chr(ord('A') + shelf % zones)
+        items = 0 if shelf % 3 == 0 else (shelf * 37) % 500
+        lines.append(f'{zone}-{shelf:03d},500,{items},Zone-{zone}')
+    return '\n'.join(lines).encode('utf-8')
+
+
+@pytest.fixture
+def hospital_csv():
+    return _hospital_csv()
+
+
+@pytest.fixture
+def beds():
+    from dataset_store import read_csv_dataset
+    return read_csv_dataset(io.BytesIO(_hospital_csv()))[1]
+
+
+@pytest.fixture
+def shelves():
+    from dataset_store import read_csv_dataset
+    return read_csv_dataset(io.BytesIO(_warehouse_csv()))[1]
+
+
+@pytest.fixture(scope='session')
+def app_module():
+    import app
+    yield app
+    app.job_queue.shutdown()
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
@@ -0,0 +1,41 @@
+import itertools
+
+import numpy as np
+import pytest
+
+import bed_assignment
+from bed_assignment import BedAssigner, hungarian
+
+
+def _brute_force(cost):
+    n, m = cost.shape
+    return min(sum(cost[row, column] for row, column in enumerate(columns))
+               for columns in itertools.permutations(range(m), n))
+
+
+@pytest.mark.parametrize('shape', [(1, 1), (2, 2), (3, 5), (4, 4), (5, 7), (6, 6)])
+def test_hungarian_matches_brute_force(shape):
+    rng = np.random.default_rng(sum(shape))
+    for _ in range(20):
+        cost = rng.integers(0, 20, size=shape).astype(float)
+        columns = hungarian(cost)
+        assert len(set(columns.tolist())) == shape[0]
+        assert cost[np.arange(shape[0]), columns].sum() == pytest.approx(_brute_force(cost))
+
+
+def test_hungarian_rejects_more_rows_than_columns():
+    with pytest.raises(ValueError):
+        hungarian(np.zeros((3, 2)))
+
+
+@pytest.mark.parametrize('by_ward', [False, True])
+def test_solve_gives_every_patient_a_distinct_bed(beds, monkeypatch, by_ward):
+    if by_ward:
+        monkeypatch.setattr(bed_assignment, 'MAX_COST_CELLS', 1)
+    plan = BedAssigner(beds).solve(admissions=5)
+    assert plan['by_ward'] == by_ward
+    assert plan['unplaced'] == 0 and len(plan['admitted']) == 5
+    targets = [move['to'] for move in plan['moves'] + plan['admitted']]
+    assert len(targets) == len(set(targets))
+    if not by_ward:
+        assert plan['objective'] <= plan['baseline_objective'] + 1e-6
@@ -0,0 +1,28 @@
+import numpy as np
+
+from decomposition import CLUSTER_STOPS, decompose_hospital, decompose_warehouse
+from warehouse_routing import WarehouseRouter
+
+
+def test_stitched_tours_visit_every_stop_exactly_once(shelves):
+    plan = decompose_warehouse(shelves)
+    router = WarehouseRouter(shelves)
+    expected = sorted(router.ids[idx] for idx in router.pick_list())
+    visited = [stop for tour in plan['tours'] for stop in tour['stops']]
+    assert sorted(visited) == expected
+    assert plan['stops'] == len(expected)
+    assert plan['clusters'] >= len(expected) / CLUSTER_STOPS
+    for tour in plan['tours']:
+        # Repair never makes a zone tour longer than the stitched one
+        assert tour['distance'] <= tour['stitched_distance'] + 1e-6
+        assert {stop.split('-')[0] for stop in tour['stops']} == {tour['zone'].split('-')[-1]}
+
+
+def test_hospital_opens_distinct_free_beds(beds):
+    plan = decompose_hospital(beds)
+    opened = plan['opened']
+    assert len(opened) == len(set(opened)) == plan['assignments']
+    free = {beds.row(idx)['bed_id'] for idx in range(len(beds))
+            if beds.row(idx)['status'] in ('available', 'cleaning')}
+    assert set(opened) <= free
+    assert np.isfinite(plan['objective'])
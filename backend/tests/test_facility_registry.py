@@ -0,0 +1,95 @@
+import os
+import threading
+
+import pytest
+
+from facility_registry import Facility, FacilityLimitError, FacilityNotFound, FacilityRegistry
+from state_backend import LocalStateBackend
+from twin_journal import TwinJournal
+
+DEFAULTS = {
+    'metrics': {'requests': 0},
+    'mode': {'demo': False, 'custom': False},
+    'dataset': None
+}
+
+
+@pytest.fixture
+def registry(tmp_path):
+    def create(facility_id):
+        journal = TwinJournal(str(tmp_path / facility_id))
+        return Facility(facility_id, LocalStateBackend(), DEFAULTS, journal)
+
+    registry = FacilityRegistry(create, max_active=1, directory=str(tmp_path), max_facilities=3)
+    yield registry
+    registry.close()
+
+
+def _use(registry, facility_id, fn=None, create=False):
+    facility = registry.acquire(facility_id, create=create)
+    try:
+        return fn(facility) if fn else facility
+    finally:
+        registry.release(facility)
+
+
+def test_unknown_facility_is_not_created_by_reads(registry, tmp_path):
+    with pytest.raises(FacilityNotFound):
+        registry.acquire('ghost')
+    assert not os.path.exists(tmp_path / 'ghost')
+    with pytest.raises(ValueError):
+        registry.acquire('../escape', create=True)
+
+
+def test_eviction_saves_and_reload_restores_values_and_data(registry, beds):
+    def write(facility):
+        facility.state.update('metrics', lambda metrics: dict(metrics, requests=41))
+        facility.state.set('mode', {'demo': False, 'custom': True})
+        facility.replace_dataset('hospital', beds, {'filename': 'beds.csv'})
+        facility.state.update_dataset('hospital', facility.journaled(
+            'hospital', 'test', lambda store: [store.set_status(0, 'critical', 'P-1')]
+        ))
+
+    first = _use(registry, 'north', write, create=True)
+    _use(registry, 'south', create=True)
+    assert [facility.id for facility in registry.active()] == ['south']
+    assert registry.stats()['evictions'] == 1
+
+    restored = _use(registry, 'north')
+    assert restored is not first
+    assert restored.state.get('metrics') == {'requests': 41}
+    assert restored.mode() == {'demo': False, 'custom': True}
+    store = restored.state.get_dataset('hospital')
+    assert len(store) == len(beds)
+    assert store.row(0)['status'] == 'critical' and store.row(0)['patient_id'] == 'P-1'
+
+
+def test_facilities_in_use_are_not_evicted(registry):
+    north = registry.acquire('north', create=True)
+    # north is least recently used but in use, so the idle south goes instead
+    _use(registry, 'south', create=True)
+    registry.release(north)
+    assert [facility.id for facility in registry.active()] == ['north']
+
+
+def test_facility_limit(registry):
+    # The default facility counts towards the limit of three
+    _use(registry, 'north', create=True)
+    _use(registry, 'south', create=True)
+    with pytest.raises(FacilityLimitError):
+        registry.acquire('east', create=True)
+
+
+def test_concurrent_requests_share_one_load(registry):
+    seen = []
+
+    def request():
+        seen.append(_use(registry, 'north', create=True))
+
+    threads = [threading.Thread(target=request) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len({id(facility) for facility in seen}) == 1
+    assert registry.stats()['loads'] == 1
@@ -0,0 +1,80 @@
+import os
+
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from job_queue import OptimizationJobQueue, PoolUnavailableError, QueueFullError
+
+
+def _square(value):
+    return value * value
+
+
+def _crash():
+    os._exit(1)
+
+
+class _BrokenExecutor:
+    def submit(self, *args, **kwargs):
+        raise BrokenProcessPool('worker pool is broken')
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+
+@pytest.fixture
+def queue():
+    queue = OptimizationJobQueue(max_workers=1, max_pending=2)
+    yield queue
+    queue.shutdown()
+
+
+def test_job_runs_and_is_scoped_to_its_owner(queue):
+    job_id = queue.submit('square', _square, 7, owner='site-a')
+    assert queue.wait(job_id, timeout=30, owner='site-a')['result'] == 49
+    assert queue.get(job_id, owner='site-b') is None
+    assert queue.wait(job_id, timeout=0, owner='site-b') is None
+
+
+def test_full_queue_rejects_submissions(queue):
+    queue.max_pending = 0
+    with pytest.raises(QueueFullError):
+        queue.submit('square', _square, 2)
+
+
+def test_pool_restarts_after_a_worker_dies(queue):
+    crashed = queue.submit('crash', _crash)
+    job = queue.wait(crashed, timeout=30)
+    assert job['status'] == 'failed'
+    assert job['error'] == 'Optimizer worker exited unexpectedly'
+
+    job_id = queue.submit('square', _square, 3)
+    assert queue.wait(job_id, timeout=30)['result'] == 9
+
+
+def test_unavailable_pool_raises_and_drops_the_job(queue, monkeypatch):
+    monkeypatch.setattr(queue, '_get_executor', _BrokenExecutor)
+    with pytest.raises(PoolUnavailableError):
+        queue.submit('square', _square, 2)
+    assert queue.stats()['tracked'] == 0
+
+
+def test_as_completed_reports_unknown_jobs(queue):
+    job_id = queue.submit('square', _square, 4)
+    results = dict(queue.as_completed([job_id, 'unknown'], timeout=30))
+    assert results[job_id]['result'] == 16
+    assert results['unknown'] is None
+
+
+def test_optimize_job_endpoint_answers_429_when_full(client, app_module, monkeypatch):
+    monkeypatch.setattr(app_module.job_queue, 'max_pending', 0)
+    response = client.post('/api/optimize/jobs', json={'type': 'hospital'})
+    assert response.status_code == 429
+    assert response.headers['Retry-After']
+
+
+def test_optimize_job_endpoint_answers_503_without_a_pool(client, app_module, monkeypatch):
+    monkeypatch.setattr(app_module.job_queue, '_get_executor', _BrokenExecutor)
+    response = client.post('/api/optimize/jobs', json={'type': 'hospital'})
+    assert response.status_code == 503
@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+import state_backend
+from simulation import SimulationEngine
+from state_backend import LocalStateBackend, SQLiteStateBackend
+
+
+def _same_rows(a, b):
+    return (
+        a.version == b.version
+        and (a.status.values() == b.status.values()).all()
+        and (a.patient_ids == b.patient_ids).all()
+        and np.array_equal(a.last_updated, b.last_updated, equal_nan=True)
+    )
+
+
+@pytest.fixture
+def database(tmp_path):
+    return str(tmp_path / 'twin_state.db')
+
+
+def test_values_are_shared_between_backends(database):
+    writer, reader = SQLiteStateBackend(database), SQLiteStateBackend(database)
+    writer.initialize({'metrics': {'requests': 0}})
+    reader.initialize({'metrics': {'requests': 100}})
+    writer.update('metrics', lambda metrics: dict(metrics, requests=metrics['requests'] + 1))
+    assert reader.get('metrics') == {'requests': 1}
+
+
+def test_deltas_replay_across_backends_and_compact(database, beds, monkeypatch):
+    monkeypatch.setattr(state_backend, 'COMPACT_EVERY', 7)
+    a, b = SQLiteStateBackend(database), SQLiteStateBackend(database)
+    a.set_dataset('hospital', beds)
+    engine = SimulationEngine(seed=5, arrival_rate=20, discharge_rate=0.3, cleaning_rate=0.5)
+
+    for step in range(30):
+        # Alternate writers, so each one replays the other's deltas
+        (a if step % 2 else b).update_dataset('hospital', engine.advance_beds)
+
+    fresh = SQLiteStateBackend(database).get_dataset('hospital')
+    assert _same_rows(a.get_dataset('hospital'), b.get_dataset('hospital'))
+    assert _same_rows(a.get_dataset('hospital'), fresh)
+    assert fresh.version > beds.version
+
+    db = a._connection()
+    base = db.execute("SELECT revision FROM datasets WHERE type = 'hospital'").fetchone()[0]
+    deltas = db.execute("SELECT COUNT(*) FROM dataset_deltas WHERE type = 'hospital'").fetchone()[0]
+    # 31 revisions with a full store every 8th: the deltas after the last compaction remain
+    assert base == 25 and deltas == 6
+
+
+def test_cached_store_is_not_changed_by_updates(database, beds):
+    backend = SQLiteStateBackend(database)
+    backend.set_dataset('hospital', beds)
+    before = backend.get_dataset('hospital')
+    version = before.version
+    backend.update_dataset('hospital', lambda store: [store.set_status(0, 'occupied', 'P-1')])
+    assert before.version == version
+    assert backend.get_dataset('hospital').row(0)['patient_id'] == 'P-1'
+
+
+@pytest.mark.parametrize('kind', ['memory', 'sqlite'])
+def test_update_datasets_is_all_or_nothing(kind, database, beds, shelves):
+    backend = LocalStateBackend() if kind == 'memory' else SQLiteStateBackend(database)
+    backend.set_dataset('hospital', beds)
+    backend.set_dataset('warehouse', shelves)
+    versions = {'hospital': beds.version, 'warehouse': shelves.version + 1}
+    fns = {
+        'hospital': lambda store: [store.set_status(0, 'cleaning')],
+        'warehouse': lambda store: [store.set_item_count(0, 1)]
+    }
+
+    def unchanged(stores):
+        return all(stores[dataset_type].version == version for dataset_type, version in versions.items())
+
+    assert backend.update_datasets(fns, check=unchanged) is None
+    assert backend.get_dataset('hospital').row(0)['status'] == beds.row(0)['status']
+
+    versions['warehouse'] -= 1
+    changed = backend.update_datasets(fns, check=unchanged)
+    assert changed['hospital'][0]['status'] == 'cleaning'
+    assert backend.get_dataset('warehouse').item_count[0] == 1
@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from simulation import SimulationEngine
+from state_backend import LocalStateBackend
+from twin_journal import TwinJournal
+
+
+def _same_rows(a, b):
+    return (
+        (a.status.values() == b.status.values()).all()
+        and (a.patient_ids == b.patient_ids).all()
+        and np.array_equal(a.last_updated, b.last_updated, equal_nan=True)
+    )
+
+
+@pytest.fixture
+def journaled_state(tmp_path, beds):
+    journal = TwinJournal(str(tmp_path), snapshot_every=5, snapshot_rows=10**9)
+    state = LocalStateBackend()
+    state.set_dataset('hospital', beds, lambda store: journal.snapshot('hospital', store, {'filename': 'beds.csv'}))
+    return journal, state
+
+
+def _simulate(journal, state, steps):
+    engine = SimulationEngine(seed=2, arrival_rate=20, discharge_rate=0.3, cleaning_rate=0.5)
+    step = journal.recording('hospital', 'simulate', engine.advance_beds)
+    for _ in range(steps):
+        state.update_dataset('hospital', step)
+
+
+def test_restore_replays_the_log_after_compaction(tmp_path, journaled_state):
+    journal, state = journaled_state
+    _simulate(journal, state, 23)
+    journal.close()
+
+    restored = TwinJournal(str(tmp_path))
+    store, info = restored.restore('hospital')
+    history = restored.history('hospital')
+    assert info == {'filename': 'beds.csv'}
+    assert _same_rows(store, state.get_dataset('hospital'))
+    # Compacted past the upload, with the deltas since the newest snapshot replayed
+    assert len(history['snapshots']) > 1
+    assert history['lastSeq'] == 24
+
+
+def test_restored_chain_keeps_recording(tmp_path, journaled_state):
+    journal, state = journaled_state
+    _simulate(journal, state, 7)
+    journal.close()
+
+    journal = TwinJournal(str(tmp_path), snapshot_every=5, snapshot_rows=10**9)
+    state = LocalStateBackend()
+    state.set_dataset('hospital', journal.restore('hospital')[0])
+    _simulate(journal, state, 9)
+    journal.close()
+
+    store, _ = TwinJournal(str(tmp_path)).restore('hospital')
+    assert _same_rows(store, state.get_dataset('hospital'))
+
+
+def test_reset_is_restored_as_no_dataset(tmp_path, journaled_state):
+    journal, state = journaled_state
+    _simulate(journal, state, 3)
+    journal.reset('hospital')
+    journal.close()
+    assert TwinJournal(str(tmp_path)).restore('hospital') is None
+
+
+def test_values_round_trip(tmp_path):
+    journal = TwinJournal(str(tmp_path))
+    assert journal.load_values() == {}
+    journal.save_values({'mode': {'demo': False, 'custom': True}})
+    assert TwinJournal(str(tmp_path)).load_values() == {'mode': {'demo': False, 'custom': True}}
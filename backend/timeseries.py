@@ -0,0 +1,220 @@
+"""
+Fixed-size time series for monitoring history
+
+Every metric keeps a ring buffer of its most recent raw samples plus rollup
+rings at 1 s, 1 min and 1 h resolution. Rollup buckets hold count/sum/min/max
+and are updated in place as samples arrive, so memory is fixed per metric and
+a dashboard query for any window only aggregates the pre-rolled buckets of a
+suitable resolution.
+"""
+import math
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+# (resolution in seconds, buckets kept): 1 h of seconds, 1 day of minutes, 30 days of hours
+ROLLUPS = ((1, 3600), (60, 1440), (3600, 720))
+RAW_SAMPLES = 1024
+MAX_POINTS = 120  # points returned per series; finer buckets are merged to fit
+
+GAUGE = 'gauge'      # latencies, scores: buckets report the mean
+COUNTER = 'counter'  # errors, completions: buckets report the sum
+
+
+class RingBuffer:
+    """Most recent samples as (timestamp, value) in preallocated arrays"""
+
+    def __init__(self, capacity=RAW_SAMPLES):
+        self.capacity = capacity
+        self.times = np.zeros(capacity)
+        self.values = np.zeros(capacity)
+        self.next = 0
+        self.size = 0
+
+    def append(self, timestamp, value):
+        self.times[self.next] = timestamp
+        self.values[self.next] = value
+        self.next = (self.next + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def ordered(self):
+        """(times, values) oldest first"""
+        order = (np.arange(self.size) + self.next - self.size) % self.capacity
+        return self.times[order], self.values[order]
+
+
+class Rollup:
+    """Ring of aggregate buckets at one resolution"""
+
+    def __init__(self, resolution, capacity):
+        self.resolution = resolution
+        self.capacity = capacity
+        self.starts = np.full(capacity, -np.inf)
+        self.count = np.zeros(capacity, dtype=np.int64)
+        self.sum = np.zeros(capacity)
+        self.min = np.zeros(capacity)
+        self.max = np.zeros(capacity)
+        self.current = 0
+
+    @property
+    def span(self):
+        return self.resolution * self.capacity
+
+    def add(self, timestamp, value):
+        start = math.floor(timestamp / self.resolution) * self.resolution
+        k = self.current
+        if start > self.starts[k]:
+            k = self.current = (k + 1) % self.capacity
+            self.starts[k] = start
+            self.count[k] = 0
+            self.sum[k] = 0.0
+            self.min[k] = value
+            self.max[k] = value
+        # Late samples fold into the current bucket rather than rewriting history
+        self.count[k] += 1
+        self.sum[k] += value
+        self.min[k] = min(self.min[k], value)
+        self.max[k] = max(self.max[k], value)
+
+
+class MetricSeries:
+    def __init__(self, name, kind=GAUGE, rollups=ROLLUPS, raw_samples=RAW_SAMPLES):
+        """
+        Args:
+            name: metric name
+            kind: GAUGE (buckets report the mean) or COUNTER (buckets report the sum)
+            rollups: (resolution seconds, bucket count) pairs, finest first
+            raw_samples: raw samples kept for latest()/recent()
+        """
+        self.name = name
+        self.kind = kind
+        self.raw = RingBuffer(raw_samples)
+        self.rollups = [Rollup(resolution, capacity) for resolution, capacity in rollups]
+        self._lock = threading.Lock()
+
+    def record(self, value, timestamp=None):
+        timestamp = time.time() if timestamp is None else timestamp
+        value = float(value)
+        with self._lock:
+            self.raw.append(timestamp, value)
+            for rollup in self.rollups:
+                rollup.add(timestamp, value)
+
+    def latest(self):
+        with self._lock:
+            if not self.raw.size:
+                return None
+            return float(self.raw.values[(self.raw.next - 1) % self.raw.capacity])
+
+    def recent(self, seconds, now=None):
+        """Raw values recorded in the last `seconds`"""
+        now = time.time() if now is None else now
+        with self._lock:
+            times, values = self.raw.ordered()
+        return values[times >= now - seconds]
+
+    def _rollup_for(self, window):
+        """Finest rollup whose ring still covers the window"""
+        for rollup in self.rollups:
+            if rollup.span >= window:
+                return rollup
+        return self.rollups[-1]
+
+    def query(self, window, now=None, max_points=MAX_POINTS):
+        """
+        Aggregated points covering the last `window` seconds
+
+        Returns:
+            (step seconds, list of {'t', 'value', 'count', 'min', 'max'}) with one
+            point per step, oldest first. Empty steps have count 0 and value 0 for
+            counters or None for gauges.
+        """
+        now = time.time() if now is None else now
+        rollup = self._rollup_for(window)
+        resolution = rollup.resolution
+        merge = max(1, math.ceil(window / resolution / max_points))
+        step = resolution * merge
+        end = (math.floor(now / step) + 1) * step
+        points = max(1, math.ceil(window / step))
+        start = end - points * step
+
+        with self._lock:
+            mask = (rollup.starts >= start) & (rollup.starts < end) & (rollup.count > 0)
+            starts = rollup.starts[mask]
+            count = rollup.count[mask]
+            total = rollup.sum[mask]
+            low = rollup.min[mask]
+            high = rollup.max[mask]
+
+        bins = ((starts - start) // step).astype(np.int64)
+        counts = np.bincount(bins, weights=count, minlength=points)
+        sums = np.bincount(bins, weights=total, minlength=points)
+        mins = np.full(points, np.inf)
+        maxs = np.full(points, -np.inf)
+        np.minimum.at(mins, bins, low)
+        np.maximum.at(maxs, bins, high)
+
+        series = []
+        for k in range(points):
+            n = int(counts[k])
+            if self.kind == COUNTER:
+                value = float(sums[k])
+            else:
+                value = round(float(sums[k] / n), 3) if n else None
+            series.append({
+                't': start + k * step,
+                'value': value,
+                'count': n,
+                'min': float(mins[k]) if n else None,
+                'max': float(maxs[k]) if n else None
+            })
+        return step, series
+
+
+class MetricsHistory:
+    """Named MetricSeries for the whole app"""
+
+    def __init__(self):
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, kind=GAUGE):
+        with self._lock:
+            if name not in self._series:
+                self._series[name] = MetricSeries(name, kind)
+            return self._series[name]
+
+    def series(self, name):
+        return self._series.get(name)
+
+    def names(self):
+        with self._lock:
+            return list(self._series)
+
+    def record(self, name, value, timestamp=None):
+        series = self._series.get(name) or self.register(name)
+        series.record(value, timestamp)
+
+    def chart(self, names, window, now=None, max_points=MAX_POINTS):
+        """
+        Chart-ready data for the dashboard: {name: [{'time', 'value', ...}]}
+
+        The 'time' label is wall-clock, with the date added for windows over a day.
+        """
+        now = time.time() if now is None else now
+        label_format = '%H:%M:%S' if window <= 86400 else '%m-%d %H:%M'
+        chart = {}
+        step = None
+        for name in names:
+            series = self._series.get(name)
+            if series is None:
+                continue
+            step, points = series.query(window, now, max_points)
+            for point in points:
+                point['time'] = datetime.fromtimestamp(point['t']).strftime(label_format)
+            chart[name] = points
+        chart['window'] = window
+        chart['step'] = step
+        return chart
@@ -0,0 +1,401 @@
+"""
+Persistent snapshots and delta log of the uploaded datasets
+
+Uploaded datasets used to live only in memory: a restart lost them and the CSV
+had to be uploaded and parsed again. The journal keeps each dataset type on
+disk as
+
+- snapshots: one directory per snapshot holding every column as a .npy file
+  (Categoricals as their codes) plus meta.json. Columns are opened with
+  copy-on-write memory mapping, so restoring a large facility only maps the
+  files; pages are read as they are touched and mutations stay private.
+- an append-only delta log after each snapshot: one JSON line per mutation
+  (simulation step, applied what-if run, live simulator tick) with the changed
+  rows' fields, or a reset marker.
+
+Restoring loads the newest snapshot and replays its log. After SNAPSHOT_EVERY
+deltas or SNAPSHOT_ROWS changed rows a new snapshot is taken so replay stays
+short, and the newest
+SNAPSHOTS_KEPT snapshots with their logs are kept for time travel: at(when)
+rebuilds the dataset as it was at any moment they cover.
+
+Deltas are recorded while the state lock is held. So a periodic snapshot only
+copies the store there. A background thread writes the copy. Once the copy is
+on disk, the deltas logged since it was taken move into the new snapshot's
+log, and the new snapshot is renamed into place. Until then the previous
+chain stays complete. Snapshots of uploads start a new chain and are written
+straight away, under the state lock of the upload.
+
+Layout under the data directory:
+
+    <type>/<seq>.snap/       columns of the state after delta seq
+    <type>/<seq>.log         deltas seq+1, seq+2, ... that followed it
+    state.json               the twin's other values (counters, mode), saved
+                             when its facility is evicted or the server stops
+
+Each log line is flushed as it is written; a torn last line (crash mid-write)
+is ignored on replay. One process should write a data directory.
+"""
+import json
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+
+from dataset_store import DATASET_TYPES, Categorical
+
+SNAPSHOT_EVERY = 500     # deltas replayed at most when restoring
+SNAPSHOT_ROWS = 20000    # changed rows after which a snapshot is taken sooner
+SNAPSHOTS_KEPT = 8
+SEQ_WIDTH = 12
+STATE_FILE = 'state.json'
+
+
+def _name(seq, suffix):
+    return f'{seq:0{SEQ_WIDTH}d}{suffix}'
+
+
+def write_snapshot(path, store, meta):
+    """Write store's columns and meta into directory path, atomically"""
+    temporary = f'{path}.tmp'
+    shutil.rmtree(temporary, ignore_errors=True)
+    os.makedirs(temporary)
+    columns = store.columns()
+    if store.coordinates is not None:
+        columns['x'], columns['y'] = store.coordinates
+    categories = {}
+    for name, column in columns.items():
+        if isinstance(column, Categorical):
+            categories[name] = column.categories
+            column = column.codes
+        np.save(os.path.join(temporary, f'{name}.npy'), np.ascontiguousarray(column), allow_pickle=False)
+    meta = dict(meta, type=store.dataset_type, rows=len(store), version=store.version,
+                columns=list(columns), categories=categories)
+    with open(os.path.join(temporary, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+    os.replace(temporary, path)
+
+
+def read_snapshot(path):
+    """(store, meta) from a snapshot directory, with the columns memory-mapped copy-on-write"""
+    with open(os.path.join(path, 'meta.json')) as f:
+        meta = json.load(f)
+    columns = {}
+    # An empty file cannot be mapped
+    mmap_mode = 'c' if meta['rows'] else None
+    for name in meta['columns']:
+        column = np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mmap_mode, allow_pickle=False)
+        columns[name] = (column, meta['categories'][name]) if name in meta['categories'] else column
+    x, y = columns.pop('x', None), columns.pop('y', None)
+    store = DATASET_TYPES[meta['type']].from_columns(columns)
+    if x is not None:
+        store.coordinates = (x, y)
+    store.version = meta['version']
+    return store, meta
+
+
+def read_log(path):
+    """
+    Deltas in a log file, stopping at a torn last line
+
+    Returns:
+        (deltas, bytes of the file they take up)
+    """
+    deltas, length = [], 0
+    try:
+        with open(path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    deltas.append(json.loads(line))
+                except ValueError:
+                    break
+                length += len(line)
+    except FileNotFoundError:
+        pass
+    return deltas, length
+
+
+def apply_deltas(store, deltas):
+    """
+    Replay deltas onto store; returns None once a reset is reached
+
+    Deltas carry a row's full mutable state, so only the last values of each
+    row are applied, in one vectorized pass.
+    """
+    changes = {}
+    for delta in deltas:
+        if delta.get('reset'):
+            return None
+        for index, values in delta['rows']:
+            changes[index] = values
+    store.apply_deltas(changes)
+    return store
+
+
+class TwinJournal:
+    def __init__(self, directory, snapshot_every=SNAPSHOT_EVERY, snapshot_rows=SNAPSHOT_ROWS,
+                 snapshots_kept=SNAPSHOTS_KEPT):
+        """
+        Args:
+            directory: data directory (created if missing)
+            snapshot_every: deltas after which a new snapshot is taken
+            snapshot_rows: changed rows after which a new snapshot is taken
+            snapshots_kept: snapshots (and their logs) kept for time travel
+        """
+        self.directory = directory
+        self.snapshot_every = snapshot_every
+        self.snapshot_rows = snapshot_rows
+        self.snapshots_kept = snapshots_kept
+        self._lock = threading.Lock()
+        self._logs = {}     # type -> open log file
+        self._seq = {}      # type -> last written sequence number
+        self._pending = {}  # type -> (deltas, changed rows) in the current log
+        self._info = {}     # type -> dataset info of the current chain
+        self._chain = {}    # type -> bumped when an upload or reset replaces the chain
+        self._compacting = {}  # type -> thread writing a periodic snapshot
+        for dataset_type in DATASET_TYPES:
+            os.makedirs(self._folder(dataset_type), exist_ok=True)
+            self._seq[dataset_type] = self._last_seq(dataset_type)
+            self._chain[dataset_type] = 0
+
+    def _folder(self, dataset_type):
+        return os.path.join(self.directory, dataset_type)
+
+    def _snapshots(self, dataset_type):
+        """Sequence numbers of the snapshots on disk, oldest first"""
+        return sorted(
+            int(name[:-len('.snap')]) for name in os.listdir(self._folder(dataset_type))
+            if name.endswith('.snap') and name[:-len('.snap')].isdigit()
+        )
+
+    def _last_seq(self, dataset_type):
+        snapshots = self._snapshots(dataset_type)
+        if not snapshots:
+            return 0
+        deltas, _ = read_log(self._paths(dataset_type, snapshots[-1])[1])
+        return deltas[-1]['seq'] if deltas else snapshots[-1]
+
+    def _paths(self, dataset_type, seq):
+        folder = self._folder(dataset_type)
+        return os.path.join(folder, _name(seq, '.snap')), os.path.join(folder, _name(seq, '.log'))
+
+    def _open_log(self, dataset_type, seq, deltas):
+        old = self._logs.pop(dataset_type, None)
+        if old is not None:
+            old.close()
+        self._logs[dataset_type] = open(self._paths(dataset_type, seq)[1], 'a')
+        self._pending[dataset_type] = (len(deltas), sum(len(delta.get('rows', ())) for delta in deltas))
+
+    def _append(self, dataset_type, delta):
+        log = self._logs.get(dataset_type)
+        if log is None:
+            return False
+        self._seq[dataset_type] += 1
+        delta = dict(delta, seq=self._seq[dataset_type], time=time.time())
+        log.write(json.dumps(delta, separators=(',', ':')) + '\n')
+        log.flush()
+        count, rows = self._pending[dataset_type]
+        self._pending[dataset_type] = (count + 1, rows + len(delta.get('rows', ())))
+        return True
+
+    def _snapshot(self, dataset_type, store, info):
+        seq = self._seq[dataset_type]
+        snapshot_path, _ = self._paths(dataset_type, seq)
+        write_snapshot(snapshot_path, store, {'seq': seq, 'time': time.time(), 'info': info})
+        self._info[dataset_type] = info
+        self._open_log(dataset_type, seq, [])
+        self._prune(dataset_type)
+
+    def _prune(self, dataset_type):
+        for old in self._snapshots(dataset_type)[:-self.snapshots_kept]:
+            old_snapshot, old_log = self._paths(dataset_type, old)
+            shutil.rmtree(old_snapshot, ignore_errors=True)
+            if os.path.exists(old_log):
+                os.remove(old_log)
+
+    def snapshot(self, dataset_type, store, info=None):
+        """
+        Start a new chain from store (a fresh upload)
+
+        Call under the state lock that installs store, so no delta of the
+        previous dataset lands in the new chain or the other way round.
+        """
+        with self._lock:
+            # A periodic snapshot of the previous chain still being written is dropped
+            self._chain[dataset_type] += 1
+            # The upload itself takes a sequence number, so every snapshot has its own
+            self._seq[dataset_type] += 1
+            self._snapshot(dataset_type, store, info)
+
+    def _compact_later(self, dataset_type, store):
+        """Snapshot a copy of store at the current sequence number in the background; call with the lock held"""
+        job = (self._chain[dataset_type], self._seq[dataset_type], store.copy(), self._info.get(dataset_type))
+        thread = threading.Thread(target=self._compact, args=(dataset_type,) + job, daemon=True)
+        self._compacting[dataset_type] = thread
+        thread.start()
+
+    def _compact(self, dataset_type, chain, seq, store, info):
+        """Write the snapshot taken at seq, then make it the head of the chain with the deltas logged since"""
+        snapshot_path, log_path = self._paths(dataset_type, seq)
+        staging = os.path.join(self._folder(dataset_type), _name(seq, '.new'))
+        try:
+            write_snapshot(staging, store, {'seq': seq, 'time': time.time(), 'info': info})
+            with self._lock:
+                log = self._logs.get(dataset_type)
+                if self._chain[dataset_type] != chain or log is None:
+                    shutil.rmtree(staging, ignore_errors=True)
+                    return
+                tail = [delta for delta in read_log(log.name)[0] if delta['seq'] > seq]
+                with open(log_path + '.tmp', 'w') as f:
+                    f.writelines(json.dumps(delta, separators=(',', ':')) + '\n' for delta in tail)
+                # The log goes first: a snapshot on disk always has its complete log
+                os.replace(log_path + '.tmp', log_path)
+                os.replace(staging, snapshot_path)
+                self._open_log(dataset_type, seq, tail)
+                self._prune(dataset_type)
+        except OSError as e:
+            print(f"Warning: snapshot of {dataset_type} in {self.directory} failed: {e}")
+            shutil.rmtree(staging, ignore_errors=True)
+        finally:
+            with self._lock:
+                self._compacting.pop(dataset_type, None)
+
+    def record(self, dataset_type, store, rows, source):
+        """
+        Append the rows of store changed by one mutation
+
+        Call while still holding the state lock the mutation ran under, so the
+        log order matches the order the changes were made in. A snapshot that
+        falls due copies store here and is written in the background.
+
+        Args:
+            rows: changed rows as returned by the store (dicts with the id column)
+            source: what made the change, e.g. 'simulate'
+        """
+        if not rows:
+            return
+        id_column = store.id_column
+        indices = [store.find(row[id_column]) for row in rows]
+        delta = {'source': source, 'rows': [[index, store.delta(index)] for index in indices]}
+        with self._lock:
+            if self._append(dataset_type, delta):
+                count, rows = self._pending[dataset_type]
+                due = count >= self.snapshot_every or rows >= self.snapshot_rows
+                if due and dataset_type not in self._compacting:
+                    self._compact_later(dataset_type, store)
+
+    def recording(self, dataset_type, source, fn):
+        """Wrap a state.update_dataset function so the rows it returns are recorded"""
+        def apply(store):
+            rows = fn(store)
+            if rows:
+                self.record(dataset_type, store, rows, source)
+            return rows
+        return apply
+
+    def reset(self, dataset_type):
+        """Record that the dataset was removed"""
+        with self._lock:
+            self._chain[dataset_type] += 1
+            if self._append(dataset_type, {'reset': True}):
+                self._logs.pop(dataset_type).close()
+
+    def restore(self, dataset_type):
+        """
+        (store, info) for the dataset as last recorded, or None when there is
+        none (never uploaded, or reset since). Later mutations are appended to
+        the restored chain.
+        """
+        with self._lock:
+            snapshots = self._snapshots(dataset_type)
+            if not snapshots:
+                return None
+            snapshot_path, log_path = self._paths(dataset_type, snapshots[-1])
+            store, meta = read_snapshot(snapshot_path)
+            deltas, length = read_log(log_path)
+            self._seq[dataset_type] = deltas[-1]['seq'] if deltas else meta['seq']
+            self._info[dataset_type] = meta.get('info')
+            store = apply_deltas(store, deltas)
+            if store is None:
+                return None
+            # Drop a torn last line so new deltas start on a line of their own
+            if os.path.exists(log_path):
+                os.truncate(log_path, length)
+            self._open_log(dataset_type, snapshots[-1], deltas)
+            return store, meta.get('info')
+
+    def at(self, dataset_type, when=None, seq=None):
+        """
+        The dataset as it was at time when (epoch seconds) or right after delta seq
+
+        Returns:
+            (store, {'seq', 'time'} of the last change applied), or None when
+            no dataset was loaded then or it is older than the kept history
+        """
+        def reached(delta):
+            return delta['seq'] <= seq if seq is not None else delta['time'] <= when
+
+        with self._lock:
+            for snapshot in reversed(self._snapshots(dataset_type)):
+                snapshot_path, log_path = self._paths(dataset_type, snapshot)
+                with open(os.path.join(snapshot_path, 'meta.json')) as f:
+                    meta = json.load(f)
+                if reached(meta):
+                    break
+            else:
+                return None
+            store, meta = read_snapshot(snapshot_path)
+            deltas = [delta for delta in read_log(log_path)[0] if reached(delta)]
+        store = apply_deltas(store, deltas)
+        if store is None:
+            return None
+        last = deltas[-1] if deltas else meta
+        return store, {'seq': last['seq'], 'time': last['time']}
+
+    def history(self, dataset_type):
+        """The snapshots kept for dataset_type and the span of time they cover"""
+        with self._lock:
+            snapshots = []
+            for seq in self._snapshots(dataset_type):
+                snapshot_path, _ = self._paths(dataset_type, seq)
+                with open(os.path.join(snapshot_path, 'meta.json')) as f:
+                    meta = json.load(f)
+                snapshots.append({'seq': seq, 'time': meta['time'], 'rows': meta['rows'],
+                                  'filename': (meta.get('info') or {}).get('filename')})
+            return {
+                'snapshots': snapshots,
+                'lastSeq': self._seq[dataset_type],
+                'deltasSinceSnapshot': self._pending.get(dataset_type, (0, 0))[0]
+            }
+
+    def save_values(self, values):
+        """Write the twin's non-dataset values (counters, mode, ...) next to the datasets"""
+        path = os.path.join(self.directory, STATE_FILE)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(values, f)
+        os.replace(path + '.tmp', path)
+
+    def load_values(self):
+        """Values written by save_values, or {} when there are none"""
+        try:
+            with open(os.path.join(self.directory, STATE_FILE)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except ValueError as e:
+            print(f"Warning: ignoring unreadable {STATE_FILE} in {self.directory}: {e}")
+            return {}
+
+    def close(self):
+        with self._lock:
+            writers = list(self._compacting.values())
+        for writer in writers:
+            writer.join()
+        with self._lock:
+            for log in self._logs.values():
+                log.close()
+            self._logs.clear()
@@ -0,0 +1,470 @@
+"""
+Discrete-event simulation of the uploaded digital twin
+
+TwinSimulator advances the hospital and warehouse datasets through a priority
+queue of timestamped events rather than fixed steps:
+
+- patient arrivals (Poisson, per 100 beds) take a random available bed, or
+  wait for the next bed that comes back from cleaning
+- an admitted patient is discharged after a gamma-distributed stay, and the
+  bed is then cleaned for a gamma-distributed time before it is available
+- picks (Poisson, per 100 shelves) take 1-5 items from a random shelf; shelves
+  that fall to the reorder level of their capacity are refilled by restocks
+
+Beds that are occupied or being cleaned when the simulation starts finish
+relative to their last_updated time, so the run continues from the uploaded
+state. Rates are the SimulationEngine settings (see simulation.py).
+
+The simulator keeps its own copy of the twin in plain lists and writes only
+the beds and shelves that changed back into a dataset store (write_beds /
+write_shelves), so days of simulated time run in seconds. LiveSimulation runs
+it in a background thread against the live twin at a fixed speed-up.
+"""
+import heapq
+import itertools
+import random
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+import numpy as np
+
+from dataset_store import TIMESTAMP_FORMAT
+from simulation import PATIENT_PREFIX, PICK_SIZE, REORDER_LEVEL, RandomSet
+
+DURATION_SHAPE = 3       # gamma shape of stays and cleaning times (1 would be exponential)
+MAX_FAST_FORWARD = 30 * 86400
+DEFAULT_SAMPLE_SECONDS = 3600
+MAX_SAMPLES = 720        # timeline points kept per run; the sample step grows to fit
+LIVE_TICK_SECONDS = 1.0
+DEFAULT_SPEED = 60.0     # simulated seconds per wall-clock second
+MAX_SPEED = 86400.0
+
+# Event kinds
+ARRIVAL, DISCHARGE, CLEANED, PICK, RESTOCK = range(5)
+# Bed states; OTHER (maintenance, reserved, ...) is left untouched
+AVAILABLE, OCCUPIED, CLEANING, OTHER = range(4)
+STATE_STATUS = {AVAILABLE: 'available', OCCUPIED: 'occupied', CLEANING: 'cleaning'}
+
+
+def _format_time(epoch):
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime(TIMESTAMP_FORMAT)
+
+
+class TwinSimulator:
+    def __init__(self, rates, hospital=None, warehouse=None, seed=None, start=None,
+                 sample_seconds=DEFAULT_SAMPLE_SECONDS):
+        """
+        Args:
+            rates: event rates per minute (SimulationEngine.config())
+            hospital: HospitalDataset to start from, or None
+            warehouse: WarehouseDataset to start from, or None
+            seed: integer seed, or None for a fresh random stream
+            start: simulated start time in epoch seconds; defaults to the
+                latest last_updated in the hospital data, else now
+            sample_seconds: simulated seconds between timeline samples
+        """
+        self.rng = random.Random(seed)
+        self.queue = []
+        self._seq = itertools.count()
+        self.events = 0
+        self.sample_seconds = max(float(sample_seconds), 1.0)
+        self.samples = []
+
+        if start is None and hospital is not None and len(hospital) and not np.isnan(hospital.last_updated).all():
+            start = float(np.nanmax(hospital.last_updated))
+        self.start = self.clock = float(start if start is not None else time.time())
+        self._next_sample = self.start
+        self._area = {'occupied': 0.0, 'waiting': 0.0, 'items': 0.0}
+
+        self.stay = 1 / rates['discharge_rate'] * 60 if rates['discharge_rate'] > 0 else None
+        self.cleaning = 1 / rates['cleaning_rate'] * 60 if rates['cleaning_rate'] > 0 else None
+        self.has_hospital = hospital is not None
+        self.has_warehouse = warehouse is not None
+        self._init_hospital(hospital, rates['arrival_rate'])
+        self._init_warehouse(warehouse, rates['pick_rate'], rates['restock_rate'])
+
+    def _schedule(self, t, kind, idx=None):
+        heapq.heappush(self.queue, (t, next(self._seq), kind, idx))
+
+    def _duration(self, mean):
+        return self.rng.gammavariate(DURATION_SHAPE, mean / DURATION_SHAPE)
+
+    def _remaining(self, mean, elapsed):
+        """Time left of a stay or cleaning that has already lasted `elapsed` seconds"""
+        for _ in range(8):
+            duration = self._duration(mean)
+            if duration > elapsed:
+                return duration - elapsed
+        # Far in the tail: finish soon
+        return self.rng.expovariate(DURATION_SHAPE / mean)
+
+    def _interval(self, rate_per_minute, units):
+        """Mean seconds between facility-wide events for a rate per 100 units, or None when off"""
+        per_second = rate_per_minute * units / 100 / 60
+        return 1 / per_second if per_second > 0 else None
+
+    def _init_hospital(self, hospital, arrival_rate):
+        self.bed_state = []
+        self.bed_patient = {}
+        self.bed_time = {}
+        self.changed_beds = set()
+        self.free = RandomSet()
+        self.waiting = deque()
+        self.hospital_counts = dict.fromkeys(('arrivals', 'admissions', 'discharges', 'cleanings'), 0)
+        self._waits = [0.0, 0]  # total seconds waited, patients admitted from the queue
+        self._max_waiting = 0
+        self._patients = itertools.count(1)
+        self.occupied = self.cleaning_beds = 0
+        self.arrival_interval = None
+        if hospital is None:
+            return
+
+        statuses = hospital.status.values()
+        state = np.full(len(hospital), OTHER, dtype=np.int8)
+        state[statuses == 'available'] = AVAILABLE
+        state[(statuses == 'occupied') | (statuses == 'critical')] = OCCUPIED
+        state[statuses == 'cleaning'] = CLEANING
+        self.bed_state = state.tolist()
+        elapsed = np.nan_to_num(self.start - hospital.last_updated, nan=0.0).clip(min=0).tolist()
+        for idx, bed in enumerate(self.bed_state):
+            if bed == AVAILABLE:
+                self.free.add(idx)
+            elif bed == OCCUPIED:
+                self.occupied += 1
+                if self.stay:
+                    self._schedule(self.start + self._remaining(self.stay, elapsed[idx]), DISCHARGE, idx)
+            elif bed == CLEANING:
+                self.cleaning_beds += 1
+                if self.cleaning:
+                    self._schedule(self.start + self._remaining(self.cleaning, elapsed[idx]), CLEANED, idx)
+
+        self.arrival_interval = self._interval(arrival_rate, len(hospital))
+        if self.arrival_interval:
+            self._schedule(self.start + self.rng.expovariate(1 / self.arrival_interval), ARRIVAL)
+
+    def _init_warehouse(self, warehouse, pick_rate, restock_rate):
+        self.items = []
+        self.capacity = []
+        self.changed_shelves = set()
+        self.due = RandomSet()
+        self.warehouse_counts = dict.fromkeys(('picks', 'itemsPicked', 'missedPicks', 'restocks', 'itemsRestocked'), 0)
+        self.stocked = self.total_items = self.total_capacity = 0
+        self.pick_interval = self.restock_interval = None
+        if warehouse is None:
+            return
+
+        self.items = warehouse.item_count.astype(np.int64).tolist()
+        self.capacity = warehouse.capacity.astype(np.int64).tolist()
+        for idx, (count, capacity) in enumerate(zip(self.items, self.capacity)):
+            if 0 < capacity and count <= capacity * REORDER_LEVEL:
+                self.due.add(idx)
+        self.stocked = sum(1 for count in self.items if count > 0)
+        self.total_items = sum(self.items)
+        self.total_capacity = sum(self.capacity)
+
+        self.pick_interval = self._interval(pick_rate, len(warehouse))
+        self.restock_interval = self._interval(restock_rate, len(warehouse))
+        if self.pick_interval:
+            self._schedule(self.start + self.rng.expovariate(1 / self.pick_interval), PICK)
+        if self.restock_interval:
+            self._schedule(self.start + self.rng.expovariate(1 / self.restock_interval), RESTOCK)
+
+    def advance(self, seconds):
+        """Process every event up to `seconds` of simulated time past the clock"""
+        until = self.clock + seconds
+        queue = self.queue
+        while queue and queue[0][0] <= until:
+            t, _, kind, idx = heapq.heappop(queue)
+            self._sample_until(t)
+            self._accumulate(t)
+            self.events += 1
+            if kind == ARRIVAL:
+                self._arrival(t)
+            elif kind == DISCHARGE:
+                self._discharge(t, idx)
+            elif kind == CLEANED:
+                self._cleaned(t, idx)
+            elif kind == PICK:
+                self._pick(t)
+            else:
+                self._restock(t)
+        self._sample_until(until)
+        self._accumulate(until)
+
+    def _accumulate(self, t):
+        dt = t - self.clock
+        if dt > 0:
+            self._area['occupied'] += self.occupied * dt
+            self._area['waiting'] += len(self.waiting) * dt
+            self._area['items'] += self.total_items * dt
+            self.clock = t
+
+    def _sample_until(self, t):
+        while self._next_sample <= t:
+            self.samples.append(self.snapshot(self._next_sample))
+            self._next_sample += self.sample_seconds
+            if len(self.samples) > MAX_SAMPLES:
+                # Keep the timeline bounded: drop every other point and sample half as often
+                self.samples = self.samples[::2]
+                self.sample_seconds *= 2
+                self._next_sample = self.samples[-1]['t'] + self.sample_seconds
+
+    def snapshot(self, t=None):
+        t = self.clock if t is None else t
+        point = {'t': t, 'time': _format_time(t)}
+        if self.has_hospital:
+            point.update(occupied=self.occupied, cleaning=self.cleaning_beds,
+                         available=len(self.free), waiting=len(self.waiting))
+        if self.has_warehouse:
+            point.update(stockedShelves=self.stocked, items=self.total_items)
+        return point
+
+    # Hospital events
+
+    def _admit(self, t, idx):
+        self.bed_state[idx] = OCCUPIED
+        self.bed_patient[idx] = f'{PATIENT_PREFIX}{next(self._patients)}'
+        self.bed_time[idx] = t
+        self.changed_beds.add(idx)
+        self.occupied += 1
+        self.hospital_counts['admissions'] += 1
+        if self.stay:
+            self._schedule(t + self._duration(self.stay), DISCHARGE, idx)
+
+    def _arrival(self, t):
+        self._schedule(t + self.rng.expovariate(1 / self.arrival_interval), ARRIVAL)
+        self.hospital_counts['arrivals'] += 1
+        if len(self.free):
+            self._admit(t, self.free.pop_random(self.rng))
+        else:
+            self.waiting.append(t)
+            self._max_waiting = max(self._max_waiting, len(self.waiting))
+
+    def _discharge(self, t, idx):
+        self.bed_state[idx] = CLEANING
+        self.bed_patient[idx] = ''
+        self.bed_time[idx] = t
+        self.changed_beds.add(idx)
+        self.occupied -= 1
+        self.cleaning_beds += 1
+        self.hospital_counts['discharges'] += 1
+        if self.cleaning:
+            self._schedule(t + self._duration(self.cleaning), CLEANED, idx)
+
+    def _cleaned(self, t, idx):
+        self.cleaning_beds -= 1
+        self.hospital_counts['cleanings'] += 1
+        if self.waiting:
+            self._waits[0] += t - self.waiting.popleft()
+            self._waits[1] += 1
+            self._admit(t, idx)
+            return
+        self.bed_state[idx] = AVAILABLE
+        self.bed_time[idx] = t
+        self.changed_beds.add(idx)
+        self.free.add(idx)
+
+    # Warehouse events
+
+    def _pick(self, t):
+        self._schedule(t + self.rng.expovariate(1 / self.pick_interval), PICK)
+        counts = self.warehouse_counts
+        counts['picks'] += 1
+        rng = self.rng
+        idx = int(rng.random() * len(self.items))
+        count = self.items[idx]
+        if count == 0:
+            counts['missedPicks'] += 1
+            return
+        taken = min(PICK_SIZE[0] + int(rng.random() * (PICK_SIZE[1] - PICK_SIZE[0] + 1)), count)
+        self.items[idx] = count - taken
+        self.total_items -= taken
+        counts['itemsPicked'] += taken
+        if count == taken:
+            self.stocked -= 1
+        if self.items[idx] <= self.capacity[idx] * REORDER_LEVEL:
+            self.due.add(idx)
+        self.changed_shelves.add(idx)
+
+    def _restock(self, t):
+        self._schedule(t + self.rng.expovariate(1 / self.restock_interval), RESTOCK)
+        if not len(self.due):
+            return
+        idx = self.due.pop_random(self.rng)
+        added = self.capacity[idx] - self.items[idx]
+        if self.items[idx] == 0 and added > 0:
+            self.stocked += 1
+        self.items[idx] = self.capacity[idx]
+        self.total_items += added
+        self.warehouse_counts['restocks'] += 1
+        self.warehouse_counts['itemsRestocked'] += added
+        self.changed_shelves.add(idx)
+
+    # Results
+
+    def write_beds(self, beds):
+        """Copy changed beds into a HospitalDataset; returns the updated rows"""
+        rows = [
+            beds.set_status(idx, STATE_STATUS[self.bed_state[idx]], self.bed_patient.get(idx), self.bed_time.get(idx))
+            for idx in sorted(self.changed_beds)
+        ]
+        self.changed_beds.clear()
+        return rows
+
+    def write_shelves(self, shelves):
+        """Copy changed shelves into a WarehouseDataset; returns the updated rows"""
+        rows = [shelves.set_item_count(idx, self.items[idx]) for idx in sorted(self.changed_shelves)]
+        self.changed_shelves.clear()
+        return rows
+
+    def report(self):
+        """Counters and time-averaged levels since the start"""
+        elapsed = self.clock - self.start
+        report = {
+            'start': _format_time(self.start),
+            'clock': _format_time(self.clock),
+            'simulatedSeconds': round(elapsed, 3),
+            'events': self.events
+        }
+        if self.has_hospital:
+            beds = len(self.bed_state)
+            admitted, waited = self._waits[1], self._waits[0]
+            report['hospital'] = dict(
+                self.hospital_counts,
+                occupied=self.occupied,
+                cleaning=self.cleaning_beds,
+                available=len(self.free),
+                waiting=len(self.waiting),
+                maxWaiting=self._max_waiting,
+                meanWaitMinutes=round(waited / admitted / 60, 2) if admitted else 0.0,
+                meanOccupancy=round(self._area['occupied'] / elapsed / beds * 100, 2) if elapsed and beds else None,
+                meanWaiting=round(self._area['waiting'] / elapsed, 2) if elapsed else None
+            )
+        if self.has_warehouse:
+            report['warehouse'] = dict(
+                self.warehouse_counts,
+                stockedShelves=self.stocked,
+                items=self.total_items,
+                fill=round(self.total_items / self.total_capacity * 100, 2) if self.total_capacity else None,
+                meanFill=round(self._area['items'] / elapsed / self.total_capacity * 100, 2)
+                if elapsed and self.total_capacity else None
+            )
+        return report
+
+
+class LiveSimulation:
+    """Runs a TwinSimulator against the live twin's datasets in a background thread"""
+
+    def __init__(self, engine, state, on_update, tick_seconds=LIVE_TICK_SECONDS, wrap_update=None):
+        """
+        Args:
+            engine: SimulationEngine supplying rates and seeds
+            state: StateBackend holding the datasets
+            on_update: fn(changed_beds, changed_shelves, status) called after each tick with changes
+            tick_seconds: wall-clock seconds between ticks
+            wrap_update: optional fn(dataset_type, source, update) returning the
+                update to run under the state lock (e.g. one that journals it)
+        """
+        self.engine = engine
+        self.state = state
+        self.on_update = on_update
+        self.wrap_update = wrap_update
+        self.tick_seconds = tick_seconds
+        self.speed = DEFAULT_SPEED
+        self.simulator = None
+        self._versions = {}
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, speed=None):
+        """Start (or re-speed) the simulation; speed is simulated seconds per second"""
+        with self._lock:
+            if speed is not None:
+                speed = float(speed)
+                if not 0 < speed <= MAX_SPEED:
+                    raise ValueError(f'speed must be between 0 and {MAX_SPEED:g}')
+                self.speed = speed
+            if not self.running:
+                self._stop.clear()
+                self.simulator = None
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            self._stop.set()
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join(timeout=self.tick_seconds * 5)
+
+    def status(self):
+        simulator = self.simulator
+        return {
+            'running': self.running,
+            'speed': self.speed,
+            'report': simulator.report() if simulator is not None else None
+        }
+
+    def _dataset_versions(self):
+        versions = {}
+        for dataset_type in ('hospital', 'warehouse'):
+            store = self.state.get_dataset(dataset_type)
+            versions[dataset_type] = store.version if store is not None else None
+        return versions
+
+    def _build(self):
+        """A simulator over the current datasets, or None when none are loaded"""
+        hospital = self.state.get_dataset('hospital')
+        warehouse = self.state.get_dataset('warehouse')
+        if hospital is None and warehouse is None:
+            return None
+        self._versions = {
+            'hospital': hospital.version if hospital is not None else None,
+            'warehouse': warehouse.version if warehouse is not None else None
+        }
+        return TwinSimulator(self.engine.config(), hospital, warehouse, seed=self.engine.child_seed())
+
+    def _write(self, dataset_type, write):
+        """Apply write(store) if nobody else changed the dataset meanwhile; None on conflict"""
+        def apply(store):
+            if store.version != self._versions[dataset_type]:
+                return None
+            rows = write(store)
+            self._versions[dataset_type] = store.version
+            return rows
+        if self.wrap_update is not None:
+            apply = self.wrap_update(dataset_type, 'live', apply)
+        return self.state.update_dataset(dataset_type, apply)
+
+    def _run(self):
+        last = time.monotonic()
+        while not self._stop.wait(self.tick_seconds):
+            now = time.monotonic()
+            elapsed, last = now - last, now
+            try:
+                # Uploads, resets and manual steps replace the data under us: start over from it
+                if self.simulator is None or self._dataset_versions() != self._versions:
+                    self.simulator = self._build()
+                simulator = self.simulator
+                if simulator is None:
+                    continue
+                simulator.advance(elapsed * self.speed)
+                beds = shelves = []
+                if simulator.changed_beds:
+                    beds = self._write('hospital', simulator.write_beds)
+                if simulator.changed_shelves:
+                    shelves = self._write('warehouse', simulator.write_shelves)
+                if beds is None or shelves is None:
+                    self.simulator = None
+                    continue
+                self.on_update(beds, shelves, self.status())
+            except Exception as e:
+                print(f"Live simulation error: {e}")
+                self.simulator = None
@@ -0,0 +1,261 @@
+"""
+Classical pick-tour routing for warehouse shelves
+
+Shelves are placed by the facility layout (see facility_layout.py), distances
+follow the aisles, and tours are built with nearest-neighbour construction
+followed by 2-opt and Or-opt improvement over the layout's distance matrix.
+
+Local search scores every move at once as n x n matrices, which only pays off
+for small tours. A zone's distances are materialised as a dense matrix only
+up to LOCAL_SEARCH_MAX_STOPS stops. Longer tours are read through
+NodeDistances without copying, and local search runs over consecutive windows
+of that many stops. Each window is an open path between its two fixed end stops.
+"""
+import time
+
+import numpy as np
+
+from dataset_store import WarehouseDataset
+from facility_layout import layout_for
+
+# Improvement loops stop early once this budget is spent
+DEFAULT_TIME_BUDGET = 0.08
+# Largest tour (or window of a tour) local search builds dense matrices for
+LOCAL_SEARCH_MAX_STOPS = 256
+
+
+class NodeDistances:
+    """
+    dist restricted to nodes, read through without building the sub-matrix.
+    Indexes like it: d[i], d[i, j], d[tour, successors] and d[np.ix_(a, b)].
+    """
+
+    def __init__(self, dist, nodes):
+        self.dist = dist
+        self.nodes = np.asarray(nodes)
+        self.shape = (len(self.nodes), len(self.nodes))
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __getitem__(self, key):
+        rows, cols = key if isinstance(key, tuple) else (key, slice(None))
+        return self.dist[self.nodes[rows], self.nodes[cols]]
+
+
+def node_distances(dist, nodes):
+    """Distances among nodes: a dense matrix for tours local search handles whole, else a NodeDistances view"""
+    if len(nodes) <= LOCAL_SEARCH_MAX_STOPS:
+        return dist[np.ix_(nodes, nodes)]
+    return NodeDistances(dist, nodes)
+
+
+def tour_length(tour, dist):
+    """Length of a closed tour given as an array of node indices"""
+    return float(dist[tour, np.roll(tour, -1)].sum())
+
+
+def nearest_neighbour_tour(dist, start=0):
+    """Greedy tour over every node of dist, starting at start"""
+    n = len(dist)
+    visited = np.zeros(n, dtype=bool)
+    tour = np.empty(n, dtype=np.int64)
+    current = start
+    for step in range(n):
+        tour[step] = current
+        visited[current] = True
+        if step == n - 1:
+            break
+        row = np.where(visited, np.inf, dist[current])
+        current = int(np.argmin(row))
+    return tour
+
+
+def _position_distances(tour, dist):
+    """Distances between tour positions, plus the same matrix shifted to each position's successor"""
+    successor = np.roll(np.arange(len(tour)), -1)
+    pos_dist = dist[np.ix_(tour, tour)]
+    return pos_dist, pos_dist[:, successor]
+
+
+def two_opt(tour, dist, deadline=None, closed=True):
+    """
+    Best-improvement 2-opt on a closed tour. Position 0 (the depot) stays fixed.
+
+    The gain of every edge pair is evaluated at once as an n x n matrix, and
+    the best exchange is applied until none improves the tour. With
+    closed=False the tour is an open path from position 0 to the last
+    position, both fixed, and the edge between them is never exchanged.
+    """
+    tour = tour.copy()
+    n = len(tour)
+    if n < 4:
+        return tour
+    idx = np.arange(n)
+    # Exchange edges (i, i+1) and (j, j+1) only for j > i + 1, excluding the
+    # pair that shares the depot
+    valid = idx[None, :] > idx[:, None] + 1
+    valid[0, n - 1] = False
+    if not closed:
+        valid[:, n - 1] = False
+    while deadline is None or time.perf_counter() < deadline:
+        pos_dist, next_dist = _position_distances(tour, dist)
+        edge = np.diagonal(next_dist)
+        gains = edge[:, None] + edge[None, :] - pos_dist - np.roll(next_dist, -1, axis=0)
+        gains[~valid] = 0.0
+        i, j = np.unravel_index(int(np.argmax(gains)), gains.shape)
+        if gains[i, j] <= 1e-9:
+            break
+        tour[i + 1:j + 1] = tour[i + 1:j + 1][::-1]
+    return tour
+
+
+def or_opt(tour, dist, max_segment=3, deadline=None, closed=True):
+    """
+    Or-opt: relocate segments of 1..max_segment stops (optionally reversed)
+    to the cheapest edge elsewhere in the tour. The depot is never moved, and
+    with closed=False neither is the last position (see two_opt).
+
+    All segments of one length are scored against all insertion edges in a
+    single matrix step, and the best move overall is applied.
+    """
+    tour = tour.copy()
+    n = len(tour)
+    if n < 5:
+        return tour
+    idx = np.arange(n)
+    while deadline is None or time.perf_counter() < deadline:
+        pos_dist, next_dist = _position_distances(tour, dist)
+        base = np.diagonal(next_dist)
+        best_gain, best_move = 1e-9, None
+        for length in range(1, min(max_segment, n - 3) + 1):
+            starts = np.arange(1, n - length + (1 if closed else 0))
+            lasts = starts + length - 1
+            afters = (lasts + 1) % n
+            removal = pos_dist[starts - 1, starts] + pos_dist[lasts, afters] - pos_dist[starts - 1, afters]
+
+            # Insertion between positions k and k + 1, keeping or reversing the segment
+            forward = pos_dist[:, starts].T + next_dist[lasts] - base
+            backward = pos_dist[:, lasts].T + next_dist[starts] - base
+            blocked = (idx[None, :] >= starts[:, None] - 1) & (idx[None, :] <= lasts[:, None])
+            cost = np.where(forward <= backward, forward, backward)
+            cost[blocked] = np.inf
+            if not closed:
+                cost[:, n - 1] = np.inf
+            gains = removal[:, None] - cost
+
+            s, k = np.unravel_index(int(np.argmax(gains)), gains.shape)
+            if gains[s, k] > best_gain:
+                best_gain = gains[s, k]
+                best_move = (starts[s], lasts[s], k, backward[s, k] < forward[s, k])
+
+        if best_move is None:
+            break
+        i, last, k, reverse = best_move
+        moved = tour[i:last + 1][::-1] if reverse else tour[i:last + 1]
+        if k < i:
+            tour = np.concatenate((tour[:k + 1], moved, tour[k + 1:i], tour[last + 1:]))
+        else:
+            tour = np.concatenate((tour[:i], tour[last + 1:k + 1], moved, tour[k + 1:]))
+    return tour
+
+
+def _local_search(tour, dist, deadline, closed=True):
+    tour = two_opt(tour, dist, deadline, closed)
+    tour = or_opt(tour, dist, deadline=deadline, closed=closed)
+    return two_opt(tour, dist, deadline, closed)
+
+
+def improve_tour(tour, dist, deadline=None, window=LOCAL_SEARCH_MAX_STOPS):
+    """
+    2-opt, Or-opt, then 2-opt again. Tours longer than window are improved
+    one window of consecutive stops at a time, each over its own small
+    matrix, keeping the stops where windows meet in place.
+    """
+    n = len(tour)
+    if n <= window:
+        return _local_search(tour, dist, deadline)
+    tour = tour.copy()
+    start = 0
+    while start < n - 1 and (deadline is None or time.perf_counter() < deadline):
+        end = min(start + window, n)
+        stops = tour[start:end]
+        order = _local_search(np.arange(len(stops)), dist[np.ix_(stops, stops)], deadline, closed=False)
+        tour[start:end] = stops[order]
+        start = end - 1
+    return tour
+
+
+def solve_tour(dist, improve=True, deadline=None):
+    """Nearest-neighbour tour from node 0, refined with 2-opt then Or-opt"""
+    tour = nearest_neighbour_tour(dist)
+    return improve_tour(tour, dist, deadline) if improve else tour
+
+
+class WarehouseRouter:
+    def __init__(self, shelves, layout=None):
+        """
+        Args:
+            shelves: WarehouseDataset (or a list of shelf rows, converted on the fly)
+            layout: optional FacilityLayout for these shelves (default: the
+                cached layout_for(shelves))
+        """
+        if not isinstance(shelves, WarehouseDataset):
+            shelves = WarehouseDataset.from_rows(shelves)
+        self.shelves = shelves
+        self.ids = shelves.ids.tolist()
+        self.zones = shelves.zone.values().tolist()
+        self.layout = layout if layout is not None and len(layout) == len(shelves) else layout_for(shelves)
+        # Node 0 is the dispatch dock at the front of the first aisle
+        self.x = self.layout.node_x
+        self.y = self.layout.node_y
+        self.dist = self.layout.dist
+
+    def pick_list(self):
+        """Indices (into shelves) of every shelf that currently holds items"""
+        return np.nonzero(self.shelves.item_count > 0)[0].tolist()
+
+    def solve(self, picks=None, by_zone=True, time_budget=DEFAULT_TIME_BUDGET):
+        """
+        Build pick tours from the dock
+
+        Args:
+            picks: shelf indices to visit (defaults to pick_list())
+            by_zone: one tour per zone instead of a single tour
+            time_budget: seconds allowed for local search across all tours
+
+        Returns:
+            dict with one entry per tour plus totals
+        """
+        start = time.perf_counter()
+        deadline = start + time_budget if time_budget else None
+        if picks is None:
+            picks = self.pick_list()
+
+        groups = {}
+        for idx in picks:
+            groups.setdefault(self.zones[idx] if by_zone else 'all', []).append(idx)
+
+        tours = []
+        total = 0.0
+        baseline = 0.0
+        for zone in sorted(groups):
+            nodes = np.array([0] + [idx + 1 for idx in groups[zone]])
+            sub = node_distances(self.dist, nodes)
+            order = solve_tour(sub, deadline=deadline)
+            length = tour_length(order, sub)
+            baseline += tour_length(np.arange(len(nodes)), sub)
+            total += length
+            tours.append({
+                'zone': zone,
+                'stops': [self.ids[nodes[k] - 1] for k in order[1:]],
+                'distance': round(length, 2)
+            })
+
+        return {
+            'tours': tours,
+            'total_distance': round(total, 2),
+            'baseline_distance': round(baseline, 2),
+            'stops': len(picks),
+            'solve_ms': round((time.perf_counter() - start) * 1000, 2)
+        }
@@ -1,16 +1,31 @@
 import { useMemo } from 'react'
 import { Box, Text } from '@react-three/drei'
 
-const Hospital3D = ({ stats, occupiedColor = '#ef4444', labelPrefix = 'Room' }) => {
+// Scene positions from a /api/layout response, centred on the floor; null
+// when there is no layout for these rows
+const floorPositions = (layout, count, scale) => {
+  if (!layout || layout.x.length !== count) return null
+  const centre = (values) => (values.reduce((a, b) => Math.min(a, b)) + values.reduce((a, b) => Math.max(a, b))) / 2
+  const cx = centre(layout.x)
+  const cy = centre(layout.y)
+  return {
+    x: layout.x.map(value => (value - cx) * scale),
+    z: layout.y.map(value => (value - cy) * scale)
+  }
+}
+
+const Hospital3D = ({ stats, layout, occupiedColor = '#ef4444', labelPrefix = 'Room' }) => {
   const gridSize = 10
   const bedsPerRow = 10
   const bedsPerCol = 10
+  const layoutScale = 0.375 // scene units per metre of the floor layout
 
   const beds = useMemo(() => {
     const bedArray = []
 
     // Check if we have uploaded/custom data
     if (stats.bedData && stats.bedData.length > 0) {
+      const position = floorPositions(layout, stats.bedData.length, layoutScale)
       stats.bedData.forEach((bed, index) => {
         const row = Math.floor(index / bedsPerRow)
         const col = index % bedsPerRow
@@ -23,8 +38,8 @@ const Hospital3D = ({ stats, occupiedColor = '#ef4444', labelPrefix = 'Room' })
         else if (status === 'critical') color = '#7f1d1d' // dark red
 
         bedArray.push({
-          x: (col - bedsPerRow / 2) * 1.5,
-          z: (row - bedsPerCol / 2) * 1.5,
+          x: position ? position.x[index] : (col - bedsPerRow / 2) * 1.5,
+          z: position ? position.z[index] : (row - bedsPerCol / 2) * 1.5,
           occupied: status === 'occupied' || status === 'critical',
           status: status,
           color: color,
@@ -56,7 +71,7 @@ const Hospital3D = ({ stats, occupiedColor = '#ef4444', labelPrefix = 'Room' })
       }
     }
     return bedArray
-  }, [stats.totalBeds, stats.occupied, stats.bedData, occupiedColor])
+  }, [stats.totalBeds, stats.occupied, stats.bedData, layout, occupiedColor])
 
   return (
     <group>
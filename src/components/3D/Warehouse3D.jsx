@@ -1,10 +1,24 @@
 import { useMemo } from 'react'
 import { Box, Text } from '@react-three/drei'
 
-const Warehouse3D = ({ stats, occupiedColor = '#f59e0b', labelPrefix = 'S' }) => {
+// Scene positions from a /api/layout response, centred on the floor; null
+// when there is no layout for these rows
+const floorPositions = (layout, count, scale) => {
+  if (!layout || layout.x.length !== count) return null
+  const centre = (values) => (values.reduce((a, b) => Math.min(a, b)) + values.reduce((a, b) => Math.max(a, b))) / 2
+  const cx = centre(layout.x)
+  const cy = centre(layout.y)
+  return {
+    x: layout.x.map(value => (value - cx) * scale),
+    z: layout.y.map(value => (value - cy) * scale)
+  }
+}
+
+const Warehouse3D = ({ stats, layout, occupiedColor = '#f59e0b', labelPrefix = 'S' }) => {
   const shelfRows = 5
   const shelfCols = 10
   const shelvesPerUnit = 3
+  const layoutScale = 1 // scene units per metre of the floor layout
 
   const shelves = useMemo(() => {
     const shelfArray = []
@@ -13,6 +27,7 @@ const Warehouse3D = ({ stats, occupiedColor = '#f59e0b', labelPrefix = 'S' }) =>
     if (stats.shelfData && stats.shelfData.length > 0) {
       const count = stats.shelfData.length
       const dynamicCols = Math.ceil(Math.sqrt(count * 2))
+      const position = floorPositions(layout, count, layoutScale)
 
       stats.shelfData.forEach((shelf, index) => {
         const row = Math.floor(index / dynamicCols)
@@ -34,8 +49,8 @@ const Warehouse3D = ({ stats, occupiedColor = '#f59e0b', labelPrefix = 'S' }) =>
         }
 
         shelfArray.push({
-          x: (col - dynamicCols / 2) * 2.5,
-          z: (row - (count / dynamicCols) / 2) * 2,
+          x: position ? position.x[index] : (col - dynamicCols / 2) * 2.5,
+          z: position ? position.z[index] : (row - (count / dynamicCols) / 2) * 2,
           occupied: current > 0,
           color: color,
           status: status,
@@ -68,7 +83,7 @@ const Warehouse3D = ({ stats, occupiedColor = '#f59e0b', labelPrefix = 'S' }) =>
       }
     }
     return shelfArray
-  }, [stats.totalShelves, stats.occupied, stats.shelfData, occupiedColor])
+  }, [stats.totalShelves, stats.occupied, stats.shelfData, layout, occupiedColor])
 
   return (
     <group>
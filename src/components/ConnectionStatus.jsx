@@ -1,33 +1,14 @@
-import { useState, useEffect } from 'react'
+import { useState } from 'react'
 import { Wifi, WifiOff, AlertCircle } from 'lucide-react'
-import axios from 'axios'
+import { useLiveStream } from '../context/LiveStreamContext'
 
 const ConnectionStatus = () => {
-  const [status, setStatus] = useState('checking') // 'connected', 'disconnected', 'checking'
+  const { connected } = useLiveStream()
   const [showDetails, setShowDetails] = useState(false)
 
-  useEffect(() => {
-    const checkConnection = async () => {
-      try {
-        const response = await axios.get('/api/health', { timeout: 3000 })
-        if (response.data.status === 'healthy') {
-          setStatus('connected')
-        } else {
-          setStatus('disconnected')
-        }
-      } catch (error) {
-        setStatus('disconnected')
-      }
-    }
-
-    // Check immediately
-    checkConnection()
-
-    // Check every 5 seconds
-    const interval = setInterval(checkConnection, 5000)
-
-    return () => clearInterval(interval)
-  }, [])
+  // The shared live stream doubles as the health check: EventSource reports
+  // open/error itself, so there is no separate /api/health polling
+  const status = connected === null ? 'checking' : connected ? 'connected' : 'disconnected'
 
   if (status === 'checking') {
     return (
@@ -9,6 +9,7 @@ import {
     ArrowPathIcon,
     ExclamationCircleIcon
 } from '@heroicons/react/24/outline'
+import { useStreamEvent } from '../context/LiveStreamContext'
 
 const steps = [
     { id: 'upload', label: 'Uploading file...' },
@@ -39,6 +40,13 @@ const DataUpload = ({ onUploadSuccess }) => {
         }
     }, [])
 
+    // The backend parses uploads in chunks and reports rows loaded so far
+    useStreamEvent('upload', (progress) => {
+        if (uploadedFile && progress.filename === uploadedFile.name) {
+            setRowCount(progress.rows)
+        }
+    })
+
     const { getRootProps, getInputProps, isDragActive } = useDropzone({
         onDrop,
         accept: {
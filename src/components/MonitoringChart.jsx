@@ -1,13 +1,8 @@
 import { LineChart, Line, XAxis, YAxis, CartesianGrid, Tooltip, ResponsiveContainer, Area, AreaChart } from 'recharts'
 
 const MonitoringChart = ({ title, data = [], color = '#4ade80', yAxisLabel = '' }) => {
-  // Ensure chartData is always defined
-  const chartData = data.length > 0
-    ? data
-    : Array.from({ length: 10 }, (_, i) => ({
-        time: `${i * 2}s`,
-        value: Math.random() * 100
-      }))
+  // Points come from the backend's monitoring history; empty steps have a null value
+  const chartData = data || []
 
   return (
     <div className="glass-strong rounded-xl p-6">
@@ -45,6 +40,7 @@ const MonitoringChart = ({ title, data = [], color = '#4ade80', yAxisLabel = ''
             stroke={color} 
             fill={`url(#gradient-${color})`}
             strokeWidth={2}
+            connectNulls
           />
         </AreaChart>
       </ResponsiveContainer>
@@ -0,0 +1,65 @@
+import { createContext, useState, useContext, useEffect, useRef, useCallback } from 'react'
+
+const LiveStreamContext = createContext()
+
+export const useLiveStream = () => useContext(LiveStreamContext)
+
+// Subscribe a handler to one backend event type for the lifetime of a component
+export const useStreamEvent = (event, handler) => {
+    const { subscribe } = useLiveStream()
+    const handlerRef = useRef(handler)
+    handlerRef.current = handler
+
+    useEffect(() => subscribe(event, (data) => handlerRef.current(data)), [event, subscribe])
+}
+
+// One EventSource per tab, shared by every page, replaces per-endpoint polling
+export const LiveStreamProvider = ({ children }) => {
+    const [connected, setConnected] = useState(null) // null = connecting
+    const listeners = useRef({})
+    const source = useRef(null)
+
+    const subscribe = useCallback((event, handler) => {
+        if (!listeners.current[event]) {
+            listeners.current[event] = new Set()
+            if (source.current) {
+                source.current.addEventListener(event, (e) => dispatch(event, e))
+            }
+        }
+        listeners.current[event].add(handler)
+        return () => listeners.current[event].delete(handler)
+    }, [])
+
+    const dispatch = (event, e) => {
+        let data
+        try {
+            data = JSON.parse(e.data)
+        } catch (error) {
+            console.error('Bad stream event', event, error)
+            return
+        }
+        listeners.current[event]?.forEach(handler => handler(data))
+    }
+
+    useEffect(() => {
+        const es = new EventSource('/api/stream')
+        source.current = es
+        Object.keys(listeners.current).forEach(event => {
+            es.addEventListener(event, (e) => dispatch(event, e))
+        })
+        // EventSource reconnects on its own; we only track the state
+        es.onopen = () => setConnected(true)
+        es.onerror = () => setConnected(false)
+
+        return () => {
+            es.close()
+            source.current = null
+        }
+    }, [])
+
+    return (
+        <LiveStreamContext.Provider value={{ connected, subscribe }}>
+            {children}
+        </LiveStreamContext.Provider>
+    )
+}
@@ -1,41 +1,47 @@
-import { createContext, useState, useContext, useEffect } from 'react'
+import { createContext, useState, useContext, useEffect, useCallback } from 'react'
 import axios from 'axios'
+import { useStreamEvent } from './LiveStreamContext'
 
 const SimulationContext = createContext()
 
 export const useSimulation = () => useContext(SimulationContext)
 
+// Simulated seconds per real second: one simulated minute every second
+const SIMULATION_SPEED = 60
+
 export const SimulationProvider = ({ children }) => {
-    const [isSimulating, setIsSimulating] = useState(false)
+    const [isSimulating, setSimulating] = useState(false)
     const [simulationStatus, setSimulationStatus] = useState(null)
 
+    // The backend runs the simulation; pick up a run started from another tab
     useEffect(() => {
-        let interval
-        if (isSimulating) {
-            // Run immediately
-            const runSim = async () => {
-                try {
-                    const res = await axios.post('/api/demo/simulate')
-                    if (res.data.changes && res.data.changes.length > 0) {
-                        setSimulationStatus(`Updated ${res.data.changes.length} items`)
-                        // Trigger global event for components to refresh
-                        window.dispatchEvent(new Event('demoDataUpdated'))
-
-                        // Clear status after a bit
-                        setTimeout(() => setSimulationStatus(null), 1500)
-                    }
-                } catch (e) {
-                    console.error("Simulation error", e)
-                    setIsSimulating(false) // Stop on error?
-                }
-            }
-
-            runSim()
-            interval = setInterval(runSim, 3000) // Every 3 seconds
+        axios.get('/api/simulation/status')
+            .then(res => setSimulating(res.data.running))
+            .catch(() => {})
+    }, [])
+
+    // Each tick pushes the changed beds/shelves on their own events plus a status
+    useStreamEvent('simulation', (status) => {
+        setSimulating(status.running)
+        if (status.running && status.report) {
+            setSimulationStatus(`Simulated time ${status.report.clock} (${status.report.events} events)`)
+        } else {
+            setSimulationStatus(null)
         }
-
-        return () => clearInterval(interval)
-    }, [isSimulating])
+    })
+
+    const setIsSimulating = useCallback(async (running) => {
+        try {
+            const res = running
+                ? await axios.post('/api/simulation/start', { speed: SIMULATION_SPEED })
+                : await axios.post('/api/simulation/stop')
+            setSimulating(res.data.running)
+        } catch (e) {
+            console.error("Simulation error", e)
+            setSimulationStatus(e.response?.data?.message || 'Simulation unavailable')
+            setSimulating(false)
+        }
+    }, [])
 
     return (
         <SimulationContext.Provider value={{ isSimulating, setIsSimulating, simulationStatus }}>
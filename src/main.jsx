@@ -4,12 +4,15 @@ import App from './App.jsx'
 import './index.css'
 
 import { SimulationProvider } from './context/SimulationContext'
+import { LiveStreamProvider } from './context/LiveStreamContext'
 
 ReactDOM.createRoot(document.getElementById('root')).render(
   <React.StrictMode>
-    <SimulationProvider>
-      <App />
-    </SimulationProvider>
+    <LiveStreamProvider>
+      <SimulationProvider>
+        <App />
+      </SimulationProvider>
+    </LiveStreamProvider>
   </React.StrictMode>,
 )
 
@@ -6,7 +6,7 @@ import DataUpload from '../components/DataUpload'
 import { useSimulation } from '../context/SimulationContext'
 
 const DemoDataEditor = () => {
-  const { isSimulating, setIsSimulating } = useSimulation()
+  const { isSimulating, setIsSimulating, simulationStatus } = useSimulation()
   const [activeTab, setActiveTab] = useState('manual')
 
   const [hospitalData, setHospitalData] = useState({
@@ -117,6 +117,7 @@ const DemoDataEditor = () => {
         <div>
           <h1 className="text-3xl font-bold text-white mb-2">System Control Panel</h1>
           <p className="text-gray-400">Manage demo data, simulation states, and dataset uploads.</p>
+          {simulationStatus && <p className="text-xs text-green-400 mt-1">{simulationStatus}</p>}
         </div>
         <div className="flex flex-wrap gap-3">
           <button
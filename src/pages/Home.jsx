@@ -3,6 +3,7 @@ import { Activity, Zap, TrendingUp, Clock } from 'lucide-react'
 import MetricsCard from '../components/MetricsCard'
 import MonitoringChart from '../components/MonitoringChart'
 import axios from 'axios'
+import { useStreamEvent } from '../context/LiveStreamContext'
 
 // Add error handling wrapper for API calls
 const apiCall = async (url, options = {}) => {
@@ -16,6 +17,16 @@ const apiCall = async (url, options = {}) => {
   }
 }
 
+// Monitoring windows in seconds; the stream pushes the default one
+const DEFAULT_WINDOW = 60
+const WINDOWS = [
+  { label: '1m', seconds: 60 },
+  { label: '15m', seconds: 900 },
+  { label: '1h', seconds: 3600 },
+  { label: '24h', seconds: 86400 },
+  { label: '7d', seconds: 604800 }
+]
+
 const Home = ({ industry }) => {
   const [metrics, setMetrics] = useState({
     activeOptimizations: 0,
@@ -30,9 +41,9 @@ const Home = ({ industry }) => {
     responseTimes: [],
     accuracy: [],
     errors: [],
-    costSaved: [],
-    energySaved: []
+    throughput: []
   })
+  const [chartWindow, setChartWindow] = useState(DEFAULT_WINDOW)
 
   useEffect(() => {
     const fetchMetrics = async () => {
@@ -44,33 +55,32 @@ const Home = ({ industry }) => {
       }
     }
 
-    // Get refresh interval from settings
-    const saved = localStorage.getItem('quantum-platform-settings')
-    const refreshInterval = saved ? JSON.parse(saved).refreshInterval || 2000 : 2000
-
+    // Fetch once; later changes arrive over the live stream
     fetchMetrics()
-    const interval = setInterval(fetchMetrics, refreshInterval)
-    return () => clearInterval(interval)
   }, [])
 
-  useEffect(() => {
-    const fetchChartData = async () => {
-      try {
-        const response = await apiCall('/api/monitoring')
-        setChartData(response.data)
-      } catch (error) {
-        console.error('Error fetching chart data:', error)
-      }
+  const fetchChartData = async (seconds) => {
+    try {
+      const response = await apiCall('/api/monitoring', { params: { window: seconds } })
+      setChartData(response.data)
+    } catch (error) {
+      console.error('Error fetching chart data:', error)
     }
+  }
 
-    // Get refresh interval from settings
-    const saved = localStorage.getItem('quantum-platform-settings')
-    const refreshInterval = saved ? JSON.parse(saved).refreshInterval || 2000 : 2000
+  useEffect(() => {
+    fetchChartData(chartWindow)
+  }, [chartWindow])
 
-    fetchChartData()
-    const interval = setInterval(fetchChartData, refreshInterval)
-    return () => clearInterval(interval)
-  }, [])
+  useStreamEvent('metrics', setMetrics)
+  // Stream ticks carry the default window; other windows are refetched on each tick
+  useStreamEvent('monitoring', (data) => {
+    if (chartWindow === DEFAULT_WINDOW) {
+      setChartData(data)
+    } else {
+      fetchChartData(chartWindow)
+    }
+  })
 
   return (
     <div className="space-y-6">
@@ -126,6 +136,18 @@ const Home = ({ industry }) => {
         />
       </div>
 
+      <div className="flex justify-end gap-2">
+        {WINDOWS.map(({ label, seconds }) => (
+          <button
+            key={label}
+            onClick={() => setChartWindow(seconds)}
+            className={`px-3 py-1 rounded-lg text-xs transition-colors ${chartWindow === seconds ? 'bg-indigo-500 text-white' : 'bg-gray-700/50 text-gray-400 hover:text-white'}`}
+          >
+            {label}
+          </button>
+        ))}
+      </div>
+
       <div className="grid grid-cols-1 lg:grid-cols-2 gap-6">
         <MonitoringChart
           title="Response Times"
@@ -146,15 +168,9 @@ const Home = ({ industry }) => {
           yAxisLabel="count"
         />
         <MonitoringChart
-          title="Cost over time"
-          data={chartData.costSaved}
-          color="#ef4444"
-          yAxisLabel="count"
-        />
-        <MonitoringChart
-          title="Energy over time"
-          data={chartData.energySaved}
-          color="#ef4444"
+          title="Throughput"
+          data={chartData.throughput}
+          color="#22c55e"
           yAxisLabel="count"
         />
       </div>
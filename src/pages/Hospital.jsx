@@ -4,6 +4,7 @@ import { OrbitControls, PerspectiveCamera } from '@react-three/drei'
 import Hospital3D from '../components/3D/Hospital3D'
 import { Activity, Users, AlertCircle } from 'lucide-react'
 import axios from 'axios'
+import { useStreamEvent } from '../context/LiveStreamContext'
 
 const Hospital = () => {
   const [stats, setStats] = useState({
@@ -14,17 +15,19 @@ const Hospital = () => {
   })
 
   const [occupiedColor, setOccupiedColor] = useState('#ef4444')
+  const [layout, setLayout] = useState(null)
   const [labelPrefix, setLabelPrefix] = useState('Room')
 
   const fetchStats = async () => {
     try {
-      const response = await axios.get('/api/hospital/stats').catch(err => {
+      const response = await axios.get('/api/hospital/stats', { params: { include: 'rows' } }).catch(err => {
         if (err.code === 'ECONNREFUSED') {
           console.error('Backend not running. Start Flask server on port 5000.')
         }
         throw err
       })
       setStats(response.data)
+      fetchLayout(response.data.bedData)
       if (response.data.occupiedColor) {
         setOccupiedColor(response.data.occupiedColor)
       }
@@ -36,23 +39,47 @@ const Hospital = () => {
     }
   }
 
+  // Uploaded beds are placed at their floor coordinates from the backend
+  const fetchLayout = async (rows) => {
+    if (!rows || rows.length === 0) {
+      setLayout(null)
+      return
+    }
+    try {
+      const response = await axios.get('/api/layout/hospital')
+      setLayout(response.data.layout)
+    } catch (error) {
+      setLayout(null)
+    }
+  }
+
   useEffect(() => {
     fetchStats()
-    // In demo mode, check less frequently to avoid overwriting manual data
-    const interval = setInterval(fetchStats, 2000)
-    return () => clearInterval(interval)
   }, [])
 
-  // Force refresh when demo data is updated
-  useEffect(() => {
-    const handleDemoDataUpdate = () => {
-      fetchStats()
+  // Apply pushed changes instead of polling: counters are replaced and only
+  // the rows that changed are patched into the local copy
+  useStreamEvent('hospital', (update) => {
+    const { changedBeds, ...summary } = update
+    setStats(prev => {
+      const next = { ...prev, ...summary }
+      if (changedBeds && prev.bedData) {
+        const changed = new Map(changedBeds.map(row => [row.bed_id, row]))
+        next.bedData = prev.bedData.map(row => changed.get(row.bed_id) || row)
+      }
+      return next
+    })
+    if (summary.occupiedColor) {
+      setOccupiedColor(summary.occupiedColor)
     }
-    window.addEventListener('demoDataUpdated', handleDemoDataUpdate)
-    return () => {
-      window.removeEventListener('demoDataUpdated', handleDemoDataUpdate)
+    if (summary.labelPrefix) {
+      setLabelPrefix(summary.labelPrefix)
     }
-  }, [])
+  })
+
+  // A new upload or a reset replaces the rows, so fetch them once
+  useStreamEvent('dataset', fetchStats)
+  useStreamEvent('reset', fetchStats)
 
   const handleOptimize = async () => {
     try {
@@ -126,7 +153,7 @@ const Hospital = () => {
           <PerspectiveCamera makeDefault position={[15, 15, 15]} />
           <ambientLight intensity={0.5} />
           <directionalLight position={[10, 10, 5]} intensity={1} castShadow />
-          <Hospital3D stats={stats} occupiedColor={occupiedColor} labelPrefix={labelPrefix} />
+          <Hospital3D stats={stats} layout={layout} occupiedColor={occupiedColor} labelPrefix={labelPrefix} />
           <OrbitControls enablePan={true} enableZoom={true} enableRotate={true} />
         </Canvas>
       </div>
@@ -4,6 +4,7 @@ import { OrbitControls, PerspectiveCamera } from '@react-three/drei'
 import Warehouse3D from '../components/3D/Warehouse3D'
 import { Package, TrendingUp, AlertCircle } from 'lucide-react'
 import axios from 'axios'
+import { useStreamEvent } from '../context/LiveStreamContext'
 
 const Warehouse = () => {
   const [stats, setStats] = useState({
@@ -14,17 +15,19 @@ const Warehouse = () => {
   })
 
   const [occupiedColor, setOccupiedColor] = useState('#f59e0b')
+  const [layout, setLayout] = useState(null)
   const [labelPrefix, setLabelPrefix] = useState('S')
 
   const fetchStats = async () => {
     try {
-      const response = await axios.get('/api/warehouse/stats').catch(err => {
+      const response = await axios.get('/api/warehouse/stats', { params: { include: 'rows' } }).catch(err => {
         if (err.code === 'ECONNREFUSED') {
           console.error('Backend not running. Start Flask server on port 5000.')
         }
         throw err
       })
       setStats(response.data)
+      fetchLayout(response.data.shelfData)
       if (response.data.occupiedColor) {
         setOccupiedColor(response.data.occupiedColor)
       }
@@ -36,22 +39,47 @@ const Warehouse = () => {
     }
   }
 
+  // Uploaded shelves are placed at their floor coordinates from the backend
+  const fetchLayout = async (rows) => {
+    if (!rows || rows.length === 0) {
+      setLayout(null)
+      return
+    }
+    try {
+      const response = await axios.get('/api/layout/warehouse')
+      setLayout(response.data.layout)
+    } catch (error) {
+      setLayout(null)
+    }
+  }
+
   useEffect(() => {
     fetchStats()
-    const interval = setInterval(fetchStats, 2000)
-    return () => clearInterval(interval)
   }, [])
 
-  // Force refresh when demo data is updated
-  useEffect(() => {
-    const handleDemoDataUpdate = () => {
-      fetchStats()
+  // Apply pushed changes instead of polling: counters are replaced and only
+  // the rows that changed are patched into the local copy
+  useStreamEvent('warehouse', (update) => {
+    const { changedShelves, ...summary } = update
+    setStats(prev => {
+      const next = { ...prev, ...summary }
+      if (changedShelves && prev.shelfData) {
+        const changed = new Map(changedShelves.map(row => [row.shelf_id, row]))
+        next.shelfData = prev.shelfData.map(row => changed.get(row.shelf_id) || row)
+      }
+      return next
+    })
+    if (summary.occupiedColor) {
+      setOccupiedColor(summary.occupiedColor)
     }
-    window.addEventListener('demoDataUpdated', handleDemoDataUpdate)
-    return () => {
-      window.removeEventListener('demoDataUpdated', handleDemoDataUpdate)
+    if (summary.labelPrefix) {
+      setLabelPrefix(summary.labelPrefix)
     }
-  }, [])
+  })
+
+  // A new upload or a reset replaces the rows, so fetch them once
+  useStreamEvent('dataset', fetchStats)
+  useStreamEvent('reset', fetchStats)
 
   const handleOptimize = async () => {
     try {
@@ -125,7 +153,7 @@ const Warehouse = () => {
           <PerspectiveCamera makeDefault position={[20, 15, 20]} />
           <ambientLight intensity={0.5} />
           <directionalLight position={[10, 10, 5]} intensity={1} castShadow />
-          <Warehouse3D stats={stats} occupiedColor={occupiedColor} labelPrefix={labelPrefix} />
+          <Warehouse3D stats={stats} layout={layout} occupiedColor={occupiedColor} labelPrefix={labelPrefix} />
           <OrbitControls enablePan={true} enableZoom={true} enableRotate={true} />
         </Canvas>
       </div>